@@ -0,0 +1,68 @@
+import numpy as np
+
+# Batched background subtraction for stacks of spectra.
+# N spectra sharing one background are handled as an (N, channels) array:
+# the background is scaled by the live-time ratio of each spectrum and
+# subtracted, and the Poisson errors are propagated, in single broadcasted
+# operations.
+
+# Live-time scale factor of the background for each spectrum (1 if no live time is known).
+# Live times without the background live time, or one per spectrum missing, raise ValueError.
+def background_scale(n_spectra, live_times=None, background_live_time=None):
+    if live_times is None:
+        return np.ones(n_spectra)
+    if background_live_time is None:
+        raise ValueError("Live times of the spectra were given without the live time of the background.")
+    live_times = np.atleast_1d(np.asarray(live_times, dtype=float))
+    if live_times.size != n_spectra:
+        raise ValueError(f"{live_times.size} live times given for {n_spectra} spectra.")
+    return live_times / background_live_time
+
+# Subtract the background from every spectrum of the stack.
+# counts: (N, channels) raw counts; background: (channels,) raw counts.
+# Returns the net counts clipped at zero and their errors, both (N, channels).
+def subtract_background(counts, background, live_times=None, background_live_time=None):
+    counts = np.atleast_2d(np.asarray(counts, dtype=float))
+    background = np.asarray(background, dtype=float)
+    scale = background_scale(counts.shape[0], live_times, background_live_time)[:, None]
+    return subtract_estimate(counts, scale * background, scale**2 * background)
+
+# Subtract a background estimate with its variance, both (N, channels)
+def subtract_estimate(counts, estimate, variance):
+    counts = np.atleast_2d(np.asarray(counts, dtype=float))
+
+    # Calculate net counts (subtracting the background estimate)
+    net_counts = np.maximum(counts - estimate, 0)
+
+    # Combined Poisson error of the spectrum and the background
+    error = np.sqrt(counts + variance)
+    return net_counts, error
+
+# Stack the channel spectra of several files into an (N, channels) array.
+# All files must share the channel axis of the first one.
+def load_counts_stack(file_paths):
+    channel = None
+    counts = []
+    for file_path in file_paths:
+        data = np.loadtxt(file_path, skiprows=1)
+        if channel is None:
+            channel = data[:, 0]
+        elif data.shape[0] != channel.size:
+            raise ValueError(f"{file_path} has {data.shape[0]} channels, expected {channel.size}.")
+        counts.append(data[:, 1])
+    return channel, np.array(counts)
+
+# Yield (index, table) for each spectrum, the table holding its channel, net
+# counts and error columns, so spectra are written one at a time without
+# building the full (N, channels, 3) table
+def iter_net_spectra(channel, net_counts, error):
+    for index in range(net_counts.shape[0]):
+        yield index, np.column_stack((channel, net_counts[index], error[index]))
+
+# Full (N, channels, 3) table of channel, net counts and error for a single write
+def net_spectra_table(channel, net_counts, error):
+    table = np.empty(net_counts.shape + (3,))
+    table[..., 0] = channel
+    table[..., 1] = net_counts
+    table[..., 2] = error
+    return table
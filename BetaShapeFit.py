@@ -0,0 +1,207 @@
+import os
+import argparse
+import numpy as np
+from Rebinning import rebin, edges_from_centers
+from EnergyCalibration import load_calibration, load_energy_spectrum
+from ResultsStore import save_record, get_values
+from SpectrumStore import default_run, list_runs
+from CoulombCorrection import tabulated, fermi
+
+# Q value of a beta emitter from a forward-folded fit of the whole spectrum.
+# Theoretical allowed spectra N(T) ~ F(Z, T) p W (Q - T)^2 are built for every
+# Q of a dense grid, folded with the Gaussian energy resolution of the
+# detector (FFT convolution, all Q at once) and integrated over the measured
+# energy bins. The amplitude of each template is solved in closed form, so
+# chi2 of every (run, Q) pair is a few matrix products. Unlike the Kurie
+# window scan there is no target Q: the best Q is the minimum of chi2.
+
+# Electron rest energy (MeV)
+electron_mass = 0.511
+
+# Coulomb correction tables: F(Z, T) against T (MeV), and G(Z, W) against p (m_e c)
+fermi_file = './Fermi_204Tl.txt'
+G_file = './ValoresInterpolacion.txt'
+
+# Daughter nucleus of the decay, for the analytic Fermi function
+daughter_Z = 82
+mass_number = 204
+
+# Grid of Q values (MeV) and energy range of the fit (MeV)
+Q_grid = np.arange(0.60, 0.90 + 1e-9, 0.0005)
+fit_range = (0.20, 0.70)
+
+# Shape of the theoretical spectrum: 'fermi' (F(Z, T) p W (Q - T)^2 with F from
+# fermi_file), 'analytic' (the same with F computed for daughter_Z) or
+# 'G' (G(Z, W) W^2 (Q - T)^2, the form behind the Kurie plot of the repository)
+shape_model = 'fermi'
+
+# Resolution: 'sqrt' (sigma_E = k sqrt(E), photon statistics of a scintillator)
+# or 'constant' (sigma_E = k). k is taken from the width of the Cs-137 line,
+# or default_resolution when there is no peak fit.
+resolution_model = 'sqrt'
+default_resolution = 0.012  # sqrt(MeV) for 'sqrt', MeV for 'constant'
+
+# Points of the fine grid on which the templates are built and folded
+fine_points = 4096
+
+# Output text file
+output_results_file = './Results/QFold_Results.txt'
+
+# Allowed beta spectrum density for each Q: (len(Q), len(T)), zero above the endpoint.
+# Z, A: daughter nucleus of the 'analytic' shape (daughter_Z, mass_number by default)
+def beta_shape(T, Q, model=shape_model, Z=None, A=None):
+    T = np.asarray(T, dtype=float)
+    Q = np.atleast_1d(np.asarray(Q, dtype=float))
+    W = T / electron_mass + 1
+    p = np.sqrt(np.maximum(W**2 - 1, 0))
+    if model == 'fermi':
+        coulomb = tabulated(fermi_file, skiprows=2)(np.maximum(T, 0)) * p * W
+    elif model == 'analytic':
+        coulomb = fermi(daughter_Z if Z is None else Z, T, mass_number if A is None else A) * p * W
+    elif model == 'G':
+        coulomb = tabulated(G_file)(p) * W**2
+    else:
+        raise ValueError(f"Unknown spectrum shape: {model}")
+    endpoint = np.maximum(Q[:, None] - T[None, :], 0)
+    return coulomb[None, :] * endpoint**2
+
+# Variable in which the resolution is a constant width: u = sqrt(E) for 'sqrt', E for 'constant'
+def resolution_variable(energy, model=resolution_model):
+    if model == 'sqrt':
+        return np.sqrt(np.maximum(energy, 0))
+    if model == 'constant':
+        return np.asarray(energy, dtype=float)
+    raise ValueError(f"Unknown resolution model: {model}")
+
+def resolution_width(k, model=resolution_model):
+    # sigma_E = k sqrt(E) is a constant width k / 2 in u = sqrt(E)
+    return k / 2 if model == 'sqrt' else k
+
+# Fold a stack of spectra sampled on a uniform grid (step du) with a Gaussian of width sigma_u
+def fold_gaussian(spectra, du, sigma_u):
+    n = spectra.shape[-1]
+    half_width = int(np.ceil(6 * sigma_u / du))
+    n_fft = 1 << int(np.ceil(np.log2(n + half_width + 1)))
+    offsets = np.arange(-half_width, half_width + 1)
+    kernel = np.exp(-0.5 * (offsets * du / sigma_u)**2)
+    kernel /= kernel.sum()
+    # Kernel centred on index 0 (negative offsets wrap to the end of the FFT buffer)
+    wrapped = np.zeros(n_fft)
+    wrapped[offsets % n_fft] = kernel
+    folded = np.fft.irfft(np.fft.rfft(spectra, n_fft, axis=-1) * np.fft.rfft(wrapped), n_fft, axis=-1)
+    return folded[..., :n]
+
+# Folded templates of every Q integrated over the measured bins: (len(Q), len(bin_edges) - 1).
+# bin_edges: energy edges of the measured bins (MeV); k: resolution parameter.
+def folded_templates(Q, bin_edges, k, model=shape_model, resolution=resolution_model, points=fine_points, Z=None, A=None):
+    Q = np.atleast_1d(Q)
+    sigma_u = resolution_width(k, resolution)
+    u_max = resolution_variable(np.max(Q), resolution) + 8 * sigma_u
+    u_edges = np.linspace(0, u_max, points + 1)
+    u = 0.5 * (u_edges[1:] + u_edges[:-1])
+    du = u_edges[1] - u_edges[0]
+
+    # Counts of each fine bin: density in T times dT/du times du
+    T = u**2 if resolution == 'sqrt' else u
+    dT_du = 2 * u if resolution == 'sqrt' else np.ones_like(u)
+    fine_counts = beta_shape(T, Q, model, Z, A) * dT_du * du
+
+    folded = np.maximum(fold_gaussian(fine_counts, du, sigma_u), 0)
+    target_edges = np.clip(resolution_variable(bin_edges, resolution), 0, u_max)
+    templates, _ = rebin(folded, np.zeros_like(folded), u_edges, target_edges)
+    return templates
+
+# chi2 of every (spectrum, template) pair with the best amplitude of each template.
+# counts, errors: (N, bins); templates: (M, bins); mask: bins used. Returns chi2 and amplitude (N, M).
+def chi2_matrix(counts, errors, templates, mask):
+    counts = np.atleast_2d(counts)[:, mask]
+    errors = np.atleast_2d(errors)[:, mask]
+    templates = templates[:, mask]
+    with np.errstate(divide='ignore'):
+        weights = np.where(errors > 0, 1 / errors**2, 0)
+    # chi2(A) = S_yy - 2 A S_yt + A^2 S_tt, minimal at A = S_yt / S_tt
+    S_yy = np.sum(weights * counts**2, axis=1)
+    S_yt = (weights * counts) @ templates.T
+    S_tt = weights @ (templates**2).T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        amplitude = np.where(S_tt > 0, S_yt / S_tt, 0)
+    chi2 = S_yy[:, None] - amplitude * S_yt
+    return np.maximum(chi2, 0), amplitude
+
+# Best Q of each spectrum from a parabola through the chi2 minimum and its neighbours.
+# The error is where chi2 rises by chi2_min / dof (errors scaled as in curve_fit).
+def best_Q(Q, chi2, dof):
+    Q = np.asarray(Q)
+    n_spectra = chi2.shape[0]
+    rows = np.arange(n_spectra)
+    index = np.clip(np.argmin(chi2, axis=1), 1, Q.size - 2)
+    left, centre, right = chi2[rows, index - 1], chi2[rows, index], chi2[rows, index + 1]
+    step = Q[1] - Q[0]
+    curvature = (left - 2 * centre + right) / (2 * step**2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shift = np.where(curvature > 0, (left - right) / (4 * curvature * step), 0)
+        shift = np.clip(shift, -step, step)
+        chi2_min = centre - curvature * shift**2
+        scale = np.where(dof > 0, chi2_min / dof, np.nan)
+        error = np.sqrt(scale / curvature)
+    return Q[index] + shift, error, chi2_min
+
+# Resolution parameter from the Cs-137 line (width in channels, energy from the calibration)
+def measured_resolution(resolution=resolution_model):
+    calibration = load_calibration()
+    try:
+        peak = get_values("Cesio137", 'PeakFit')
+    except FileNotFoundError:
+        return default_resolution
+    if calibration is None:
+        return default_resolution
+    energy = calibration.energy(np.array([peak['xc']]))[0] / 1000
+    sigma = abs(calibration.energy(np.array([peak['xc'] + peak['s']]))[0] / 1000 - energy)
+    return sigma / np.sqrt(energy) if resolution == 'sqrt' else sigma
+
+# Fit Q for a stack of spectra sharing one energy axis.
+# energy_mev: (bins,) bin centres; counts, errors: (N, bins).
+def fit_Q(energy_mev, counts, errors, k, Q=Q_grid, window=fit_range, model=shape_model, resolution=resolution_model):
+    templates = folded_templates(Q, edges_from_centers(energy_mev), k, model, resolution)
+    mask = (energy_mev >= window[0]) & (energy_mev <= window[1])
+    chi2, amplitude = chi2_matrix(counts, errors, templates, mask)
+    dof = np.count_nonzero(np.atleast_2d(errors)[:, mask] > 0, axis=1) - 2
+    Q_value, Q_error, chi2_min = best_Q(Q, chi2, dof)
+    return {'Q': Q_value, 'Q_err': Q_error, 'chi2': chi2_min, 'dof': dof, 'chi2_grid': chi2}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Forward-folded fit of the beta spectrum for Q")
+    parser.add_argument('--name', default="Talio204")
+    parser.add_argument('--all-runs', action='store_true', help="Also fit every stored run of the isotope")
+    args = parser.parse_args()
+
+    runs = [default_run] + ([run for run in list_runs(args.name) if run != default_run] if args.all_runs else [])
+    spectra = []
+    for run in runs:
+        text_file = f'./Data/Data_{args.name}_WithErrors_energy.txt' if run == default_run else None
+        try:
+            spectra.append(load_energy_spectrum(args.name, run, text_file=text_file))
+        except FileNotFoundError as e:
+            print(f"Error loading the spectrum of {args.name} (run {run}): {e}")
+            exit()
+    energy_mev = spectra[0][:, 3] / 1000
+    counts = np.stack([data[:, 1] for data in spectra])
+    errors = np.stack([data[:, 2] for data in spectra])
+
+    k = measured_resolution()
+    results = fit_Q(energy_mev, counts, errors, k)
+
+    # Save the results of every run
+    with open(output_results_file, 'w') as f:
+        f.write(f"Forward-folded Q fit of {args.name} ({shape_model} shape, {resolution_model} resolution k = {k:.5f}, "
+                f"window {fit_range[0]}-{fit_range[1]} MeV)\n")
+        f.write("Run\tQ Value (MeV)\tQ Error (MeV)\tchi2/dof\n")
+        for i, run in enumerate(runs):
+            f.write(f"{run}\t{results['Q'][i]:.4f}\t{results['Q_err'][i]:.4f}\t{results['chi2'][i] / results['dof'][i]:.3f}\n")
+            save_record(args.name, 'QFold', {'Q': results['Q'][i], 'chi2': results['chi2'][i], 'resolution': k},
+                        errors={'Q': results['Q_err'][i]}, units={'Q': 'MeV'}, run=run,
+                        metadata={'dof': int(results['dof'][i]), 'shape': shape_model, 'resolution_model': resolution_model,
+                                  'fit_range': list(fit_range)})
+    print(f"Q of {args.name}: {results['Q'][0]:.4f} +- {results['Q_err'][0]:.4f} MeV "
+          f"(chi2/dof {results['chi2'][0] / results['dof'][0]:.2f}, {len(runs)} runs)")
+    print(f"Results saved to: {output_results_file}")
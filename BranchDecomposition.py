@@ -0,0 +1,156 @@
+import os
+import argparse
+import itertools
+import numpy as np
+from scipy.special import erf
+from scipy.optimize import nnls
+from IsotopeConfig import isotope_configs
+from Rebinning import edges_from_centers
+from EnergyCalibration import load_energy_spectrum
+from ResultsStore import save_record
+from SpectrumStore import default_run, list_runs
+from BetaShapeFit import folded_templates, measured_resolution
+
+# Decomposition of measured spectra into beta branches and conversion lines.
+# Each branch is the allowed shape F(Z, T) p W (Q - T)^2 of its endpoint and
+# each conversion line a Gaussian, all folded with the detector resolution
+# and normalized to one count. A spectrum is the non-negative combination of
+# these templates that minimizes chi2 (NNLS). With a handful of templates,
+# the exact NNLS solution is the best non-negative least-squares solution
+# over all subsets of templates, so every subset of every spectrum is solved
+# at once with batched normal equations. Above max_subset_components the
+# 2^K subsets no longer fit in memory and each spectrum is solved with
+# scipy.optimize.nnls instead.
+
+# Output directory
+output_dir = './Results'
+
+# Most templates solved by enumerating the subsets (2^K - 1 systems per spectrum)
+max_subset_components = 8
+
+# Templates (bins, components) of the branches and lines of an isotope, each summing to one
+def branch_templates(energy_kev, beta_branches, k):
+    bin_edges = edges_from_centers(energy_kev) / 1000
+    columns = []
+    if beta_branches['branches']:
+        Q = np.array(list(beta_branches['branches'].values())) / 1000
+        columns.append(folded_templates(Q, bin_edges, k, 'analytic', 'sqrt',
+                                        Z=beta_branches['daughter_Z'], A=beta_branches['mass_number']))
+    if beta_branches['lines']:
+        energy = np.array(list(beta_branches['lines'].values()))[:, None] / 1000
+        sigma = k * np.sqrt(energy)
+        columns.append(0.5 * (erf((bin_edges[None, 1:] - energy) / (np.sqrt(2) * sigma))
+                              - erf((bin_edges[None, :-1] - energy) / (np.sqrt(2) * sigma))))
+    templates = np.concatenate(columns).T
+    return templates / np.maximum(templates.sum(axis=0), 1e-300)
+
+# Non-negative weighted least squares for a stack of spectra sharing one design.
+# design: (bins, K); counts, weights: (N, bins). Returns coefficients (N, K),
+# their covariance (N, K, K) on the active components, and chi2 (N,).
+def nnls_batch(design, counts, weights):
+    counts = np.atleast_2d(counts)
+    weights = np.atleast_2d(weights)
+    n_components = design.shape[1]
+    if n_components > max_subset_components:
+        return nnls_loop(design, counts, weights)
+    gram = np.einsum('bi,nb,bj->nij', design, weights, design)
+    projection = (weights * counts) @ design
+    total = np.sum(weights * counts**2, axis=1)
+
+    # Every subset of components: the others are fixed to zero
+    subsets = np.array(list(itertools.product([0, 1], repeat=n_components)), dtype=float)[1:]
+    outer = subsets[:, :, None] * subsets[:, None, :]
+    identity = np.eye(n_components)
+    matrices = gram[:, None] * outer + (1 - subsets)[:, :, None] * identity
+    vectors = projection[:, None] * subsets
+    with np.errstate(all='ignore'):
+        coefficients = np.linalg.solve(matrices + 1e-12 * identity, vectors[..., None])[..., 0]
+    chi2 = (total[:, None] - 2 * np.sum(coefficients * projection[:, None], axis=-1)
+            + np.einsum('nsi,nij,nsj->ns', coefficients, gram, coefficients))
+
+    # The NNLS solution is the feasible subset solution with the lowest chi2
+    feasible = np.all(coefficients >= 0, axis=-1) & np.isfinite(chi2)
+    best = np.argmin(np.where(feasible, chi2, np.inf), axis=1)
+    rows = np.arange(counts.shape[0])
+    coefficients = coefficients[rows, best]
+    active = subsets[best]
+    with np.errstate(all='ignore'):
+        covariance = np.linalg.inv(matrices[rows, best]) * (active[:, :, None] * active[:, None, :])
+    return coefficients, covariance, chi2[rows, best]
+
+# Same as nnls_batch with scipy.optimize.nnls, one spectrum at a time (many components)
+def nnls_loop(design, counts, weights):
+    n_spectra, n_components = counts.shape[0], design.shape[1]
+    coefficients = np.zeros((n_spectra, n_components))
+    covariance = np.zeros((n_spectra, n_components, n_components))
+    chi2 = np.zeros(n_spectra)
+    for row in range(n_spectra):
+        root_weights = np.sqrt(weights[row])
+        coefficients[row], residual = nnls(design * root_weights[:, None], counts[row] * root_weights)
+        chi2[row] = residual**2
+
+        # Covariance on the components left free (positive)
+        active = np.flatnonzero(coefficients[row] > 0)
+        gram = design[:, active].T @ (design[:, active] * weights[row][:, None])
+        covariance[row][np.ix_(active, active)] = np.linalg.pinv(gram)
+    return coefficients, covariance, chi2
+
+# Decompose a stack of spectra of one isotope. energy_kev: (bins,); counts, errors: (N, bins).
+def decompose(energy_kev, counts, errors, beta_branches, k):
+    templates = branch_templates(energy_kev, beta_branches, k)
+    low, high = beta_branches['fit_range']
+    inside = (energy_kev >= low) & (energy_kev <= high)
+    errors = np.atleast_2d(errors)
+    with np.errstate(divide='ignore'):
+        weights = np.where((errors > 0) & inside, 1 / errors**2, 0)
+    coefficients, covariance, chi2 = nnls_batch(templates, np.atleast_2d(counts), weights)
+
+    # Errors scaled by chi2/dof, as in curve_fit
+    dof = np.count_nonzero(weights, axis=1) - templates.shape[1]
+    scale = np.where(dof > 0, chi2 / np.maximum(dof, 1), np.nan)
+    covariance = covariance * scale[:, None, None]
+    names = list(beta_branches['branches']) + list(beta_branches['lines'])
+    return {'names': names, 'intensity': coefficients, 'covariance': covariance,
+            'error': np.sqrt(np.abs(np.einsum('nii->ni', covariance))), 'chi2': chi2, 'dof': dof}
+
+# Write the branch intensities of one run and save them to the results store
+def save_branches(name, run, results, row, beta_branches):
+    prefix = name if run == default_run else f'{name}_{run}'
+    output_file = os.path.join(output_dir, f'{prefix}_BranchResults.txt')
+    energies = list(beta_branches['branches'].values()) + list(beta_branches['lines'].values())
+    total = np.sum(results['intensity'][row])
+    with open(output_file, 'w') as f:
+        f.write("Component\tEnergy (keV)\tIntensity\tError\tFraction\n")
+        for k, component in enumerate(results['names']):
+            f.write(f"{component}\t{energies[k]}\t{results['intensity'][row, k]:.1f}\t"
+                    f"{results['error'][row, k]:.1f}\t{results['intensity'][row, k] / total:.4f}\n")
+        f.write(f"chi2/dof\t{results['chi2'][row] / results['dof'][row]:.3f}\n")
+
+    save_record(name, 'Branches', dict(zip(results['names'], results['intensity'][row])),
+                errors=dict(zip(results['names'], results['error'][row])),
+                covariance=results['covariance'][row], units={component: 'counts' for component in results['names']},
+                run=run, metadata={'energies_keV': dict(zip(results['names'], energies)),
+                                   'chi2': float(results['chi2'][row]), 'dof': int(results['dof'][row])})
+    return output_file
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Decompose beta spectra into branches and conversion lines")
+    parser.add_argument('names', nargs='*', default=[name for name, config in isotope_configs.items() if config['beta_branches']])
+    parser.add_argument('--all-runs', action='store_true', help="Also decompose every stored run of each isotope")
+    args = parser.parse_args()
+
+    k = measured_resolution('sqrt')
+    for name in args.names:
+        beta_branches = isotope_configs[name]['beta_branches']
+        runs = [default_run] + ([run for run in list_runs(name) if run != default_run] if args.all_runs else [])
+        try:
+            data = np.stack([load_energy_spectrum(name, run, text_file=f'./Data/Data_{name}_WithErrors_energy.txt'
+                                                  if run == default_run else None) for run in runs])
+        except FileNotFoundError as e:
+            print(f"Error loading the spectra of {name}: {e}")
+            continue
+
+        results = decompose(data[0, :, 3], data[:, :, 1], data[:, :, 2], beta_branches, k)
+        for row, run in enumerate(runs):
+            save_branches(name, run, results, row, beta_branches)
+        print(f"Branches of {name} ({len(runs)} runs) saved, default run in {os.path.join(output_dir, name + '_BranchResults.txt')}")
@@ -1,33 +1,19 @@
 import numpy as np
 import datetime
-import os
+from ResultsStore import get_parameter, save_record
 
 # Definition of variables
 initial_activity = 0.25e-6  # Initial activity in Curie (Ci), 0.25 µCi = 0.25e-6 Ci
 t_1_2 = 30.08  # Half-life of Cs-137 in years
 
-# File paths
-area_file = "./Results/Cesio137_calculate_activity.txt" 
+# Isotope whose measured activity is compared with the source activity
+isotope_name = "Cesio137"
 
-# Check if the file exists
-if not os.path.exists(area_file):
-    print(f"File {area_file} does not exist.")
-    exit()
-
-# Read the file and extract activity and its error
+# Read the activity and its error from the results store
 try:
-    with open(area_file, 'r') as f:
-        lines = f.readlines()
-        # Loop through the lines to find the activity
-        for line in lines:
-            if "Activity" in line:
-                # Extract activity and error from the line
-                parts = line.split()
-                activity = float(parts[1])  # Activity value
-                activity_error = float(parts[3])  # Error value
-                break
-except Exception as e:
-    print(f"Error reading activity from file: {e}")
+    activity, activity_error = get_parameter(isotope_name, 'Activity', 'activity')
+except (FileNotFoundError, KeyError) as e:
+    print(f"Error reading activity: {e}")
     exit()
 
 # Decay constant lambda
@@ -63,3 +49,9 @@ efficiency = activity / measured_activity_bq
 efficiency_error = np.sqrt((1 / measured_activity_bq * activity_error)**2)
 
 print(f"Detector efficiency: {efficiency:.3f} +- {efficiency_error:.3f}")
+
+# Save the efficiency to the results store
+save_record(isotope_name, 'Efficiency',
+            {'expected_activity': measured_activity_bq, 'activity': activity, 'efficiency': efficiency},
+            errors={'activity': activity_error, 'efficiency': efficiency_error},
+            units={'expected_activity': 'Bq', 'activity': 'counts/s'})
@@ -1,71 +1,96 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.pylab as pylab
 import os
-from scipy.optimize import curve_fit
-
-# Configure parameters for plot appearance
-params = {
-    'xtick.labelsize': 17,    
-    'ytick.labelsize': 17,      
-    'axes.titlesize': 18,
-    'axes.labelsize': 18,
-    'legend.fontsize': 16
-}
-pylab.rcParams.update(params)
+from Plotting import compute_only, pyplot
+from Decimation import decimate, point_budget
+from SpectrumStore import default_run, has_spectrum, load_spectrum, list_runs
+from ResultsStore import save_record
+from RunCatalog import run_settings
+from PeakFitting import fit_peaks, gaussian_linear
+from PeakSearch import find_peaks, seed_fits
 
 use_log_scale = False  # True for log scale, False for linear scale
+use_peak_search = True  # True to seed the fit from the peak search, False for the fixed window
+fit_all_runs = False  # True to also fit every run of the spectrum store (results go to the run catalog)
 
-# Names of nucleus isotopes and their excitation energies
+# Names of nucleus isotopes and their excitation energies.
+# 'search' is the channel range where the peak search looks for the line;
+# 'min', 'max' and 'guess' are the fixed window and initial guess used otherwise.
 energy_beta = {
-    'Cesio137': {'Energy': 630, 'min': 175, 'max': 230},
+    'Cesio137': {'Energy': 630, 'min': 175, 'max': 230, 'search': (100, 400), 'guess': [-1., -3., 3e3, 210, 5]},
 }
 
+# Live time (s) of a run whose settings were not registered
+default_live_time = 10 * 60
+
+# Expected peak width (channels) for the peak search filter
+search_sigma = 4.0
+
 # Output directory for results and plots
 output_dir = './Results'
 os.makedirs(output_dir, exist_ok=True)
 
-# Define a Gaussian with background linear term for fitting
+# Gaussian with background linear term: a + b * x + c * exp(-(x - xc)^2 / (2 * s^2))
 def gaussian(x, a, b, c, xc, s): 
-    return a + b * x + c * np.exp(-(x - xc)**2 / (2 * s**2))
+    return gaussian_linear(x, [a, b, c, xc, s])
 
-# Process each nucleus
-for name, props in energy_beta.items():
-    min_channel = props['min']
-    max_channel = props['max']
+# Calculate are of gaussian
+def gaussian_area(c, c_error, s, s_error):
+    area = c * np.sqrt(2 * np.pi) * s
+    error = np.sqrt((np.sqrt(2 * np.pi) * s * c_error)**2 + (c * np.sqrt(2 * np.pi) * s_error)**2)
+    return area, error
 
-    # Load data for the nucleus
+def area_under_line(a, a_error, b, b_error, min_channel, max_channel):
+    integral = lambda x: (b / 2) * x**2 + a * x
+    value =  integral(max_channel) - integral(min_channel)
+    error = np.sqrt(((max_channel - min_channel) * a_error)**2 + (0.5 * (max_channel - min_channel)**2 * b_error)**2)
+    return value, error
+
+# Channel spectra to fit for an isotope: the default run, then every stored run if fit_all_runs
+def run_spectra(name):
     file_path = f'./Data/Data_{name}_WithErrors_channel.txt'
-    if not os.path.exists(file_path):
+    if has_spectrum(name, "channel", text_file=file_path):
+        yield default_run, load_spectrum(name, "channel", text_file=file_path)
+    else:
         print(f"File {file_path} does not exist. Skipping {name}.")
-        continue
+    if not fit_all_runs:
+        return
+    for run in list_runs(name):
+        if run != default_run and has_spectrum(name, "channel", run):
+            yield run, load_spectrum(name, "channel", run)
 
-    data_nucleus = np.loadtxt(file_path, skiprows=1)
+# Process each nucleus
+targets = ((name, props, run, data) for name, props in energy_beta.items() for run, data in run_spectra(name))
+for name, props, run, data_nucleus in targets:
     channel = data_nucleus[:, 0]
     counts = data_nucleus[:, 1]
     error = data_nucleus[:, 2]
 
+    # Fit window and initial guess: from the most significant peak in the search range, or fixed
+    min_channel, max_channel, initial_guess = props['min'], props['max'], props['guess']
+    if use_peak_search:
+        candidates = find_peaks(counts, sigma=search_sigma)
+        in_range = (candidates['centroid'] >= props['search'][0]) & (candidates['centroid'] <= props['search'][1])
+        if np.any(in_range):
+            best = candidates[in_range][np.argmax(candidates['significance'][in_range])]
+            rois, p0 = seed_fits(counts, best[None], channels=channel)
+            min_channel, max_channel, initial_guess = rois[0][1], rois[0][2], p0[0]
+            print(f"Peak found for {name} at channel {best['centroid']:.1f} (significance {best['significance']:.1f})")
+        else:
+            print(f"No peak found for {name} in channels {props['search']}. Using the fixed window.")
+
     # Select data within the region of interest (from min to max)
     region = (channel >= min_channel) & (channel <= max_channel)
     channels_in_region = channel[region]
-    counts_in_region = counts[region]
-    error_in_region = error[region]
 
     # Fit the model (Gaussian + Linear background) to the data
-    initial_guess = [-1., -3., 3e3, 210, 5]
-    try:
-        popt, pcov = curve_fit(
-            gaussian, 
-            channels_in_region, 
-            counts_in_region, 
-            p0=initial_guess, 
-            sigma=error_in_region
-        )
-        # Calculate parameter errors as the square root of the diagonal of the covariance matrix
-        perr = np.sqrt(np.diag(pcov))
-    except RuntimeError as e:
-        print(f"Curve fitting failed for {name}: {e}. Skipping this nucleus.")
+    fit = fit_peaks(channel, counts, error, [(0, min_channel, max_channel)], [initial_guess])
+    if not fit['converged'][0] or not np.all(np.isfinite(fit['errors'][0])):
+        print(f"Curve fitting failed for {name} (run {run}). Skipping this run.")
         continue
+    popt = fit['params'][0]
+
+    # Parameter errors are the square root of the diagonal of the covariance matrix
+    perr = fit['errors'][0]
 
     # Extract fitted parameters and their errors
     a, b, c, xc, s = popt
@@ -74,23 +99,69 @@ for name, props in energy_beta.items():
     # Generate the fitted curve
     fitted_curve = gaussian(channels_in_region, *popt)
 
-    # Save the fitted parameters and errors to a text file
-    param_file = f'./Results/{name}_fitted_parameters.txt'
-    with open(param_file, 'w') as f:
-        f.write(f"Fitted parameters for {name}:\n")
-        f.write("------------------------------------------------\n")
-        f.write(f"a (offset): {a:.4f} +- {a_err:.4f}\n")
-        f.write(f"b (background slope): {b:.4f} +- {b_err:.4f}\n")
-        f.write(f"c (peak height): {c:.4f} +- {c_err:.4f}\n")
-        f.write(f"xc (peak center): {xc:.4f} +- {xc_err:.4f} channel\n")
-        f.write(f"s (peak width): {s:.4f} +- {s_err:.4f} channel\n")
-        f.write("------------------------------------------------\n")
-        f.write(f"Gaussian peak energy: {props['Energy']} keV\n")
-    print(f"Fitted parameters and errors for {name} saved to {param_file}")
-
-    # Plot the spectrum with the fitted Gaussian and background
+    # Text reports and plot are written for the default run only
+    report = run == default_run
+    if report:
+        # Save the fitted parameters and errors to a text file
+        param_file = f'./Results/{name}_fitted_parameters.txt'
+        with open(param_file, 'w') as f:
+            f.write(f"Fitted parameters for {name}:\n")
+            f.write("------------------------------------------------\n")
+            f.write(f"a (offset): {a:.4f} +- {a_err:.4f}\n")
+            f.write(f"b (background slope): {b:.4f} +- {b_err:.4f}\n")
+            f.write(f"c (peak height): {c:.4f} +- {c_err:.4f}\n")
+            f.write(f"xc (peak center): {xc:.4f} +- {xc_err:.4f} channel\n")
+            f.write(f"s (peak width): {s:.4f} +- {s_err:.4f} channel\n")
+            f.write("------------------------------------------------\n")
+            f.write(f"Gaussian peak energy: {props['Energy']} keV\n")
+        print(f"Fitted parameters and errors for {name} saved to {param_file}")
+
+    # Save the fit with its full covariance to the results store
+    save_record(name, 'PeakFit',
+                {'a': a, 'b': b, 'c': c, 'xc': xc, 's': s, 'Energy': props['Energy'],
+                 'min_channel': min_channel, 'max_channel': max_channel},
+                errors=dict(zip(['a', 'b', 'c', 'xc', 's'], perr)),
+                covariance=fit['covariance'][0], covariance_parameters=['a', 'b', 'c', 'xc', 's'],
+                units={'b': '1/channel', 'xc': 'channel', 's': 'channel', 'Energy': 'keV',
+                       'min_channel': 'channel', 'max_channel': 'channel'},
+                run=run, metadata={'chi2': float(fit['chi2'][0]), 'dof': int(fit['dof'][0])})
+
+    # Calculate counts under gaussian
+    areaG, errorG = gaussian_area(c, c_err, s, s_err)
+    areaL, errorL = area_under_line(a, a_err, b, b_err, min_channel, max_channel)
+
+    area = areaG - areaL
+    error = np.sqrt(errorG**2 + errorL**2)
+
+    # Calculate activity
+    live_time = run_settings(name, run).get('live_time', default_live_time)
+    activity = area / live_time
+    error_activity = np.sqrt((1/live_time * error)**2)
+
+    # Save the calculate are parameters and errors to a text file
+    if report:
+        param_file_1 = f'./Results/{name}_calculate_activity.txt'
+        with open(param_file_1, 'w') as f:
+            f.write(f"Calculated area for {name}:\n")
+            f.write("------------------------------------------------\n")
+            f.write(f"Area: {area:.4f} +- {error:.4f}\n")
+            f.write(f"Time: {live_time} s \n")
+            f.write(f"Activity {activity:.4f} +- {error_activity:.4f}\n")
+            f.write("------------------------------------------------\n")
+            f.write(f"Gaussian peak energy: {props['Energy']} keV\n")
+        print(f"Calculate area and errors for {name} saved to {param_file_1}")
+
+    # Save the activity to the results store
+    save_record(name, 'Activity', {'area': area, 'time': live_time, 'activity': activity, 'Energy': props['Energy']},
+                errors={'area': error, 'activity': error_activity}, run=run,
+                units={'area': 'counts', 'time': 's', 'activity': 'counts/s', 'Energy': 'keV'})
+
+    # Plot the spectrum with the fitted Gaussian and background (skipped in compute-only mode)
+    if compute_only() or not report:
+        continue
+    plt = pyplot()
     plt.figure(figsize=(10, 6))
-    plt.plot(channel, counts, label=f"{name} Data", color="black")
+    plt.plot(*decimate(channel, counts, point_budget((10, 6)), (0, 512)), label=f"{name} Data", color="black")
     plt.plot(channels_in_region, fitted_curve, label=f"{name} Fit", color="red", linestyle='--', linewidth = 2)
     plt.xlabel("Canal")
     plt.xlim(0,512)
@@ -110,38 +181,3 @@ for name, props in energy_beta.items():
     plt.close()
     print(f"Plot saved for {name} as {plot_file_path}")
 
-# Calculate are of gaussian
-def gaussian_area(c, c_error, s, s_error):
-    area = c * np.sqrt(2 * np.pi) * s
-    error = np.sqrt((np.sqrt(2 * np.pi) * s * c_error)**2 + (c * np.sqrt(2 * np.pi) * s_error)**2)
-    return area, error
-
-def area_under_line(a, a_error, b, b_error, min_channel, max_channel):
-    integral = lambda x: (b / 2) * x**2 + a * x
-    value =  integral(max_channel) - integral(min_channel)
-    error = np.sqrt(((max_channel - min_channel) * a_error)**2 + (0.5 * (max_channel - min_channel)**2 * b_error)**2)
-    return value, error
-
-# Calculate counts under gaussian
-areaG, errorG = gaussian_area(c, c_err, s, s_err)
-areaL, errorL = area_under_line(a, a_err, b, b_err, min_channel, max_channel)
-
-area = areaG - areaL
-error = np.sqrt(errorG**2 + errorL**2)
-
-# Calculate activity
-time = 10 # min
-activity = area / (time * 60)
-error_activity = np.sqrt((1/(time * 60) * error)**2)
-
-# Save the calculate are parameters and errors to a text file
-param_file_1 = f'./Results/{name}_calculate_activity.txt'
-with open(param_file_1, 'w') as f:
-    f.write(f"Calculated area for {name}:\n")
-    f.write("------------------------------------------------\n")
-    f.write(f"Area: {area:.4f} +- {error:.4f}\n")
-    f.write(f"Time: {time * 60} s \n")
-    f.write(f"Activity {activity:.4f} +- {error_activity:.4f}\n")
-    f.write("------------------------------------------------\n")
-    f.write(f"Gaussian peak energy: {props['Energy']} keV\n")
-print(f"Calculate area and errors for {name} saved to {param_file_1}")
\ No newline at end of file
@@ -0,0 +1,100 @@
+import os
+import numpy as np
+from scipy.special import loggamma
+from scipy.interpolate import CubicSpline, PPoly
+
+# Coulomb correction of beta spectra for any nucleus.
+# The Fermi function F(Z, W) of a point nucleus with the radius of the
+# nuclear surface in the (2 p R)^(2 gamma - 2) factor is computed from its
+# analytic expression, tabulated once per (Z, A, decay) on a dense momentum
+# grid and kept as cubic spline coefficients, on disk and in memory. Later
+# evaluations (any number of energies) are a vectorized spline lookup.
+# G(Z, W) = F(Z, W) p / W is the correction of the Kurie plot; the table in
+# ValoresInterpolacion.txt (Z = 82) follows it up to a constant factor.
+
+# Physical constants
+fine_structure = 1 / 137.035999
+electron_mass = 0.51099895    # MeV
+electron_compton = 386.15926  # reduced Compton wavelength of the electron (fm)
+nuclear_radius = 1.2          # R = r0 A^(1/3) (fm)
+
+# Directory of the tabulated splines
+cache_dir = './Results/.coulomb_cache'
+
+# Momentum grid of the tables (units of m_e c): p_min to p_max, points spaced in sqrt(p)
+p_min = 1e-3
+p_max = 40.0
+grid_points = 4096
+
+# Splines loaded in this process, keyed by (Z, A, decay) or by file path
+_splines = {}
+
+# Total energy W (units of m_e c^2) and momentum p (units of m_e c) of a kinetic energy T (MeV)
+def kinematics(T):
+    W = np.asarray(T, dtype=float) / electron_mass + 1
+    return W, np.sqrt(np.maximum(W**2 - 1, 0))
+
+# Mass number used when none is given (close to the valley of stability)
+def default_mass_number(Z):
+    return int(round(2.5 * Z))
+
+# Analytic Fermi function. Z: charge of the daughter nucleus; W: total energy;
+# decay: 'beta-' (electrons) or 'beta+' (positrons).
+def fermi_function(Z, W, A=None, decay='beta-'):
+    W = np.asarray(W, dtype=float)
+    A = default_mass_number(Z) if A is None else A
+    p = np.sqrt(np.maximum(W**2 - 1, 0))
+    sign = 1 if decay == 'beta-' else -1
+    gamma = np.sqrt(1 - (fine_structure * Z)**2)
+    radius = nuclear_radius * A**(1 / 3) / electron_compton
+    with np.errstate(divide='ignore', invalid='ignore'):
+        eta = sign * fine_structure * Z * W / p
+        log_F = (np.log(2 * (1 + gamma)) + (2 * gamma - 2) * np.log(2 * p * radius) + np.pi * eta
+                 + 2 * loggamma(gamma + 1j * eta).real - 2 * loggamma(2 * gamma + 1).real)
+    return np.exp(log_F)
+
+# Path of the cached table of one nucleus
+def table_path(Z, A, decay):
+    return os.path.join(cache_dir, f'F_Z{Z}_A{A}_{decay}_{grid_points}_{p_min:g}_{p_max:g}.npz')
+
+# Spline of p F(Z, W) against p (finite at p = 0), from memory, disk or computed
+def fermi_table(Z, A=None, decay='beta-'):
+    A = default_mass_number(Z) if A is None else A
+    key = (Z, A, decay)
+    if key in _splines:
+        return _splines[key]
+
+    path = table_path(Z, A, decay)
+    if os.path.exists(path):
+        with np.load(path) as table:
+            spline = PPoly(table['c'], table['x'], extrapolate=True)
+    else:
+        p = np.linspace(np.sqrt(p_min), np.sqrt(p_max), grid_points)**2
+        W = np.sqrt(p**2 + 1)
+        spline = CubicSpline(p, p * fermi_function(Z, W, A, decay))
+        os.makedirs(cache_dir, exist_ok=True)
+        temporary = path + f'.{os.getpid()}.tmp.npz'
+        np.savez(temporary, c=spline.c, x=spline.x)
+        os.replace(temporary, path)
+    _splines[key] = spline
+    return spline
+
+# Fermi function at kinetic energies T (MeV), any array shape
+def fermi(Z, T, A=None, decay='beta-'):
+    W, p = kinematics(T)
+    p = np.clip(p, p_min, p_max)
+    return fermi_table(Z, A, decay)(p) / p
+
+# Kurie-plot correction G(Z, W) = F(Z, W) p / W at kinetic energies T (MeV)
+def G_function(Z, T, A=None, decay='beta-'):
+    W, p = kinematics(T)
+    return fermi_table(Z, A, decay)(np.clip(p, p_min, p_max)) / W
+
+# Cubic spline (not-a-knot, as interp1d(kind='cubic')) of a tabulated correction,
+# built once per process: column 1 of the file against column 0
+def tabulated(file_path, skiprows=1):
+    key = (os.path.abspath(file_path), os.path.getmtime(file_path))
+    if key not in _splines:
+        table = np.loadtxt(file_path, skiprows=skiprows)
+        _splines[key] = CubicSpline(table[:, 0], table[:, 1], extrapolate=True)
+    return _splines[key]
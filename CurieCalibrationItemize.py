@@ -1,6 +1,7 @@
 import os
 import numpy as np
-from scipy.optimize import curve_fit
+from SpectrumStore import load_spectrum
+from QScan import energy_grid, scan_energy_windows, save_best_windows
 
 # Input file path
 input_file = './TableValues.txt'
@@ -18,16 +19,12 @@ if not os.path.exists(input_file):
 
 # Load data from the file
 try:
-    data = np.loadtxt(input_file, skiprows=1)  # Skip header row
+    data = load_spectrum("Talio204", "table", text_file=input_file)  # From the store, else the text table
     channel, N_E, W, P, G_ZW, value, energy_mev = data.T  # Transpose to extract columns
 except Exception as e:
     print(f"Error loading data from {input_file}: {e}")
     exit()
 
-# Define linear function for fitting
-def linear_func(x, a, b):
-    return a * x + b
-
 # Configuration for each plot
 values = {
     'Kurie': {'y_data': value, 'min_range': (0.1, 0.3), 'max_range': (0.4, 0.8), 'min_step': 0.01, 'max_step': 0.01},
@@ -37,41 +34,30 @@ values = {
 # Best combinations for each fit type
 best_combinations = {'Kurie': None, 'N(E)': None}
 best_errors = {'Kurie': float('inf'), 'N(E)': float('inf')}
-best_slope_errors = {'Kurie': float('inf'), 'N(E)': float('inf')}
 
-# List to store the results
-q_values = []
+# Results of every window for each fit type
+q_values = {}
 
-# Perform fits for each energy range
+# Perform fits for every energy range at once
 for key, config in values.items():
-    # Iterate over the min and max values with the specified step sizes
-    for min_val in np.arange(config['min_range'][0], config['min_range'][1] + config['min_step'], config['min_step']):
-        for max_val in np.arange(config['max_range'][0], config['max_range'][1] + config['max_step'], config['max_step']):
-
-            # Filter data within the current energy range
-            mask = (energy_mev >= min_val) & (energy_mev <= max_val)
-            x_fit = energy_mev[mask]
-            y_fit = config['y_data'][mask]
-
-            # Perform linear fit
-            popt, pcov = curve_fit(linear_func, x_fit, y_fit)
-            slope, intercept = popt
-            slope_err, intercept_err = np.sqrt(np.diag(pcov))
+    min_values = energy_grid(config['min_range'], config['min_step'])
+    max_values = energy_grid(config['max_range'], config['max_step'])
 
-            # Calculate intersection with the x-axis (Q value)
-            Q_value = -intercept / slope
+    # Linear fit of every (min_val, max_val) window from the prefix sums
+    results = scan_energy_windows(energy_mev, config['y_data'], min_values, max_values)
+    q_values[key] = results
 
-            # Calculate the error: the absolute difference from the target Q value (0.8 MeV)
-            Q_error = abs(Q_value - target_Q)
+    # Calculate the error: the absolute difference from the target Q value
+    Q_error = np.abs(results['Q'] - target_Q).ravel()
+    Q_error[np.isnan(Q_error)] = np.inf
+    slope_err = results['slope_err'].ravel()
 
-            # Compare the errors and find the best combination
-            if Q_error < best_errors[key] or (Q_error == best_errors[key] and slope_err < best_slope_errors[key]):
-                best_errors[key] = Q_error
-                best_slope_errors[key] = slope_err
-                best_combinations[key] = (min_val, max_val, Q_value, slope_err)
-
-            # Append to the results for later saving
-            q_values.append((min_val, max_val, key, Q_value))
+    # Best combination: smallest Q error, then smallest slope error (first one wins ties)
+    best = np.lexsort((slope_err, Q_error))[0]
+    if np.isfinite(Q_error[best]):
+        best_errors[key] = Q_error[best]
+        best_combinations[key] = (results['min'].ravel()[best], results['max'].ravel()[best],
+                                  results['Q'].ravel()[best], slope_err[best])
 
 # Print the best combinations for Kurie and N(E)
 for fit_type in ['Kurie', 'N(E)']:
@@ -91,4 +77,7 @@ with open(output_results_file, 'w') as f:
     f.write("Min Energy (MeV)\tMax Energy (MeV)\tFit Type\n")
     for fit_type in ['Kurie', 'N(E)']:
         min_val, max_val, Q_value, slope_err = best_combinations[fit_type]
-        f.write(f"{min_val:.2f}\t{max_val:.2f}\t{fit_type}\t{Q_value:.4f}\n")
\ No newline at end of file
+        f.write(f"{min_val:.2f}\t{max_val:.2f}\t{fit_type}\t{Q_value:.4f}\n")
+
+# Save the best windows to the results store
+save_best_windows("Talio204", {fit_type: best for fit_type, best in best_combinations.items() if best})
@@ -1,22 +1,12 @@
 import os
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.pylab as pylab
-from scipy.optimize import curve_fit
-
-# Update plot appearance
-params = {
-    'xtick.labelsize': 17,
-    'ytick.labelsize': 17,
-    'axes.titlesize': 18,
-    'axes.labelsize': 18,
-    'legend.fontsize': 16
-}
-pylab.rcParams.update(params)
+from Plotting import compute_only, pyplot
+from QScan import build_prefix_sums, window_fit, load_best_windows
+from ResultsStore import save_record
+from SpectrumStore import default_run, list_runs, has_spectrum, load_spectrum
 
 # Input file path
 input_file = './TableValues.txt'
-input_configuration = './Results/QBest_values.txt'
 
 # Output plot path
 output_plot = './Results/LinearFits_QValue.pdf'
@@ -29,21 +19,21 @@ if not os.path.exists(input_file):
 
 # Load data from the file
 try:
-    data = np.loadtxt(input_file, skiprows=1)  # Skip header row
+    data = load_spectrum("Talio204", "table", text_file=input_file)  # From the store, else the text table
     channel, N_E, W, P, G_ZW, value, energy_mev = data.T  # Transpose to extract columns
 except Exception as e:
     print(f"Error loading data from {input_file}: {e}")
     exit()
 
-# Read the best combinations from the file
+# Read the best combinations from the results store: {fit_type: (min, max, Q)}
 try:
-    best_combinations_data = np.loadtxt(input_configuration, dtype=str, delimiter='\t', skiprows=1)
-    best_combinations = []
-    for row in best_combinations_data:
-        min_val, max_val, fit_type, q_value = row
-        best_combinations.append((float(min_val), float(max_val), fit_type, float(q_value)))
-except Exception as e:
-    print(f"Error reading best combinations from {input_configuration}: {e}")
+    best_combinations = load_best_windows("Talio204")
+except FileNotFoundError as e:
+    print(f"Error reading best combinations: {e}")
+    exit()
+missing = [fit_type for fit_type in ('Kurie', 'N(E)') if fit_type not in best_combinations]
+if missing:
+    print(f"No best combination for {missing[0]} in the results store.")
     exit()
 
 # Define linear function for fitting
@@ -54,46 +44,72 @@ def linear_func(x, a, b):
 def calculate_error(slope, slope_error, inter, inter_error):
     return np.sqrt((- 1 / slope * inter_error)**2 + (inter / slope**2 * slope_error)**2)
 
-# Configuration for each plot using best combinations from the file
+# Straight-line fit of the Kurie and sqrt(N(E)) data of one table inside each window
+# {fit_type: (min, max)}. Returns the fits and the Q values {fit_type: (Q, Q_error)}.
+def fit_q_values(table, windows):
+    channel, N_E, W, P, G_ZW, value, energy_mev = np.asarray(table).T
+    y_data = {'Kurie': value, 'N(E)': np.sqrt(N_E)}
+    line_fits, intersections = {}, {}
+    for key, (min_val, max_val) in windows.items():
+        mask = (energy_mev >= min_val) & (energy_mev <= max_val)
+        fit = window_fit(build_prefix_sums(energy_mev[mask], y_data[key][mask]), 0, np.count_nonzero(mask))
+        line_fits[key] = fit
+        intersections[key] = (-fit['intercept'] / fit['slope'],
+                              calculate_error(fit['slope'], fit['slope_err'], fit['intercept'], fit['intercept_err']))
+    return line_fits, intersections
+
+# Save the Q values and the line fits of one run, with the slope-intercept covariance of each, to the results store
+def save_q_values(line_fits, intersections, run=default_run):
+    q_results, q_errors, names = {}, {}, []
+    covariance = np.zeros((2 * len(line_fits), 2 * len(line_fits)))
+    for k, (key, fit) in enumerate(line_fits.items()):
+        q_results[f'{key}.Q'], q_errors[f'{key}.Q'] = intersections[key]
+        for parameter in ('slope', 'intercept'):
+            q_results[f'{key}.{parameter}'] = fit[parameter]
+            q_errors[f'{key}.{parameter}'] = fit[f'{parameter}_err']
+        names += [f'{key}.slope', f'{key}.intercept']
+        covariance[2 * k:2 * k + 2, 2 * k:2 * k + 2] = [[fit['slope_err']**2, fit['covariance']],
+                                                        [fit['covariance'], fit['intercept_err']**2]]
+    return save_record("Talio204", 'QValue', q_results, errors=q_errors, covariance=covariance,
+                       covariance_parameters=names, units={f'{key}.Q': 'MeV' for key in line_fits}, run=run)
+
+# Configuration for each plot using the best combinations
 values = {
-    'Kurie': {'y_data': value, 'min': best_combinations[0][0], 'max': best_combinations[0][1], 'label': "Kurie Data", 'color': 'blue', 'marker': 'o'},
-    'N(E)': {'y_data': np.sqrt(N_E), 'min': best_combinations[1][0], 'max': best_combinations[1][1], 'label': r"$\sqrt{N(E)}$ Data", 'color': 'green', 'marker': 'v'}
+    'Kurie': {'y_data': value, 'min': best_combinations['Kurie'][0], 'max': best_combinations['Kurie'][1], 'label': "Kurie Data", 'color': 'blue', 'marker': 'o'},
+    'N(E)': {'y_data': np.sqrt(N_E), 'min': best_combinations['N(E)'][0], 'max': best_combinations['N(E)'][1], 'label': r"$\sqrt{N(E)}$ Data", 'color': 'green', 'marker': 'v'}
 }
 
-# Prepare the plot
-fig, ax1 = plt.subplots(figsize=(11.5, 6.85))
+# Prepare the plot (skipped in compute-only mode)
+make_plot = not compute_only()
+if make_plot:
+    plt = pyplot()
+    fig, ax1 = plt.subplots(figsize=(11.5, 6.85))
 
-# Create the second y-axis
-ax2 = ax1.twinx()
+    # Create the second y-axis
+    ax2 = ax1.twinx()
 
 # Lists to store legend entries for both axes
 handles, labels = [], []
 
 # Perform fits and plot results
-intersections = {}
+windows = {key: (config['min'], config['max']) for key, config in values.items()}
+line_fits, intersections = fit_q_values(data, windows)
 
 for key, config in values.items():
-    # Filter data within the range
+    if not make_plot:
+        break
+
+    # Data within the range and its fitted line
     mask = (energy_mev >= config['min']) & (energy_mev <= config['max'])
     x_fit = energy_mev[mask]
     y_fit = config['y_data'][mask]
+    slope, intercept = line_fits[key]['slope'], line_fits[key]['intercept']
 
-    # Perform linear fit
-    popt, pcov = curve_fit(linear_func, x_fit, y_fit)
-    slope, intercept = popt
-    slope_err, intercept_err = np.sqrt(np.diag(pcov))
-
-    # Calculate intersection with the x-axis (Q value)
-    Q_value = -intercept / slope
-    Q_error = calculate_error(slope, slope_err, intercept, intercept_err)
-
-    intersections[key] = (Q_value, Q_error)
-
-    # Generate fitted line
-    x_range = np.linspace(x_fit.min(), x_fit.max(), 500)
+    # Generate fitted line (a straight line needs only its end points)
+    x_range = np.array([x_fit.min(), x_fit.max()])
     y_range = linear_func(x_range, slope, intercept)
-    
-    x_range_0 = np.linspace(0.9, x_fit.max(), 1000)
+
+    x_range_0 = np.array([0.9, x_fit.max()])
     y_range_0 = linear_func(x_range_0, slope, intercept)
 
     # Plot the data and fit
@@ -106,27 +122,29 @@ for key, config in values.items():
         ax2.plot(x_range_0, y_range_0, color=config['color'], linestyle = '--')
         ax2.scatter(x_fit, y_fit, color=config['color'], marker=config['marker'], s=10, label = config['label'])  
 
-# Combine the handles and labels for the single legend
-handles, labels = ax1.get_legend_handles_labels()
-handles2, labels2 = ax2.get_legend_handles_labels()
+if make_plot:
+    # Combine the handles and labels for the single legend
+    handles, labels = ax1.get_legend_handles_labels()
+    handles2, labels2 = ax2.get_legend_handles_labels()
 
-# Combine both sets of handles and labels
-handles.extend(handles2)
-labels.extend(labels2)
+    # Combine both sets of handles and labels
+    handles.extend(handles2)
+    labels.extend(labels2)
 
-# Add labels, legends, and grid
-ax1.set_xlabel("Energia (MeV)")
-ax2.set_ylabel(r"$\frac{1}{W}\sqrt{\frac{N(E)}{G(Z,W)}}$", color='blue')
-ax1.set_ylabel(r"$\sqrt{N(E)}$", color='green')
+    # Add labels, legends, and grid
+    ax1.set_xlabel("Energia (MeV)")
+    ax2.set_ylabel(r"$\frac{1}{W}\sqrt{\frac{N(E)}{G(Z,W)}}$", color='blue')
+    ax1.set_ylabel(r"$\sqrt{N(E)}$", color='green')
 
-# Add a single legend for both axes
-ax1.legend(handles, labels)
+    # Add a single legend for both axes
+    ax1.legend(handles, labels)
 
-# Add horizontal line at y=0 to show where the fits intersect with the x-axis
-ax1.hlines(0, 0.2, 0.9, linestyles="-", color="red")
+    # Add horizontal line at y=0 to show where the fits intersect with the x-axis
+    ax1.hlines(0, 0.2, 0.9, linestyles="-", color="red")
 
-plt.savefig(output_plot)
-plt.close()
+    plt.savefig(output_plot)
+    plt.close()
+    print(f"Plot saved: {output_plot}")
 
 # Save the results in a text file
 with open(output_results_file, 'w') as f:
@@ -134,6 +152,16 @@ with open(output_results_file, 'w') as f:
     for key, (q_value, q_error) in intersections.items():
         f.write(f"{key}\t{q_value:.4f}\t{q_error:.4f}\n")
 
+# Save the Q values and the line fits to the results store
+save_q_values(line_fits, intersections)
+
+# Q values of every other stored run with a table, fitted in the same windows, so that
+# the run catalog can follow Q across runs (RunCatalog.py query Talio204 QValue Kurie.Q)
+other_runs = [run for run in list_runs("Talio204") if run != default_run and has_spectrum("Talio204", "table", run)]
+for run in other_runs:
+    save_q_values(*fit_q_values(load_spectrum("Talio204", "table", run), windows), run=run)
+if other_runs:
+    print(f"Q values of {len(other_runs)} more runs saved to the results store")
+
 # Print confirmation
-print(f"Plot saved: {output_plot}")
 print(f"Results saved to: {output_results_file}")
\ No newline at end of file
@@ -1,68 +1,53 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.pylab as pylab
-from mpl_toolkits.axes_grid1.inset_locator import inset_axes
-import scipy.interpolate as sc
 import os
+from Plotting import exit_if_compute_only, pyplot, show
+from SpectrumStore import load_spectrum
+from ResultsStore import get_parameter
+from CoulombCorrection import tabulated
 
-# Plot appearance settings
-params = {
-    'xtick.labelsize': 17,    
-    'ytick.labelsize': 17,      
-    'axes.titlesize': 18,
-    'axes.labelsize': 18,
-    'legend.fontsize': 16
-}
-pylab.rcParams.update(params) 
+# This script only makes a plot: nothing to do in compute-only mode
+exit_if_compute_only("CurieQPlot")
 
 # Paths
-input_file = './Tablevalues.txt'
-q_values_file = "./Results/Q_ValuesErrors.txt"
+momentum_file = './TableValues_Np.txt'
 output_file = "./Results/QCuriePlot.png"
 input_fermi = "./Fermi_204Tl.txt"
 
 # Read Q values
 try:
-    data_q = np.loadtxt(q_values_file, dtype=str, delimiter='\t', skiprows=1)
-    Q = float(data_q[0, 1])  
-    Q_error = float(data_q[0, 2])
-except Exception as e:
-    print(f"Error reading Q values file: {e}")
+    Q, Q_error = get_parameter("Talio204", 'QValue', 'Kurie.Q')
+except (FileNotFoundError, KeyError) as e:
+    print(f"Error reading Q values: {e}")
     exit()
 
 # Check if input file exists
-if not os.path.exists(input_file):
-    print(f"File {input_file} does not exist.")
+if not os.path.exists(momentum_file):
+    print(f"File {momentum_file} does not exist.")
     exit()
 
-# Load main data
+# Load main data (with the N(p) columns of InterpolacionLineal.py)
 try:
-    data = np.loadtxt(input_file, skiprows=1)
-    channel, N_E, W, P, G_ZW, value, energy_mev = data.T  
+    data = load_spectrum("Talio204", "momentum", text_file=momentum_file)
+    channel, N_E, W, P, G_ZW, value, energy_mev, momentum, N_p = data.T[:9]
 except Exception as e:
-    print(f"Error loading data from {input_file}: {e}")
+    print(f"Error loading data from {momentum_file}: {e}")
     exit()   
 
-# Load Fermi function data
+# Fermi function: cubic interpolation of the table (built once per process)
 try:
-    data_fermi = np.loadtxt(input_fermi, skiprows=2)
-    T = data_fermi[:, 0]
-    F_Z_P = data_fermi[:, 1] 
+    fermi_interpolation = tabulated(input_fermi, skiprows=2)
 except Exception as e:
     print(f"Error loading Fermi data from {input_fermi}: {e}")
     exit()
 
-# Interpolation for Fermi function
-fermi_interpolation = sc.interp1d(T, F_Z_P, kind='cubic', bounds_error=False, fill_value="extrapolate")
-
-# Calculate N(p) = N(E) * (p * c^2) 
-N_p = N_E * P / energy_mev # MeV to keV
 F_Z_T = fermi_interpolation(energy_mev)
 left = np.sqrt(N_p / (P**2 * F_Z_T))
 
 right = (Q - energy_mev)
 
 # Plotting
+plt = pyplot()
+from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 fig, ax1 = plt.subplots(figsize=(10, 6))
 
 # Left axis (for right-hand side, proportionality factor)
@@ -104,5 +89,5 @@ ax1.axvspan(zoom_range[0], zoom_range[1], color="lightgray", alpha=0.2, label="Z
 # Adjust layout and save
 fig.tight_layout()
 plt.savefig(output_file)
-plt.show()
+show()
 
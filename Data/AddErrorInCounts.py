@@ -1,51 +1,106 @@
 import numpy as np
 import os
+import sys
+import glob
+import argparse
+
+# Make the modules in the repository root importable
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SpectrumStore import save_spectrum, save_stack
+from RunCatalog import register_run
+from BackgroundSubtraction import subtract_estimate, load_counts_stack, iter_net_spectra, net_spectra_table
+from SmoothBackground import estimate_background, snip_iterations
 
 # Names of nucleus isotopes
 nucleus_names = {"Cesio137", "Europio152", "Bario133", "Talio204"}
 
-# Load background data
-data_background = np.loadtxt('./Data/Datos_Fondo_(canales).txt', skiprows=1)
-channel_number = data_background[:, 0]
-counts_background = data_background[:, 1]
+# Batch mode: every spectrum file in a directory is a run of one isotope
+parser = argparse.ArgumentParser(description="Subtract the background and add Poisson errors")
+parser.add_argument('--batch-dir', default=None, help="Directory with the channel spectra of many runs")
+parser.add_argument('--batch-name', default=None, help="Isotope name of the batch runs")
+parser.add_argument('--live-times', default=None, help="Text file with the live time (s) of each batch run, in file order")
+parser.add_argument('--background-live-time', type=float, default=None, help="Live time (s) of the background run")
+parser.add_argument('--lazy', action='store_true', help="Write each batch run separately instead of one stack")
+parser.add_argument('--background', choices=['measured', 'snip', 'combined'], default='measured',
+                    help="Measured background, SNIP estimate of each spectrum, or the measured background plus the SNIP of the rest")
+parser.add_argument('--snip-iterations', type=int, default=snip_iterations, help="Largest SNIP clipping window (channels)")
+args = parser.parse_args()
+
+# Load background data (not needed when the background is estimated from each spectrum)
+background_file = './Data/Datos_Fondo_(canales).txt'
+counts_background = None
+if os.path.exists(background_file) or args.background != 'snip':
+    data_background = np.loadtxt(background_file, skiprows=1)
+    channel_number = data_background[:, 0]
+    counts_background = data_background[:, 1]
+
+    # Calculate errors as the square root of counts (Poisson error)
+    errors_background = np.sqrt(counts_background)
 
-# Calculate errors as the square root of counts (Poisson error)
-errors_background = np.sqrt(counts_background)
+    # Add errors as the third column to the background data
+    data_with_errors = np.column_stack((data_background, errors_background))
 
-# Add errors as the third column to the background data
-data_with_errors = np.column_stack((data_background, errors_background))
+    # Save the updated background data with errors to a new file
+    output_file = './Data/Data_Background_WithErrors_channel.txt'
+    np.savetxt(output_file, data_with_errors, header="Channel Number\tCounts\tError", fmt=['%.0f', '%.0f', '%.4f'], delimiter='\t')
+    save_spectrum("Background", "channel", data_with_errors, decimals=[0, 0, 4])
 
-# Save the updated background data with errors to a new file
-output_file = './Data/Data_Background_WithErrors_channel.txt'
-np.savetxt(output_file, data_with_errors, header="Channel Number\tCounts\tError", fmt=['%.0f', '%.0f', '%.4f'], delimiter='\t')
+if args.batch_dir is None:
+    # Stack every available nucleus spectrum
+    names = []
+    for name in sorted(nucleus_names):
+        file_path = f'./Data/Datos_{name}_(canales).txt'
+        if not os.path.exists(file_path):
+            print(f"File {file_path} does not exist. Skipping {name}.")
+            continue
+        names.append(name)
 
-# Process each nucleus
-for name in nucleus_names:
-    file_path = f'./Data/Datos_{name}_(canales).txt'
-    
-    if not os.path.exists(file_path):
-        print(f"File {file_path} does not exist. Skipping {name}.")
-        continue
+    if names:
+        channel, nucleus_counts = load_counts_stack([f'./Data/Datos_{name}_(canales).txt' for name in names])
 
-    # Load data for the nucleus
-    data_nucleus = np.loadtxt(file_path, skiprows=1)
-    channel = data_nucleus[:, 0]
-    nucleus_counts = data_nucleus[:, 1]
+        # Net counts and combined errors for the whole stack at once
+        estimate, variance = estimate_background(nucleus_counts, args.background, counts_background,
+                                                 iterations=args.snip_iterations)
+        net_counts, error = subtract_estimate(nucleus_counts, estimate, variance)
 
-    # Calculate net counts (subtracting background counts)
-    net_counts = np.maximum(nucleus_counts - counts_background, 0)
+        for index, data_error in iter_net_spectra(channel, net_counts, error):
+            name = names[index]
 
-    # Calculate errors
-    error_counts = np.sqrt(nucleus_counts)  # Error in nucleus counts (Poisson error)
-    error = np.sqrt(error_counts**2 + errors_background**2)  # Combined error for net counts
+            # Save the updated nucleus data with errors to a new file
+            output_file = f'./Data/Data_{name}_WithErrors_channel.txt'
+            np.savetxt(output_file, data_error, header="Channel Number\tNet Counts\tError", fmt=['%.0f', '%.0f', '%.4f'], delimiter='\t')
+            save_spectrum(name, "channel", data_error, decimals=[0, 0, 4])
 
-    # Add errors as the third column to the nucleus data
-    data_error = np.column_stack((channel, net_counts, error))
+            print(f"File for {name} with errors saved as {output_file}")
+else:
+    file_paths = sorted(glob.glob(os.path.join(args.batch_dir, '*.txt')))
+    if not file_paths or args.batch_name is None:
+        print(f"No spectra found in {args.batch_dir} or no --batch-name given.")
+        exit()
+    runs = [os.path.splitext(os.path.basename(file_path))[0] for file_path in file_paths]
 
-    # Save the updated nucleus data with errors to a new file
-    output_file = f'./Data/Data_{name}_WithErrors_channel.txt'
-    np.savetxt(output_file, data_error, header="Channel Number\tNet Counts\tError", fmt=['%.0f', '%.0f', '%.4f'], delimiter='\t')
+    channel, nucleus_counts = load_counts_stack(file_paths)
+    live_times = np.atleast_1d(np.loadtxt(args.live_times)) if args.live_times else None
 
-    print(f"File for {name} with errors saved as {output_file}")
+    # Net counts and combined errors for the whole stack at once
+    try:
+        estimate, variance = estimate_background(nucleus_counts, args.background, counts_background, live_times,
+                                                 args.background_live_time, args.snip_iterations)
+    except ValueError as e:
+        print(f"Error scaling the background: {e}")
+        exit()
+    net_counts, error = subtract_estimate(nucleus_counts, estimate, variance)
 
+    if args.lazy:
+        for index, data_error in iter_net_spectra(channel, net_counts, error):
+            save_spectrum(args.batch_name, "channel", data_error, run=runs[index], decimals=[0, 0, 4])
+    else:
+        save_stack(args.batch_name, "channel", runs, net_spectra_table(channel, net_counts, error), decimals=[0, 0, 4])
+    print(f"{len(runs)} runs of {args.batch_name} with errors saved to the spectrum store")
 
+    # Describe every run for the run catalog: start time from its file, live time if known
+    for index, file_path in enumerate(file_paths):
+        settings = {'source_file': os.path.basename(file_path), 'background': args.background}
+        if live_times is not None:
+            settings['live_time'] = float(live_times[index])
+        register_run(args.batch_name, runs[index], timestamp=os.path.getmtime(file_path), settings=settings)
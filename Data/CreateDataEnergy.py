@@ -1,33 +1,25 @@
 import numpy as np
 import os
+import sys
+
+# Make the modules in the repository root importable
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SpectrumStore import load_spectrum, save_spectrum
+from EnergyCalibration import EnergyCalibration, load_calibration
+from ResultsStore import get_parameter, detector
 
 # Names of nucleus isotopes
 nucleus_names = {"Cesio137", "Europio152", "Bario133", "Talio204"}
 
-# Path to the slope parameters file
-slope_file = './Results/Slope_fitted_parameters.txt'
-
-# Function to read the slope from the text file
-def read_slope(file_path):
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
-    
-    slope = None
-    for line in lines:
-        if "Slope (keV/channel):" in line:
-            slope = float(line.split(':')[1].strip())
-            break
-    
-    if slope is None:
-        raise ValueError("Failed to extract slope from the file.")
-    
-    return slope
-
-try:
-    slope = read_slope(slope_file)
-except ValueError as e:
-    print(f"Error reading slope: {e}")
-    exit()
+# Use the fitted calibration, or a line through the origin with the slope from the results store
+calibration = load_calibration()
+if calibration is None:
+    try:
+        slope, _ = get_parameter(detector, 'Calibration', 'slope')
+    except (FileNotFoundError, KeyError) as e:
+        print(f"Error reading slope: {e}")
+        exit()
+    calibration = EnergyCalibration([0, slope])
 
 # Process each nucleus
 for name in nucleus_names:
@@ -39,13 +31,13 @@ for name in nucleus_names:
         continue
 
     # Load data for the nucleus
-    data_nucleus = np.loadtxt(file_path, skiprows=1)
+    data_nucleus = load_spectrum(name, "channel", text_file=file_path)
     channel = data_nucleus[:, 0]
     nucleus_counts = data_nucleus[:, 1]
     error = data_nucleus[:, 2]
 
     # Transform channels to energy
-    energy = slope * channel
+    energy = calibration.energy(channel)
 
     # Combine original data with the energy column
     data_with_energy = np.column_stack((data_nucleus, energy))
@@ -53,4 +45,5 @@ for name in nucleus_names:
     # Save the new data to a file
     header = "Channel\tCounts\tError\tEnergy (keV)"
     np.savetxt(output_file, data_with_energy, header=header, fmt=['%.0f', '%.0f', '%.4f', '%.3f'], delimiter='\t')
+    save_spectrum(name, "energy", data_with_energy, decimals=[0, 0, 4, 3])
     print(f"File with energy column saved: {output_file}")
@@ -0,0 +1,108 @@
+import numpy as np
+from collections import OrderedDict
+
+# Display-side decimation of large spectra.
+# A plotted series never needs more points than the figure has pixels. The
+# series is reduced to a point budget before it is plotted. 'minmax' keeps
+# the lowest and highest point of each pixel bucket, so every peak and dip
+# survives. 'lttb' (largest triangle three buckets) keeps one point per
+# bucket that best preserves the shape. Results are cached per spectrum,
+# zoom range and budget. A spectrum is identified by its array objects, or by a
+# key supplied by the caller, so a cache hit costs nothing proportional to its size.
+
+# Number of decimated series kept in memory
+cache_size = 128
+
+# Decimated series: key -> (source x, source y, decimated x, decimated y)
+_cache = OrderedDict()
+
+# Point budget of a figure: two points per horizontal pixel
+def point_budget(figsize, dpi=100):
+    return int(2 * figsize[0] * dpi)
+
+# Indices of the points inside the zoom range, plus one neighbour on each side
+# so the line still enters and leaves the plot (x increasing)
+def zoom_slice(x, xlim=None):
+    if xlim is None:
+        return slice(0, x.size)
+    start = max(np.searchsorted(x, xlim[0], side='left') - 1, 0)
+    stop = min(np.searchsorted(x, xlim[1], side='right') + 1, x.size)
+    return slice(start, stop)
+
+# Indices of the minimum and maximum of y in n_buckets equal buckets, in order
+def minmax_indices(y, n_buckets):
+    n = y.size
+    size = -(-n // n_buckets)  # points per bucket
+    padded = np.empty(-(-n // size) * size)
+    padded[:n] = y
+    padded[n:] = y[-1]
+    buckets = padded.reshape(-1, size)
+    offsets = np.arange(buckets.shape[0]) * size
+    # Missing values (NaN) are never selected
+    missing = np.isnan(buckets)
+    lowest = np.argmin(np.where(missing, np.inf, buckets), axis=1) + offsets
+    highest = np.argmax(np.where(missing, -np.inf, buckets), axis=1) + offsets
+    indices = np.unique(np.concatenate(([0, n - 1], lowest, highest)))
+    return indices[indices < n]
+
+# Indices chosen by largest triangle three buckets (n_out points, ends included)
+def lttb_indices(x, y, n_out):
+    n = x.size
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    indices = np.empty(n_out, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+    previous = 0
+    for k in range(n_out - 2):
+        start, stop = edges[k], max(edges[k + 1], edges[k] + 1)
+        # Average of the next bucket (the last point for the last bucket)
+        next_start, next_stop = stop, (edges[k + 2] if k + 2 < edges.size else n)
+        next_x = x[next_start:max(next_stop, next_start + 1)].mean()
+        next_y = y[next_start:max(next_stop, next_start + 1)].mean()
+        # Twice the area of the triangle (previous point, candidate, next average)
+        area = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                      - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        previous = start + int(np.nanargmax(area)) if np.any(np.isfinite(area)) else start
+        indices[k + 1] = previous
+    return indices
+
+# Cache key of a series: the caller's content key, else the identity and shape of
+# its arrays, then the zoom range, the budget and the method
+def decimation_key(x, y, xlim, max_points, method, content_key=None):
+    series = (content_key,) if content_key is not None else (id(x), id(y), x.shape)
+    return series + (None if xlim is None else tuple(xlim), max_points, method)
+
+# Reduce (x, y) to at most max_points points within the zoom range xlim.
+# Series already within the budget are returned unchanged. Arrays changed in
+# place between calls need a content_key (e.g. a hash the caller already has).
+def decimate(x, y, max_points, xlim=None, method='minmax', content_key=None):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if x.size <= max_points or method is None:
+        return x, y
+
+    key = decimation_key(x, y, xlim, max_points, method, content_key)
+    if key in _cache:
+        source_x, source_y, x_decimated, y_decimated = _cache[key]
+        # The cache holds the source arrays, so their ids cannot be reused by other arrays
+        if content_key is not None or (source_x is x and source_y is y):
+            _cache.move_to_end(key)
+            return x_decimated, y_decimated
+
+    window = zoom_slice(x, xlim)
+    x_window, y_window = x[window], y[window]
+    if x_window.size <= max_points:
+        indices = np.arange(x_window.size)
+    elif method == 'minmax':
+        # Two points per bucket, with the two end points reserved out of the budget
+        indices = minmax_indices(y_window, max((max_points - 2) // 2, 1))
+    elif method == 'lttb':
+        indices = lttb_indices(x_window, y_window, max(max_points, 3))
+    else:
+        raise ValueError(f"Unknown decimation method: {method}")
+
+    result = (x_window[indices], y_window[indices])
+    _cache[key] = (None, None) + result if content_key is not None else (x, y) + result
+    _cache.move_to_end(key)
+    if len(_cache) > cache_size:
+        _cache.popitem(last=False)
+    return result
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+from Rebinning import edges_from_centers
+from EnergyCalibration import load_energy_spectrum
+from SpectrumStore import default_run, list_runs, save_spectrum, save_stack
+from BetaShapeFit import measured_resolution
+
+# Response of the plastic scintillator to electrons, and unfolding of measured spectra.
+# A vectorized Monte Carlo follows n_events electrons for every incident
+# energy of a grid: a fraction backscatters out of the plastic after leaving
+# part of its energy, the rest deposit all of it, and the deposit is smeared
+# with the resolution sigma_E = k sqrt(E). The histogram of the measured
+# energies gives the response matrix R[measured bin, incident bin], cached on
+# disk by a hash of the detector parameters and the binning. Measured
+# spectra are unfolded with Richardson-Lucy / MLEM iterations, written as
+# matrix products over the whole stack of runs.
+
+# Detector parameters of the Monte Carlo
+detector_params = {
+    'resolution': None,             # k of sigma_E = k sqrt(E) (sqrt(MeV)); None: from the Cs-137 line
+    'backscatter_fraction': 0.08,   # probability that an electron backscatters out of the plastic
+    'backscatter_shape': (1.2, 2.5),  # Beta(a, b) distribution of the energy fraction left by a backscattered electron
+}
+
+# Events per incident energy, seed, and incident energies simulated at once
+n_events = 20000
+seed = 20241015
+energies_per_chunk = 32
+
+# Iterations of the unfolding
+unfold_iterations = 50
+
+# Directory of the cached response matrices
+cache_dir = './Results/.response_cache'
+
+# Response matrices loaded in this process, keyed by their hash
+_responses = {}
+
+# Key of a response matrix: detector parameters, binning and simulation settings
+def response_key(params, true_edges, measured_edges, events=n_events):
+    digest = hashlib.sha256()
+    digest.update(json.dumps({'params': params, 'events': events, 'seed': seed}, sort_keys=True).encode())
+    for edges in (true_edges, measured_edges):
+        digest.update(np.ascontiguousarray(edges, dtype=float).tobytes())
+    return digest.hexdigest()
+
+# Monte Carlo response R (measured bins, true bins); each column is the probability
+# that an electron of that true bin centre is measured in each bin
+def simulate_response(params, true_edges, measured_edges, events=n_events):
+    rng = np.random.default_rng(seed)
+    true_energy = 0.5 * (true_edges[1:] + true_edges[:-1])
+    n_true, n_measured = true_energy.size, measured_edges.size - 1
+    response = np.zeros((n_true, n_measured))
+    a, b = params['backscatter_shape']
+
+    for first in range(0, n_true, energies_per_chunk):
+        energy = np.maximum(true_energy[first:first + energies_per_chunk], 0)[:, None]
+        shape = (energy.shape[0], events)
+        # Backscattered electrons leave only a fraction of their energy
+        deposited = np.where(rng.random(shape) < params['backscatter_fraction'],
+                             energy * rng.beta(a, b, shape), energy)
+        measured = deposited + params['resolution'] * np.sqrt(deposited) * rng.standard_normal(shape)
+
+        index = np.searchsorted(measured_edges, measured, side='right') - 1
+        inside = (index >= 0) & (index < n_measured)
+        rows = np.broadcast_to(np.arange(shape[0])[:, None], shape)
+        counts = np.bincount(rows[inside] * n_measured + index[inside], minlength=shape[0] * n_measured)
+        response[first:first + shape[0]] = counts.reshape(shape[0], n_measured) / events
+    return response.T
+
+# Response matrix for the given binning, from memory, disk or the Monte Carlo
+def response_matrix(params, true_edges, measured_edges, events=n_events):
+    true_edges = np.asarray(true_edges, dtype=float)
+    measured_edges = np.asarray(measured_edges, dtype=float)
+    key = response_key(params, true_edges, measured_edges, events)
+    if key in _responses:
+        return _responses[key]
+
+    path = os.path.join(cache_dir, f'{key}.npy')
+    if os.path.exists(path):
+        response = np.load(path)
+    else:
+        response = simulate_response(params, true_edges, measured_edges, events)
+        os.makedirs(cache_dir, exist_ok=True)
+        temporary = path + f'.{os.getpid()}.tmp.npy'
+        np.save(temporary, response)
+        os.replace(temporary, path)
+    _responses[key] = response
+    return response
+
+# Richardson-Lucy / MLEM unfolding of a stack of spectra.
+# counts: (N, measured bins); response: (measured bins, true bins).
+# Returns the unfolded spectra (N, true bins), corrected for the detection efficiency.
+def unfold(counts, response, iterations=unfold_iterations, initial=None):
+    counts = np.maximum(np.atleast_2d(np.asarray(counts, dtype=float)), 0)
+    efficiency = response.sum(axis=0)
+    detected = efficiency > 0
+    if initial is None:
+        # Flat start with the measured number of counts
+        estimate = np.where(detected, 1.0, 0.0) * (counts.sum(axis=1, keepdims=True) / max(np.count_nonzero(detected), 1))
+    else:
+        estimate = np.array(np.atleast_2d(initial), dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for _ in range(iterations):
+            predicted = estimate @ response.T
+            ratio = np.where(predicted > 0, counts / predicted, 0)
+            estimate = np.where(detected, estimate * (ratio @ response) / efficiency, 0)
+    return estimate
+
+# Error of unfolded counts: Poisson estimate of the counts detected from each bin
+def unfolded_errors(unfolded, response):
+    efficiency = response.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(efficiency > 0, np.sqrt(np.maximum(unfolded, 0) / efficiency), 0)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Unfold measured beta spectra with the detector response")
+    parser.add_argument('--name', default="Talio204")
+    parser.add_argument('--all-runs', action='store_true', help="Also unfold every stored run of the isotope")
+    parser.add_argument('--iterations', type=int, default=unfold_iterations)
+    args = parser.parse_args()
+
+    runs = [default_run] + ([run for run in list_runs(args.name) if run != default_run] if args.all_runs else [])
+    try:
+        data = np.stack([load_energy_spectrum(args.name, run, text_file=f'./Data/Data_{args.name}_WithErrors_energy.txt'
+                                              if run == default_run else None) for run in runs])
+    except FileNotFoundError as e:
+        print(f"Error loading the spectra of {args.name}: {e}")
+        exit()
+
+    params = dict(detector_params)
+    if params['resolution'] is None:
+        params['resolution'] = measured_resolution('sqrt')
+    edges = edges_from_centers(data[0, :, 3] / 1000)
+
+    start_time = time.perf_counter()
+    response = response_matrix(params, edges, edges)
+    unfolded = unfold(data[:, :, 1], response, args.iterations)
+    errors = unfolded_errors(unfolded, response)
+    print(f"{len(runs)} spectra of {args.name} unfolded in {time.perf_counter() - start_time:.2f} s "
+          f"({args.iterations} iterations, resolution k = {params['resolution']:.4f})")
+
+    # Unfolded spectra with the columns of the energy spectra
+    tables = np.stack((data[:, :, 0], unfolded, errors, data[:, :, 3]), axis=-1)
+    output_file = f'./Data/Data_{args.name}_Unfolded_energy.txt'
+    header = "Channel\tCounts\tError\tEnergy (keV)"
+    np.savetxt(output_file, tables[0], header=header, fmt=['%.0f', '%.2f', '%.4f', '%.3f'], delimiter='\t')
+    save_spectrum(args.name, "unfolded", tables[0], decimals=[0, 2, 4, 3])
+    if args.all_runs:
+        save_stack(args.name, "unfolded", runs, tables, decimals=[0, 2, 4, 3])
+    print(f"Unfolded spectrum saved: {output_file}")
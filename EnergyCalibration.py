@@ -0,0 +1,162 @@
+import os
+import json
+import numpy as np
+from SpectrumStore import default_run, load_spectrum, has_spectrum
+
+# Channel <-> energy calibration fitted from any number of peaks.
+# The energy is a polynomial in the channel, E = c0 + c1 * ch (+ c2 * ch^2),
+# fitted by weighted least squares with full covariance. The channel -> energy
+# lookup table is built once per calibration, energy -> channel is the exact
+# inverse of the polynomial, and spectra get their energy axis from the calibration on load instead of
+# from a rewritten *_energy.txt file.
+
+# File with the current calibration
+calibration_file = './Results/EnergyCalibration.json'
+
+# Polynomial degree of each model
+model_degrees = {'linear': 1, 'quadratic': 2}
+
+class EnergyCalibration:
+    def __init__(self, coefficients, covariance=None, model='linear', points=None):
+        self.model = model
+        self.coefficients = np.asarray(coefficients, dtype=float)  # c0, c1, c2...
+        n = self.coefficients.size
+        self.covariance = np.zeros((n, n)) if covariance is None else np.asarray(covariance, dtype=float)
+        self.points = points or {}
+        self._energy_table = None
+
+    # Fit the calibration from peak centroids (channels) and their known energies (keV).
+    # With through_origin the offset is fixed to zero, as in the original two-point calibration.
+    @classmethod
+    def fit(cls, channels, energies, channel_errors=None, energy_errors=None, model='linear', through_origin=False):
+        channels = np.asarray(channels, dtype=float)
+        energies = np.asarray(energies, dtype=float)
+        degree = model_degrees[model]
+        powers = np.arange(1 if through_origin else 0, degree + 1)
+        design = channels[:, None] ** powers[None, :]
+
+        channel_errors = np.zeros_like(channels) if channel_errors is None else np.asarray(channel_errors, dtype=float)
+        energy_errors = np.zeros_like(energies) if energy_errors is None else np.asarray(energy_errors, dtype=float)
+        absolute_errors = np.any(channel_errors > 0) or np.any(energy_errors > 0)
+
+        # Effective variance: channel errors are converted to energy with the fitted slope
+        weights = np.ones_like(channels)
+        for iteration in range(3 if absolute_errors else 1):
+            coefficients, alpha = weighted_polyfit(design, energies, weights)
+            if not absolute_errors:
+                break
+            slope = sum(p * c * channels**(p - 1) for p, c in zip(powers, coefficients) if p > 0)
+            variance = energy_errors**2 + (slope * channel_errors)**2
+            weights = np.where(variance > 0, 1 / np.where(variance > 0, variance, 1), 0)
+
+        # Covariance: absolute when errors are given, else scaled by the residual variance
+        covariance = np.linalg.pinv(alpha)
+        if not absolute_errors:
+            dof = channels.size - powers.size
+            residuals = energies - design @ coefficients
+            covariance = covariance * (np.sum(residuals**2) / dof if dof > 0 else 0)
+
+        # Expand to the full coefficient vector c0..c_degree
+        full_coefficients = np.zeros(degree + 1)
+        full_coefficients[powers] = coefficients
+        full_covariance = np.zeros((degree + 1, degree + 1))
+        full_covariance[np.ix_(powers, powers)] = covariance
+
+        points = {'channels': channels.tolist(), 'energies': energies.tolist(),
+                  'channel_errors': channel_errors.tolist(), 'energy_errors': energy_errors.tolist()}
+        return cls(full_coefficients, full_covariance, model, points)
+
+    # Energy (keV) of arbitrary, possibly fractional, channels
+    def evaluate(self, channels):
+        return np.polynomial.polynomial.polyval(np.asarray(channels, dtype=float), self.coefficients)
+
+    # Channel -> energy lookup table for integer channels, extended on demand
+    def energy_table(self, n_channels):
+        if self._energy_table is None or self._energy_table.size < n_channels:
+            size = max(n_channels, 2 * (0 if self._energy_table is None else self._energy_table.size))
+            self._energy_table = self.evaluate(np.arange(size))
+            self._energy_table.flags.writeable = False
+        return self._energy_table
+
+    # Energy of channels: integer channels come from the cached table
+    def energy(self, channels):
+        channels = np.asarray(channels)
+        integer = np.all(np.mod(channels, 1) == 0) and np.all(channels >= 0) if channels.size else False
+        if integer:
+            return self.energy_table(int(channels.max()) + 1)[channels.astype(int)]
+        return self.evaluate(channels)
+
+    # Energy uncertainty of channels from the coefficient covariance
+    def energy_error(self, channels):
+        channels = np.asarray(channels, dtype=float)
+        jacobian = channels[..., None] ** np.arange(self.coefficients.size)
+        return np.sqrt(np.einsum('...i,ij,...j->...', jacobian, self.covariance, jacobian))
+
+    # Energy -> channel, the exact inverse on the rising branch of the calibration.
+    # Energies the calibration never reaches raise ValueError instead of being clamped.
+    def channel(self, energies):
+        energies = np.asarray(energies, dtype=float)
+        c0, c1 = self.coefficients[:2]
+        c2 = self.coefficients[2] if self.coefficients.size > 2 else 0.0
+        if c2 == 0:
+            return (energies - c0) / c1
+        # Root where c1 + 2 c2 ch = sqrt(D) >= 0, written without the cancellation of -c1 + sqrt(D)
+        discriminant = c1**2 + 4 * c2 * (energies - c0)
+        if np.any(discriminant < 0):
+            raise ValueError(f"The {self.model} calibration does not reach energies {'above' if c2 < 0 else 'below'} "
+                             f"{c0 - c1**2 / (4 * c2):.3f} keV.")
+        if c1 <= 0:
+            return (np.sqrt(discriminant) - c1) / (2 * c2)
+        return 2 * (energies - c0) / (c1 + np.sqrt(discriminant))
+
+    # Energy per channel at the given channels (first derivative of the calibration)
+    def slope(self, channels=0):
+        derivative = np.polynomial.polynomial.polyder(self.coefficients)
+        return np.polynomial.polynomial.polyval(np.asarray(channels, dtype=float), derivative)
+
+    def to_dict(self):
+        return {'model': self.model, 'coefficients': self.coefficients.tolist(),
+                'covariance': self.covariance.tolist(), 'points': self.points}
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(values['coefficients'], values['covariance'], values['model'], values.get('points'))
+
+    def save(self, file_path=calibration_file):
+        with open(file_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+# Calibrations loaded in this process, keyed by file path and modification time
+_loaded_calibrations = {}
+
+# Load a calibration once per process (reloaded if the file changes)
+def load_calibration(file_path=calibration_file):
+    if not os.path.exists(file_path):
+        return None
+    key = (os.path.abspath(file_path), os.path.getmtime(file_path))
+    if key not in _loaded_calibrations:
+        with open(file_path, 'r') as f:
+            _loaded_calibrations[key] = EnergyCalibration.from_dict(json.load(f))
+    return _loaded_calibrations[key]
+
+# Spectrum with an energy column: channel, counts, error, energy (keV).
+# The energy comes from the calibration applied to the channel spectrum; if
+# there is no calibration file the exported *_energy.txt is read instead.
+def load_energy_spectrum(name, run=default_run, text_file=None, file_path=calibration_file):
+    calibration = load_calibration(file_path)
+    # The exported channel table holds the default run only
+    channel_file = f'./Data/Data_{name}_WithErrors_channel.txt' if run == default_run else None
+    if calibration is None or not has_spectrum(name, "channel", run, channel_file):
+        return load_spectrum(name, "energy", run, text_file)
+
+    data_channel = load_spectrum(name, "channel", run, channel_file)
+    data = np.empty((data_channel.shape[0], 4))
+    data[:, :3] = data_channel
+    data[:, 3] = calibration.energy(data_channel[:, 0])
+    return data
+
+# Weighted least squares: coefficients and curvature matrix A^T W A
+def weighted_polyfit(design, values, weights):
+    alpha = design.T @ (design * weights[:, None])
+    beta = design.T @ (weights * values)
+    return np.linalg.pinv(alpha) @ beta, alpha
@@ -0,0 +1,204 @@
+import time
+import argparse
+import numpy as np
+from Rebinning import rebin, channel_edges
+from SmoothBackground import snip_background
+from PeakSearch import find_peaks
+from ResultsStore import save_record
+from SpectrumStore import default_run, list_runs, has_spectrum, load_runs, save_spectrum
+
+# Gain-drift tracking and alignment of many runs before summing them.
+# The drift of each run is a linear map of the reference channels,
+# c_run = gain * c_ref + offset. A gain change is a shift in log(channel),
+# so a pure gain is the lag of the FFT cross-correlation of the spectra
+# resampled on a logarithmic grid, and a pure offset the lag of the ordinary
+# cross-correlation. With both, each line of the reference is located in
+# every run by its own cross-correlation and the linear map is fitted to
+# the line positions. Only the lines are
+# correlated: the SNIP continuum is removed and the spectra are tapered
+# to zero outside the alignment window. Every run of the stack is measured in one
+# batched FFT and moved onto the reference channels by flux-conserving
+# rebinning, so the sum keeps the counts and the errors of every run.
+
+# Channel window of the lines used for the alignment (around the Cs-137 conversion line)
+align_window = (100, 400)
+
+# Drift model: 'gain' (c_run = gain * c_ref), 'shift' (c_run = c_ref + offset) or
+# 'both' (fitted to the positions of two or more lines spread over the window)
+drift_model = 'gain'
+
+# Largest drift searched: relative gain change, and the offset as a fraction of the window end
+max_drift = 0.10
+
+# Points of the logarithmic grid per channel at the window end
+log_oversampling = 2
+
+# Lines of the 'both' model: expected peak width for the peak search (channels), most lines
+# used, and half width of the template of each line in peak widths
+search_sigma = 4.0
+max_lines = 6
+line_window_widths = 3.0
+
+# Passes of the alignment: the first reference is the plain sum of the runs, the next ones the aligned sum
+reference_iterations = 2
+
+# Run under which the aligned sum is saved
+aligned_run = 'aligned'
+
+# Lines of every spectrum inside the window: counts above the SNIP continuum, tapered
+# to zero at the window ends so the fixed edges do not pin the correlation at zero lag
+def alignment_features(counts, window=align_window):
+    counts = np.atleast_2d(np.asarray(counts, dtype=float))
+    channel = np.arange(counts.shape[1])
+    inside = (channel >= window[0]) & (channel <= window[1])
+    taper = np.where(inside, np.sin(np.pi * (channel - window[0]) / (window[1] - window[0]))**2, 0)
+    return taper * (counts - snip_background(counts))
+
+# Sub-bin lag of the maximum of the cross-correlation of every signal with the reference.
+# signals: (N, M); reference: (M,). s(x) = r(x - lag) gives +lag. Returns lags and peak correlations.
+def correlation_lags(signals, reference, max_lag):
+    n = signals.shape[-1]
+    n_fft = 1 << int(np.ceil(np.log2(2 * n)))
+    spectrum = np.fft.rfft(signals, n_fft, axis=-1) * np.conj(np.fft.rfft(reference, n_fft))
+    correlation = np.fft.irfft(spectrum, n_fft, axis=-1)
+    norm = np.sqrt(np.sum(signals**2, axis=-1) * np.sum(reference**2))
+
+    max_lag = int(min(max(max_lag, 1), n - 1))
+    lags = np.arange(-max_lag, max_lag + 1)
+    values = correlation[:, lags % n_fft]
+    rows = np.arange(values.shape[0])
+    index = np.clip(np.argmax(values, axis=1), 1, lags.size - 2)
+
+    # Parabola through the maximum and its neighbours
+    left, centre, right = values[rows, index - 1], values[rows, index], values[rows, index + 1]
+    curvature = left - 2 * centre + right
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shift = np.where(curvature < 0, 0.5 * (left - right) / curvature, 0)
+        peak = np.where(norm > 0, centre / norm, 0)
+    return lags[index] + np.clip(shift, -1, 1), peak
+
+# Gain and offset of every run relative to the reference spectrum, both (N,).
+# counts: (N, channels); reference: (channels,).
+def measure_drift(counts, reference, window=align_window, model=drift_model, max_relative=max_drift):
+    counts = np.atleast_2d(np.asarray(counts, dtype=float))
+    reference = np.asarray(reference, dtype=float)
+    features = alignment_features(counts, window)
+    reference_features = alignment_features(reference, window)
+    edges = channel_edges(counts.shape[1])
+    gain = np.ones(counts.shape[0])
+    offset = np.zeros(counts.shape[0])
+    peak = np.zeros(counts.shape[0])
+
+    if model == 'both':
+        lines = reference_lines(reference, window)
+        if lines.size < 2:
+            raise ValueError(f"The 'both' drift model needs two or more lines in channels {window}, found {lines.size}.")
+        # Lines untapered: the window taper would pull every line towards the window centre
+        return line_drift(counts - snip_background(counts), reference - snip_background(reference),
+                          lines, max_relative * window[1])
+
+    if model == 'gain':
+        # Densities on a logarithmic channel grid: a gain is a shift of log(gain) / step bins
+        points = int(np.ceil(np.log(window[1] / window[0]) * window[1] * log_oversampling))
+        log_edges = np.geomspace(window[0], window[1], points + 1)
+        step = np.log(log_edges[1] / log_edges[0])
+        widths = np.diff(log_edges)
+        signals, _ = rebin(features, np.zeros_like(features), edges, log_edges)
+        target, _ = rebin(reference_features, np.zeros_like(reference_features), edges, log_edges)
+        lags, peak = correlation_lags(signals / widths, target[0] / widths, np.log1p(max_relative) / step)
+        gain = np.exp(lags * step)
+    elif model != 'shift':
+        raise ValueError(f"Unknown drift model: {model}")
+
+    if model == 'shift':
+        lags, peak = correlation_lags(features, reference_features[0], max_relative * window[1])
+        offset = lags
+    return gain, offset, peak
+
+# Most significant lines of the reference inside the window (at most max_lines), by channel
+def reference_lines(reference, window=align_window):
+    candidates = find_peaks(reference, sigma=search_sigma)
+    inside = candidates[(candidates['centroid'] >= window[0]) & (candidates['centroid'] <= window[1])]
+    strongest = inside[np.argsort(inside['significance'])[::-1][:max_lines]]
+    return np.sort(strongest, order='centroid')
+
+# Gain and offset of every run fitted together to the positions of the reference lines.
+# Each line alone is cut from the reference lines and located in the runs by cross-correlation;
+# c_run = gain * c_ref + offset is then a weighted straight-line fit for every run at once.
+def line_drift(features, reference_features, lines, max_lag):
+    channel = np.arange(features.shape[1])
+    positions = np.empty((features.shape[0], lines.size))
+    peaks = np.empty((features.shape[0], lines.size))
+    for index, line in enumerate(lines):
+        half_width = line_window_widths * line['width']
+        distance = channel - line['centroid']
+        template = np.where(np.abs(distance) <= half_width, np.cos(0.5 * np.pi * distance / half_width)**2, 0)
+        lags, peaks[:, index] = correlation_lags(features, template * reference_features, max_lag)
+        positions[:, index] = line['centroid'] + lags
+
+    # Weighted least squares of the line positions against the reference centroids
+    weights = lines['significance']
+    x = lines['centroid']
+    S, S_x, S_xx = np.sum(weights), np.sum(weights * x), np.sum(weights * x**2)
+    S_y, S_xy = positions @ weights, positions @ (weights * x)
+    determinant = S * S_xx - S_x**2
+    gain = (S * S_xy - S_x * S_y) / determinant
+    offset = (S_xx * S_y - S_x * S_xy) / determinant
+    return gain, offset, peaks.mean(axis=1)
+
+# Move every run onto the reference channels (flux-conserving). Returns counts and variances (N, channels).
+def align_stack(counts, variances, gain, offset):
+    edges = channel_edges(np.shape(counts)[-1])
+    source_edges = (edges[None, :] - np.asarray(offset)[:, None]) / np.asarray(gain)[:, None]
+    return rebin(counts, variances, source_edges, edges)
+
+# Track the drift of a stack of runs and align it, refining the reference with the aligned sum.
+# Returns the drift of each run, the aligned counts and variances (N, channels).
+def track_drift(counts, errors, window=align_window, model=drift_model, iterations=reference_iterations):
+    counts = np.atleast_2d(np.asarray(counts, dtype=float))
+    variances = np.atleast_2d(np.asarray(errors, dtype=float))**2
+    aligned = counts
+    for _ in range(max(iterations, 1)):
+        gain, offset, peak = measure_drift(counts, aligned.sum(axis=0), window, model)
+        aligned, aligned_variances = align_stack(counts, variances, gain, offset)
+    return {'gain': gain, 'offset': offset, 'correlation': peak}, aligned, aligned_variances
+
+# Channel spectra of every stored run of an isotope, saved one by one or in stacks
+def load_channel_runs(name):
+    runs = [run for run in list_runs(name) if run not in (default_run, aligned_run) and has_spectrum(name, "channel", run)]
+    if not runs:
+        return [], None
+    return load_runs(name, "channel", runs)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Track the gain drift of many runs and sum them aligned")
+    parser.add_argument('--name', default="Cesio137")
+    parser.add_argument('--model', choices=['gain', 'shift', 'both'], default=drift_model)
+    parser.add_argument('--window', type=float, nargs=2, default=align_window, help="Channel window of the alignment lines")
+    parser.add_argument('--iterations', type=int, default=reference_iterations)
+    args = parser.parse_args()
+
+    runs, data = load_channel_runs(args.name)
+    if len(runs) < 2:
+        print(f"Fewer than two stored runs of {args.name}. Nothing to align.")
+        exit()
+
+    start_time = time.perf_counter()
+    drift, aligned, variances = track_drift(data[:, :, 1], data[:, :, 2], tuple(args.window), args.model, args.iterations)
+    print(f"Drift of {len(runs)} runs of {args.name} tracked in {time.perf_counter() - start_time:.2f} s "
+          f"(gain {drift['gain'].min():.4f}-{drift['gain'].max():.4f}, "
+          f"offset {drift['offset'].min():.2f}-{drift['offset'].max():.2f} channels)")
+
+    # Drift of every run, for monitoring through the run catalog
+    for index, run in enumerate(runs):
+        save_record(args.name, 'GainDrift', {'gain': drift['gain'][index], 'offset': drift['offset'][index],
+                                             'correlation': drift['correlation'][index]},
+                    units={'offset': 'channels'}, run=run,
+                    metadata={'model': args.model, 'window': list(args.window), 'reference': 'aligned sum'})
+
+    # Sum of the aligned runs
+    summed = np.column_stack((data[0, :, 0], aligned.sum(axis=0), np.sqrt(variances.sum(axis=0))))
+    output_file = f'./Data/Data_{args.name}_Aligned_channel.txt'
+    np.savetxt(output_file, summed, header="Channel Number\tNet Counts\tError", fmt=['%.0f', '%.2f', '%.4f'], delimiter='\t')
+    save_spectrum(args.name, "channel", summed, run=aligned_run, decimals=[0, 2, 4])
+    print(f"Aligned sum of {args.name} saved: {output_file} (run '{aligned_run}' of the spectrum store)")
@@ -1,54 +1,60 @@
+import sys
 import numpy as np
-import scipy.interpolate as sc
-import matplotlib.pyplot as plt
-import matplotlib.pylab as pylab
-
-params = {
-    'xtick.labelsize': 17,    
-    'ytick.labelsize': 17,      
-    'axes.titlesize': 18,
-    'axes.labelsize': 18,
-    'legend.fontsize': 16
-}
-pylab.rcParams.update(params) 
+from Plotting import compute_only, pyplot, show
+from SpectrumStore import default_run, list_runs, load_spectrum, save_spectrum, save_stack
+from EnergyCalibration import load_energy_spectrum
+from MomentumTable import momentum_transform, stack_columns, write_table, table_columns, momentum_columns
 
 isotope_name = "Talio204"   #Isotope name
-conversion_energy = 511     #Units keV/c^2
 filename = "TableValues.txt"
-
-# Load data for interpolation and for isotope
-data_interpolation = np.loadtxt("ValoresInterpolacion.txt", skiprows = 1)
-p_value = data_interpolation[:, 0]
-G_value = data_interpolation[:, 1]
-
-data_Talio = np.loadtxt('./Data/Data_' + isotope_name+ '_WithErrors_energy.txt', skiprows=1)
-channel = data_Talio[:, 0]
-counts = data_Talio[:, 1]
-energy = data_Talio[:, 3]
-
-W = energy/conversion_energy +  1
-P = (W**2 - 1)**(1/2)
-
-# Crear la función de interpolación cúbica
-interpolacion_cubica = sc.interp1d(p_value, G_value, kind='cubic')
-G = interpolacion_cubica(P)
-value = 1 / W * (counts / G)**(1/2)
-
-# Open the file in write mode
-with open(filename, "w") as file:
-    # Write the header line
-    file.write("ChannelNumber\tN(E)\tW\tP\tG(Z,W)\tValue\tEnergy(MeV)\n")
-    for i in range(len(value)):
-        file.write(f"{channel[i]}\t{counts[i]}\t{W[i]}\t{P[i]}\t{G[i]}\t{value[i]}\t{energy[i] / 1000}\n")
-
-# Load table
-data_table = np.loadtxt(filename, skiprows = 1)
-Energy = data_table[:, 6]
-Value = data_table[:, 5]
-
-plt.figure(figsize=(10, 6))
-plt.plot(Energy, Value, color = "black")
-plt.plot(Energy, np.sqrt(counts), color = "red" )
-plt.xlabel("E (MeV)")
-plt.ylabel("Values")
-plt.show()
\ No newline at end of file
+momentum_filename = "TableValues_Np.txt"
+
+# Coulomb correction G(Z,W): interpolated from ValoresInterpolacion.txt (Tl-204),
+# or computed for the daughter nucleus (charge daughter_Z, mass number mass_number) when daughter_Z is set
+interpolation_file = "ValoresInterpolacion.txt"
+daughter_Z = None
+mass_number = 204
+
+# With --all-runs every stored run of the isotope is transformed too (saved as stacks)
+all_runs = '--all-runs' in sys.argv[1:]
+runs = [default_run] + ([run for run in list_runs(isotope_name) if run != default_run] if all_runs else [])
+
+spectra = [load_energy_spectrum(isotope_name, run, text_file='./Data/Data_' + isotope_name + '_WithErrors_energy.txt'
+                                if run == default_run else None) for run in runs]
+data = np.stack(spectra)
+
+# Every derived column of every run at once: (runs, channels)
+columns = momentum_transform(data[..., 0], data[..., 3], data[..., 1], data[..., 2],
+                             interpolation_file, daughter_Z, mass_number)
+tables = stack_columns(columns, table_columns)
+momentum_tables = stack_columns(columns, momentum_columns)
+
+# Text tables of the default run, one bulk write each
+write_table(filename, tables[0], table_columns)
+write_table(momentum_filename, momentum_tables[0], momentum_columns, fmt='%.6f', delimiter=' ')
+print(f"Tables saved as {filename} and {momentum_filename}")
+
+# Save the tables to the binary store
+save_spectrum(isotope_name, "table", tables[0])
+save_spectrum(isotope_name, "momentum", momentum_tables[0])
+if all_runs:
+    save_stack(isotope_name, "table", runs, tables)
+    save_stack(isotope_name, "momentum", runs, momentum_tables)
+    print(f"Tables of {len(runs)} runs saved to the spectrum store")
+counts = data[0, :, 1]
+
+# Check plot of the table (skipped in compute-only mode)
+if not compute_only():
+    plt = pyplot()
+
+    # Load table
+    data_table = load_spectrum(isotope_name, "table", text_file=filename)
+    Energy = data_table[:, 6]
+    Value = data_table[:, 5]
+
+    plt.figure(figsize=(10, 6))
+    plt.plot(Energy, Value, color = "black")
+    plt.plot(Energy, np.sqrt(counts), color = "red" )
+    plt.xlabel("E (MeV)")
+    plt.ylabel("Values")
+    show()
@@ -0,0 +1,82 @@
+# Per-isotope configuration of the spectrum plots and intensity tables.
+# annotations: (energy_value, "label") arrows drawn on the energy spectrum
+# energy_ranges: components whose intensity is written to {name}_IntensityResults.txt
+#     (beta continua with several branches are left to beta_branches)
+# suffix: file name suffix of the plot ('Log' is appended in log scale)
+# beta_branches: decomposition of the spectrum into beta branches (endpoint
+#     energies, keV) and conversion lines (keV) within fit_range (keV), for a
+#     daughter nucleus of charge daughter_Z and mass number mass_number (see
+#     BranchDecomposition.py); None to skip the isotope
+
+isotope_configs = {
+    'Cesio137': {
+        'use_log_scale': False,
+        'suffix': '_EnergySpectreCsAnnotations',
+        'linewidth': None,
+        'annotations': [
+            (330, r"Radiación $\beta$"),
+            (32, "Rayos X"),
+            (630, "Conversión interna"),
+        ],
+        'energy_ranges': {},
+        'beta_branches': {
+            'daughter_Z': 56, 'mass_number': 137, 'fit_range': (150, 1200),
+            'branches': {'beta- 514': 513.97, 'beta- 1176': 1175.63},
+            'lines': {'CI K': 624.22, 'CI L': 655.67},
+        },
+    },
+    'Bario133': {
+        'use_log_scale': True,
+        'suffix': '_EnergySpectreBario133Annotations',
+        'linewidth': 2,
+        'annotations': [
+            (320, r"CI"),
+            (30.85, "RX +CI"),
+            (44.5, "CI"),
+        ],
+        'energy_ranges': {
+            'CI': {'Energy': 320, 'min': 293, 'max': 349},
+            'Rayos X + CI': {'Energy': 30.85, 'min': 19, 'max': 39},
+            'CI 2': {'Energy': 45, 'min': 43, 'max': 56},
+        },
+        'beta_branches': None,
+    },
+    'Europio152': {
+        'use_log_scale': True,
+        'suffix': '_EnergySpectreBario133Annotations',
+        'linewidth': 2,
+        'annotations': [
+            (41.330, "CI"),
+            #(16, "CE"),
+            #(31.7, "CI"),
+            #(41.542, "RayosX"),
+            (89.849, "RX"),
+            (904, r"$\beta-$"),
+        ],
+        'energy_ranges': {
+            'CI + RX': {'Energy': 41.3, 'min': 19, 'max': 76},
+            'RX': {'Energy': 89.849, 'min': 80, 'max': 118},
+        },
+        'beta_branches': {
+            'daughter_Z': 64, 'mass_number': 152, 'fit_range': (181, 1500),
+            'branches': {'beta- 385': 384.6, 'beta- 696': 695.6, 'beta- 1065': 1064.7, 'beta- 1475': 1474.6},
+            'lines': {'CI K 344': 294.0, 'CI L 344': 336.4},
+        },
+    },
+    'Talio204': {
+        'use_log_scale': True,
+        'suffix': '_EnergySpectreBario133Annotations',
+        'linewidth': 2,
+        'annotations': [
+            (350, r"$\beta-$"),
+        ],
+        'energy_ranges': {
+            'beta-': {'Energy': 350, 'min': 54, 'max': 690},
+        },
+        'beta_branches': {
+            'daughter_Z': 82, 'mass_number': 204, 'fit_range': (150, 700),
+            'branches': {'beta- 764': 763.7},
+            'lines': {},
+        },
+    },
+}
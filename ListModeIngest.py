@@ -0,0 +1,141 @@
+import os
+import argparse
+import numpy as np
+from BackgroundSubtraction import subtract_background, net_spectra_table
+from SpectrumStore import save_stack
+from RunCatalog import register_run
+
+# Streaming ingestion of list-mode event files.
+# Events are (timestamp, ADC channel) records in a raw binary file, sorted by
+# timestamp. The file is memory-mapped and read in fixed-size chunks, and the
+# channel histograms are accumulated with np.bincount, so memory use does not
+# depend on the file size.
+
+# Layout of one event record: timestamp in clock ticks and ADC channel
+event_dtype = np.dtype([('timestamp', '<u8'), ('channel', '<u2')])
+
+# Number of events read per chunk
+default_chunk_size = 1 << 22
+
+# Memory-map the events of a list-mode file
+def open_events(file_path, dtype=event_dtype):
+    return np.memmap(file_path, dtype=dtype, mode='r')
+
+# Index range of the events with t_min <= timestamp < t_max (binary search on the sorted file)
+def event_range(events, t_min=None, t_max=None):
+    timestamps = events['timestamp']
+    first = 0 if t_min is None else int(np.searchsorted(timestamps, t_min, side='left'))
+    last = len(events) if t_max is None else int(np.searchsorted(timestamps, t_max, side='left'))
+    return first, last
+
+# Accumulate channel histograms from a list-mode file.
+# Without slice_width a single (n_channels,) histogram is returned. With it,
+# events are split into consecutive time slices of slice_width ticks starting
+# at t_min (or the first event) and an (n_slices, n_channels) array is returned
+# together with the start time and the duration of each slice; the last slice
+# ends at t_max (or after the last event) and is usually shorter. Channels
+# outside the ADC range are counted in the returned overflow.
+def histogram_events(file_path, n_channels=512, t_min=None, t_max=None, slice_width=None,
+                     chunk_size=default_chunk_size, dtype=event_dtype):
+    events = open_events(file_path, dtype)
+    first, last = event_range(events, t_min, t_max)
+
+    if slice_width is None or first == last:
+        n_slices = 1
+        t_start = 0 if t_min is None else int(t_min)
+        t_stop = t_start
+    else:
+        t_start = int(events['timestamp'][first]) if t_min is None else int(t_min)
+        t_stop = int(events['timestamp'][last - 1]) + 1 if t_max is None else int(t_max)
+        n_slices = max(1, -(-(t_stop - t_start) // slice_width))
+
+    histograms = np.zeros(n_slices * n_channels, dtype=np.int64)
+    overflow = 0
+
+    for start in range(first, last, chunk_size):
+        chunk = events[start:min(start + chunk_size, last)]
+        channel = chunk['channel'].astype(np.intp)
+
+        # Drop channels outside the ADC range
+        in_range = channel < n_channels
+        overflow += int(np.count_nonzero(~in_range))
+        channel = channel[in_range]
+
+        if slice_width is not None:
+            slice_index = (chunk['timestamp'][in_range].astype(np.int64) - t_start) // slice_width
+            channel = slice_index * n_channels + channel
+
+        histograms += np.bincount(channel, minlength=histograms.size)
+
+    histograms = histograms.reshape(n_slices, n_channels)
+    if slice_width is None:
+        return histograms[0], overflow
+    slice_starts = t_start + slice_width * np.arange(n_slices)
+    slice_durations = np.maximum(np.minimum(slice_starts + slice_width, t_stop) - slice_starts, 0)
+    return histograms, slice_starts, slice_durations, overflow
+
+# Write a histogram in the format of Data/Datos_{name}_(canales).txt
+def write_channel_spectrum(file_path, histogram):
+    data = np.column_stack((np.arange(histogram.size), histogram))
+    np.savetxt(file_path, data, header="n_1\tN_1", fmt='%d', delimiter='\t', comments='')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build channel spectra from a list-mode event file")
+    parser.add_argument('events', help="Binary list-mode file of (uint64 timestamp, uint16 channel) records")
+    parser.add_argument('name', help="Isotope name, e.g. Talio204")
+    parser.add_argument('--channels', type=int, default=512, help="Number of ADC channels")
+    parser.add_argument('--t-min', type=int, default=None, help="First timestamp included (ticks)")
+    parser.add_argument('--t-max', type=int, default=None, help="First timestamp excluded (ticks)")
+    parser.add_argument('--slice-width', type=int, default=None, help="Split the events into time slices of this many ticks")
+    parser.add_argument('--tick-seconds', type=float, default=None, help="Duration of one timestamp tick (s)")
+    parser.add_argument('--start-time', type=float, default=None,
+                        help="Unix time of the first slice for the run catalog (default: modification time of the file)")
+    parser.add_argument('--background-live-time', type=float, default=None, help="Live time (s) of the background run")
+    parser.add_argument('--chunk-size', type=int, default=default_chunk_size, help="Events read per chunk")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.events):
+        print(f"File {args.events} does not exist.")
+        exit()
+
+    if args.slice_width is None:
+        # One spectrum, written where Data/AddErrorInCounts.py reads it
+        histogram, overflow = histogram_events(args.events, args.channels, args.t_min, args.t_max,
+                                               chunk_size=args.chunk_size)
+        output_file = f'./Data/Datos_{args.name}_(canales).txt'
+        write_channel_spectrum(output_file, histogram)
+        print(f"Spectrum with {histogram.sum()} events saved as {output_file} ({overflow} overflow events)")
+    else:
+        # One run per time slice, background-subtracted as in Data/AddErrorInCounts.py
+        histograms, slice_starts, slice_durations, overflow = histogram_events(args.events, args.channels, args.t_min, args.t_max,
+                                                              args.slice_width, args.chunk_size)
+        data_background = np.loadtxt('./Data/Datos_Fondo_(canales).txt', skiprows=1)
+        counts_background = data_background[:args.channels, 1]
+        if counts_background.size != args.channels:
+            print(f"Background has {counts_background.size} channels, expected {args.channels}.")
+            exit()
+
+        # Scale the background to the duration of each slice (needs the background live time too)
+        live_times = None
+        if args.tick_seconds is not None:
+            live_times = slice_durations * args.tick_seconds
+        try:
+            net_counts, error = subtract_background(histograms, counts_background, live_times, args.background_live_time)
+        except ValueError as e:
+            print(f"Error scaling the background: {e} Give --background-live-time with --tick-seconds.")
+            exit()
+        runs = [f't{start}' for start in slice_starts]
+        channel = np.arange(args.channels)
+        save_stack(args.name, "channel", runs, net_spectra_table(channel, net_counts, error), decimals=[0, 0, 4])
+        print(f"{len(runs)} time slices of {args.name} saved to the spectrum store ({overflow} overflow events)")
+
+        # Describe every slice for the run catalog, in time order from the start time
+        start_time = os.path.getmtime(args.events) if args.start_time is None else args.start_time
+        for index, run in enumerate(runs):
+            settings = {'source_file': os.path.basename(args.events), 'slice_start': int(slice_starts[index]),
+                        'slice_ticks': int(slice_durations[index])}
+            timestamp = start_time
+            if args.tick_seconds is not None:
+                settings['live_time'] = float(live_times[index])
+                timestamp = start_time + (slice_starts[index] - slice_starts[0]) * args.tick_seconds
+            register_run(args.name, run, timestamp=float(timestamp), settings=settings)
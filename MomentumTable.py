@@ -0,0 +1,65 @@
+import numpy as np
+from CoulombCorrection import tabulated, G_function
+
+# Momentum-space columns of beta spectra, for a whole stack at once.
+# From the energy axis and the counts of N spectra, every derived column of
+# the Kurie analysis is computed as an (N, channels) array: W, P, G(Z, W),
+# the Kurie value, the momentum and N(p) with the Jacobian dE/dp, with the
+# errors propagated from the counts. Tables are written with one bulk
+# write per file instead of a formatted write per row.
+
+# Electron rest energy used by the tables (keV)
+conversion_energy = 511
+
+# Columns of the Kurie table (TableValues.txt) and of the momentum table (TableValues_Np.txt)
+table_columns = ['ChannelNumber', 'N(E)', 'W', 'P', 'G(Z,W)', 'Value', 'Energy(MeV)']
+momentum_columns = table_columns + ['Momentum(MeV/c)', 'N(p)', 'N(p)Error', 'ValueError']
+
+# Derived columns of a stack of spectra.
+# channel, energy_kev: (C,) or (N, C); counts, errors: (N, C).
+# G(Z, W) is interpolated in G_file, or computed for daughter_Z when it is given.
+def momentum_transform(channel, energy_kev, counts, errors, G_file='ValoresInterpolacion.txt',
+                       daughter_Z=None, mass_number=None):
+    counts = np.atleast_2d(np.asarray(counts, dtype=float))
+    errors = np.atleast_2d(np.asarray(errors, dtype=float))
+    energy_kev = np.broadcast_to(np.asarray(energy_kev, dtype=float), counts.shape)
+    channel = np.broadcast_to(np.asarray(channel, dtype=float), counts.shape)
+
+    W = energy_kev / conversion_energy + 1
+    P = (W**2 - 1)**(1/2)
+    if daughter_Z is None:
+        G = tabulated(G_file)(P)
+    else:
+        G = G_function(daughter_Z, energy_kev / 1000, mass_number)
+    value = 1 / W * (counts / G)**(1/2)
+
+    # Kurie value error: dK = K dN / (2 N); empty channels take the value of a one-sigma count
+    with np.errstate(divide='ignore', invalid='ignore'):
+        value_error = np.where(counts > 0, value * errors / (2 * counts), 1 / W * np.sqrt(errors / G))
+
+    # N(p) = N(E) dE/dp, with dE/d(pc) = pc / E_total = P / W
+    momentum = P * conversion_energy / 1000
+    jacobian = P / W
+    N_p = counts * jacobian
+    N_p_error = errors * jacobian
+
+    return {
+        'ChannelNumber': channel, 'N(E)': counts, 'W': W, 'P': P, 'G(Z,W)': G, 'Value': value,
+        'Energy(MeV)': energy_kev / 1000, 'Momentum(MeV/c)': momentum, 'N(p)': N_p,
+        'N(p)Error': N_p_error, 'ValueError': value_error,
+    }
+
+# Stack the chosen columns into (N, C, columns) tables
+def stack_columns(columns, names):
+    return np.stack([columns[name] for name in names], axis=-1)
+
+# Write one table (C, columns) to text in a single write.
+# '%r'-like shortest round-trip formatting unless fmt is given.
+def write_table(file_path, table, names, fmt=None, delimiter='\t'):
+    if fmt is None:
+        text = '\n'.join(delimiter.join(row) for row in table.astype(str).tolist())
+        with open(file_path, 'w') as f:
+            f.write(delimiter.join(names) + '\n' + text + '\n')
+    else:
+        np.savetxt(file_path, table, fmt=fmt, delimiter=delimiter, header=delimiter.join(names), comments='')
+    return file_path
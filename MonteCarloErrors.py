@@ -0,0 +1,187 @@
+import os
+import time
+import argparse
+import numpy as np
+from PeakFitting import fit_batch, stack_rois
+from QScan import build_prefix_sums, window_indices, window_fit, load_best_windows
+from ResultsStore import save_record, get_values
+from SpectrumStore import load_spectrum
+from EnergyCalibration import load_energy_spectrum
+from RunCatalog import run_settings
+
+# Monte Carlo uncertainties of the Cs-137 peak (centroid, width, area,
+# activity) and of the Tl-204 Q values.
+# The measured spectrum is resampled K times as one (K, channels) array and
+# every replica is refitted with the batched fits (PeakFitting.fit_batch for
+# the peak, QScan.window_fit on stacked prefix sums for the Kurie and sqrt(N(E))
+# lines), so the full distributions come out in seconds. Unlike the
+# first-order propagation of the scripts, they carry every correlation
+# between the fitted parameters. The random generator is seeded, so the
+# results are reproducible.
+
+# Number of replicas and seed of the random generator
+n_replicas = 10000
+seed = 20241015
+
+# Replicas fitted at once (bounds the memory of the batched peak fit)
+replicas_per_chunk = 2500
+
+# Live time (s) of a run whose settings were not registered
+default_live_time = 10 * 60
+
+# Output text file
+output_results_file = './Results/MonteCarlo_Errors.txt'
+
+# Resample a spectrum K times: (K, channels).
+# With errors, each channel fluctuates as a Poisson variable of variance
+# errors^2 shifted to mean counts (net counts keep the variance of the gross
+# and background counts); without, counts are Poisson means.
+def resample_spectra(counts, errors=None, n=n_replicas, rng=None):
+    rng = np.random.default_rng(seed) if rng is None else rng
+    counts = np.asarray(counts, dtype=float)
+    if errors is None:
+        return rng.poisson(np.maximum(counts, 0), size=(n, counts.size)).astype(float)
+    variance = np.asarray(errors, dtype=float)**2
+    return counts + (rng.poisson(variance, size=(n, counts.size)) - variance)
+
+# Net area of a Gaussian peak on a linear background a + b * x over [min_channel, max_channel]
+def peak_area(params, min_channel, max_channel):
+    a, b, c, xc, s = np.moveaxis(np.asarray(params, dtype=float), -1, 0)
+    line = (b / 2) * (max_channel**2 - min_channel**2) + a * (max_channel - min_channel)
+    return c * np.sqrt(2 * np.pi) * s - line
+
+# Distributions of the peak parameters over K replicas of the spectrum.
+# The replicas are fitted in the ROI [min_channel, max_channel] starting from p0,
+# with the measured errors as weights. Returns arrays of the converged replicas.
+def peak_distributions(channel, counts, errors, min_channel, max_channel, p0, live_time,
+                       n=n_replicas, rng=None, chunk=replicas_per_chunk):
+    rng = np.random.default_rng(seed) if rng is None else rng
+    x, y, sigma = stack_rois(channel, counts, errors, [(0, min_channel, max_channel)])
+    used = sigma[0] > 0
+
+    params, converged = [], []
+    for first in range(0, n, chunk):
+        k = min(chunk, n - first)
+        # Only the ROI channels are resampled
+        replicas = np.zeros((k, x.shape[1]))
+        replicas[:, used] = resample_spectra(y[0, used], sigma[0, used], k, rng)
+        fit = fit_batch(np.broadcast_to(x, replicas.shape), replicas, np.broadcast_to(sigma, replicas.shape),
+                        np.repeat(np.atleast_2d(p0), k, axis=0))
+        params.append(fit['params'])
+        converged.append(fit['converged'] & np.all(np.isfinite(fit['errors']), axis=1))
+    params, converged = np.concatenate(params), np.concatenate(converged)
+    params = params[converged]
+
+    area = peak_area(params, min_channel, max_channel)
+    return {
+        'centroid': params[:, 3],
+        'width': np.abs(params[:, 4]),
+        'area': area,
+        'activity': area / live_time,
+        'params': params,
+        'converged_fraction': np.mean(converged),
+    }
+
+# Distributions of Q from the Kurie and sqrt(N(E)) lines over K replicas of N(E).
+# windows: {fit_type: (min, max, ...)} energy windows of the fits (MeV).
+def Q_distributions(energy_mev, N_E, N_E_errors, W, G_ZW, windows, n=n_replicas, rng=None):
+    rng = np.random.default_rng(seed) if rng is None else rng
+    replicas = np.maximum(resample_spectra(N_E, N_E_errors, n, rng), 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        y_data = {'Kurie': 1 / W * np.sqrt(replicas / G_ZW), 'N(E)': np.sqrt(replicas)}
+
+    distributions = {}
+    for fit_type, window in windows.items():
+        start, stop = window_indices(energy_mev, window[0], window[1])
+        # Only the window is summed: prefix sums of (K, window) replicas
+        prefix = build_prefix_sums(energy_mev[start:stop], y_data[fit_type][:, start:stop])
+        fit = window_fit(prefix, 0, stop - start)
+        distributions[fit_type] = {'Q': fit['Q'], 'slope': fit['slope'], 'intercept': fit['intercept']}
+    return distributions
+
+# Mean, standard deviation and central 68% interval of a distribution
+def summarize(samples):
+    samples = np.asarray(samples, dtype=float)
+    samples = samples[np.isfinite(samples)]
+    low, median, high = np.percentile(samples, [15.865, 50, 84.135])
+    return {'mean': np.mean(samples), 'std': np.std(samples, ddof=1), 'median': median, 'low': low, 'high': high}
+
+# Save the summaries of a set of distributions to the results store
+def save_distributions(isotope, stage, distributions, units, run, extra_metadata=None):
+    summaries = {name: summarize(samples) for name, samples in distributions.items()}
+    names = list(distributions)
+    samples = np.array([np.asarray(distributions[name], dtype=float) for name in names])
+    finite = np.all(np.isfinite(samples), axis=0)
+    metadata = {'replicas': int(samples.shape[1]), 'seed': seed,
+                'intervals': {name: [summary['low'], summary['high']] for name, summary in summaries.items()}}
+    metadata.update(extra_metadata or {})
+    save_record(isotope, stage, {name: summary['mean'] for name, summary in summaries.items()},
+                errors={name: summary['std'] for name, summary in summaries.items()},
+                covariance=np.atleast_2d(np.cov(samples[:, finite])), units=units, run=run, metadata=metadata)
+    return summaries
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Monte Carlo uncertainties of the peak fit and of Q")
+    parser.add_argument('--replicas', type=int, default=n_replicas)
+    parser.add_argument('--seed', type=int, default=seed)
+    parser.add_argument('--run', default='default')
+    args = parser.parse_args()
+    seed = args.seed
+    rng = np.random.default_rng(seed)
+    lines = []
+
+    # Cs-137 peak: replicas of the channel spectrum refitted in the window of the fit
+    name = "Cesio137"
+    try:
+        peak = get_values(name, 'PeakFit', args.run)
+        data = load_spectrum(name, "channel", args.run, text_file=f'./Data/Data_{name}_WithErrors_channel.txt'
+                             if args.run == 'default' else None)
+    except FileNotFoundError as e:
+        print(f"Error reading the peak fit of {name}: {e}")
+        exit()
+    live_time = run_settings(name, args.run).get('live_time', default_live_time)
+    p0 = [peak[key] for key in ('a', 'b', 'c', 'xc', 's')]
+
+    start_time = time.perf_counter()
+    distributions = peak_distributions(data[:, 0], data[:, 1], data[:, 2], peak['min_channel'], peak['max_channel'],
+                                       p0, live_time, args.replicas, rng)
+    elapsed = time.perf_counter() - start_time
+    converged = distributions['converged_fraction']
+    summaries = save_distributions(name, 'PeakFitMC',
+                                   {key: distributions[key] for key in ('centroid', 'width', 'area', 'activity')},
+                                   {'centroid': 'channel', 'width': 'channel', 'area': 'counts', 'activity': 'counts/s'},
+                                   args.run, {'converged_fraction': converged})
+    print(f"{args.replicas} replicas of {name} fitted in {elapsed:.2f} s ({100 * converged:.1f}% converged)")
+    lines.append(f"{name} ({args.replicas} replicas, seed {seed})")
+    for key, summary in summaries.items():
+        lines.append(f"{key}\t{summary['mean']:.4f}\t{summary['std']:.4f}\t[{summary['low']:.4f}, {summary['high']:.4f}]")
+
+    # Tl-204 Q: replicas of N(E) refitted in the best windows of the Kurie and sqrt(N(E)) lines
+    name = "Talio204"
+    try:
+        windows = load_best_windows(name, args.run)
+        channel, N_E, W, P, G_ZW, value, energy_mev = load_spectrum(name, "table", args.run, text_file='./TableValues.txt'
+                                                                    if args.run == 'default' else None).T
+        errors = load_energy_spectrum(name, args.run, text_file=f'./Data/Data_{name}_WithErrors_energy.txt'
+                                      if args.run == 'default' else None)[:, 2]
+    except FileNotFoundError as e:
+        print(f"Error reading the Q data of {name}: {e}")
+        exit()
+
+    start_time = time.perf_counter()
+    distributions = Q_distributions(energy_mev, N_E, errors, W, G_ZW, windows, args.replicas, rng)
+    elapsed = time.perf_counter() - start_time
+    summaries = save_distributions(name, 'QValueMC',
+                                   {f'{fit_type}.Q': results['Q'] for fit_type, results in distributions.items()},
+                                   {f'{fit_type}.Q': 'MeV' for fit_type in distributions}, args.run)
+    print(f"{args.replicas} replicas of {name} fitted in {elapsed:.2f} s")
+    lines.append(f"{name} ({args.replicas} replicas, seed {seed})")
+    for key, summary in summaries.items():
+        lines.append(f"{key}\t{summary['mean']:.4f}\t{summary['std']:.4f}\t[{summary['low']:.4f}, {summary['high']:.4f}]")
+
+    # Save the results in a text file
+    os.makedirs(os.path.dirname(output_results_file), exist_ok=True)
+    with open(output_results_file, 'w') as f:
+        f.write("Parameter\tMean\tStd\t68% interval\n")
+        f.write("\n".join(lines) + "\n")
+    print(f"Results saved to: {output_results_file}")
@@ -0,0 +1,173 @@
+import os
+import argparse
+import functools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from QScan import energy_grid, scan_energy_windows, save_best_windows
+from SpectrumStore import default_run, load_spectrum
+from IsotopeConfig import isotope_configs
+
+# Parallel driver for the Q-value window scan of CurieCalibrationItemize.py.
+# Every (table, fit type, step, block of min energies) combination is an
+# independent task; tasks are spread over a process pool and merged back in
+# a fixed order so the output does not depend on the worker count.
+
+# Target Q value
+target_Q = 0.76
+
+# Default input table and outputs, and the isotope of tables whose name does not give one
+default_tables = ['./TableValues.txt']
+default_isotope = 'Talio204'
+output_dir = './Results'
+
+# Energy ranges scanned for each fit type (y data is chosen in load_table)
+fit_configs = {
+    'Kurie': {'min_range': (0.1, 0.3), 'max_range': (0.4, 0.8)},
+    'N(E)': {'min_range': (0.2, 0.4), 'max_range': (0.5, 0.7)},
+}
+
+# Fields saved for every window in the full result array
+window_fields = ('min', 'max', 'Q', 'slope', 'intercept', 'slope_err', 'intercept_err', 'covariance', 'n')
+
+# Load a TableValues-style table once per worker process, from the store, else the text table
+@functools.lru_cache(maxsize=None)
+def load_table(input_file, isotope=default_isotope):
+    data = load_spectrum(table_isotope(input_file, isotope), "table", table_run(input_file), text_file=input_file)
+    channel, N_E, W, P, G_ZW, value, energy_mev = data.T  # Transpose to extract columns
+    return {'energy_mev': energy_mev, 'Kurie': value, 'N(E)': np.sqrt(N_E)}
+
+# Scan one block of windows: min energies in min_values against the full max grid
+def scan_task(task):
+    input_file, fit_type, step, min_values, isotope = task
+    table = load_table(input_file, isotope)
+    max_values = energy_grid(fit_configs[fit_type]['max_range'], step)
+    results = scan_energy_windows(table['energy_mev'], table[fit_type], min_values, max_values)
+    return task[:3], {field: np.ravel(results[field]).astype(float) for field in window_fields}
+
+# Split the min-energy grid of every table, fit type and step into tasks
+def build_tasks(tables, steps, blocks_per_scan, isotope=default_isotope):
+    tasks = []
+    for input_file in tables:
+        for fit_type, config in fit_configs.items():
+            for step in steps:
+                min_values = energy_grid(config['min_range'], step)
+                for block in np.array_split(min_values, min(blocks_per_scan, min_values.size)):
+                    tasks.append((input_file, fit_type, step, block, isotope))
+    return tasks
+
+# Run every task on the pool and merge the blocks in task order
+def run_scan(tables, steps=(0.01,), workers=None, blocks_per_scan=None, isotope=default_isotope):
+    workers = workers or os.cpu_count() or 1
+    blocks_per_scan = blocks_per_scan or workers
+    tasks = build_tasks(tables, steps, blocks_per_scan, isotope)
+
+    if workers == 1:
+        return merge_blocks(map(scan_task, tasks))
+    # The pool is shut down even when a task raises
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return merge_blocks(executor.map(scan_task, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
+
+# Merge the blocks of each scan; executor.map preserves task order, so the merge is deterministic
+def merge_blocks(outputs):
+    merged = {}
+    for key, block in outputs:
+        merged.setdefault(key, []).append(block)
+    return {key: {field: np.concatenate([block[field] for block in blocks]) for field in window_fields}
+            for key, blocks in merged.items()}
+
+# Best window of each fit type over all steps: closest Q to target_Q, then smallest slope error
+def best_windows(merged, input_file):
+    best_combinations = {}
+    for fit_type in fit_configs:
+        candidates = [windows for (table, key, step), windows in merged.items()
+                      if table == input_file and key == fit_type]
+        if not candidates:
+            continue
+        windows = {field: np.concatenate([c[field] for c in candidates]) for field in window_fields}
+        Q_error = np.abs(windows['Q'] - target_Q)
+        Q_error[np.isnan(Q_error)] = np.inf
+        best = np.lexsort((windows['slope_err'], Q_error))[0]
+        if np.isfinite(Q_error[best]):
+            best_combinations[fit_type] = (windows['min'][best], windows['max'][best],
+                                           windows['Q'][best], windows['slope_err'][best])
+    return best_combinations
+
+# Name of a table from its path relative to the working directory (runs/a/TableValues.txt ->
+# runs_a_TableValues), so tables with the same file name in different directories do not collide
+def table_name(input_file):
+    return os.path.splitext(os.path.normpath(os.path.relpath(input_file)))[0].replace(os.sep, '_').lstrip('._')
+
+# Output names: the default table keeps the historical QBest_Values.txt
+def output_paths(input_file):
+    if os.path.normpath(input_file) == os.path.normpath(default_tables[0]):
+        prefix = ''
+    else:
+        prefix = table_name(input_file) + '_'
+    return (os.path.join(output_dir, f'{prefix}QBest_Values.txt'),
+            os.path.join(output_dir, f'{prefix}QScan_Windows.npz'))
+
+# Run name of a table in the results store: the default table is the default run
+def table_run(input_file):
+    if os.path.normpath(input_file) == os.path.normpath(default_tables[0]):
+        return default_run
+    return table_name(input_file)
+
+# Isotope of a table: the isotope named in the file name (e.g. TableValues_Cesio137.txt), else the given default
+def table_isotope(input_file, isotope=default_isotope):
+    name = os.path.basename(input_file)
+    matches = [known for known in isotope_configs if known in name]
+    return matches[0] if matches else isotope
+
+# Save QBest_Values.txt, the results store record and the full per-window result array for each table
+def save_results(merged, tables, isotope=default_isotope):
+    os.makedirs(output_dir, exist_ok=True)
+    for input_file in tables:
+        best_file, windows_file = output_paths(input_file)
+        best_combinations = best_windows(merged, input_file)
+        with open(best_file, 'w') as f:
+            f.write("Min Energy (MeV)\tMax Energy (MeV)\tFit Type\n")
+            for fit_type, (min_val, max_val, Q_value, slope_err) in best_combinations.items():
+                f.write(f"{min_val:.2f}\t{max_val:.2f}\t{fit_type}\t{Q_value:.4f}\n")
+        save_best_windows(table_isotope(input_file, isotope), best_combinations, run=table_run(input_file))
+
+        # One structured array per table: fit type and step identify each window
+        rows = []
+        for (table, fit_type, step), windows in merged.items():
+            if table != input_file:
+                continue
+            block = np.zeros(windows['Q'].size, dtype=[('fit_type', 'U8'), ('step', float)] +
+                             [(field, float) for field in window_fields])
+            block['fit_type'] = fit_type
+            block['step'] = step
+            for field in window_fields:
+                block[field] = windows[field]
+            rows.append(block)
+        np.savez_compressed(windows_file, windows=np.concatenate(rows))
+        print(f"Results for {input_file} saved to {best_file} and {windows_file}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Parallel Q-value window scan")
+    parser.add_argument('tables', nargs='*', default=default_tables, help="TableValues-style input tables")
+    parser.add_argument('--steps', type=float, nargs='+', default=[0.01], help="Energy step sizes (MeV)")
+    parser.add_argument('--isotope', default=default_isotope, help="Isotope of the tables whose file name names none")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes")
+    args = parser.parse_args()
+
+    # Check if input files exist
+    tables = []
+    for input_file in args.tables:
+        if not os.path.exists(input_file):
+            print(f"Input file {input_file} does not exist. Skipping.")
+            continue
+        tables.append(input_file)
+
+    # Tables whose outputs would overwrite each other
+    names = [table_run(input_file) for input_file in tables]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        print(f"Several input tables map to the outputs of {duplicates[0]}. Give each table once.")
+        exit()
+
+    if tables:
+        merged = run_scan(tables, args.steps, args.workers, isotope=args.isotope)
+        save_results(merged, tables, args.isotope)
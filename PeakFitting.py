@@ -0,0 +1,142 @@
+import numpy as np
+
+# Batched Levenberg-Marquardt fitting of Gaussian peaks on a linear background.
+# Model for n_peaks peaks, with parameters [a, b, c_1, xc_1, s_1, ..., c_n, xc_n, s_n]:
+#     f(x) = a + b * x + sum_k c_k * exp(-(x - xc_k)^2 / (2 * s_k^2))
+# Many regions of interest (ROIs) are fitted at once: they are padded to a
+# common length and stacked, the Jacobian is analytic, and every LM step
+# solves all the normal equations with one batched np.linalg.solve.
+
+# Number of parameters of the model with n_peaks peaks
+def n_parameters(n_peaks):
+    return 2 + 3 * n_peaks
+
+# Evaluate the model. x: (..., L), params: (..., P) -> (..., L)
+def gaussian_linear(x, params):
+    params = np.asarray(params, dtype=float)
+    x = np.asarray(x, dtype=float)
+    model = params[..., 0:1] + params[..., 1:2] * x
+    for k in range((params.shape[-1] - 2) // 3):
+        c, xc, s = (params[..., 2 + 3 * k + i:3 + 3 * k + i] for i in range(3))
+        model = model + c * np.exp(-(x - xc)**2 / (2 * s**2))
+    return model
+
+# Model and analytic Jacobian. Returns (..., L) and (..., L, P)
+def gaussian_linear_jacobian(x, params):
+    n_peaks = (params.shape[-1] - 2) // 3
+    jacobian = np.empty(x.shape + (params.shape[-1],))
+    jacobian[..., 0] = 1
+    jacobian[..., 1] = x
+    model = params[..., 0:1] + params[..., 1:2] * x
+    for k in range(n_peaks):
+        c, xc, s = (params[..., 2 + 3 * k + i:3 + 3 * k + i] for i in range(3))
+        dx = x - xc
+        gauss = np.exp(-dx**2 / (2 * s**2))
+        model = model + c * gauss
+        jacobian[..., 2 + 3 * k] = gauss
+        jacobian[..., 3 + 3 * k] = c * gauss * dx / s**2
+        jacobian[..., 4 + 3 * k] = c * gauss * dx**2 / s**3
+    return model, jacobian
+
+# Fit a stack of ROIs. x, y, sigma: (B, L); p0: (B, P).
+# Points with weight zero (padding or sigma <= 0) are ignored. Errors are
+# scaled by chi2/dof as in curve_fit with absolute_sigma=False unless
+# absolute_sigma is True.
+def fit_batch(x, y, sigma, p0, weights=None, max_iterations=200, tolerance=1e-10, absolute_sigma=False):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    sigma = np.asarray(sigma, dtype=float)
+    params = np.array(p0, dtype=float)
+    n_batch, n_params = params.shape
+
+    if weights is None:
+        weights = np.ones_like(y)
+    with np.errstate(divide='ignore'):
+        weights = np.where(sigma > 0, weights / sigma**2, 0)
+
+    def chi_square(p):
+        return np.sum(weights * (y - gaussian_linear(x, p))**2, axis=-1)
+
+    damping = np.full(n_batch, 1e-3)
+    chi2 = chi_square(params)
+    active = np.ones(n_batch, dtype=bool)
+    accepted = np.zeros(n_batch, dtype=bool)
+    identity = np.eye(n_params)
+
+    for iteration in range(max_iterations):
+        model, jacobian = gaussian_linear_jacobian(x, params)
+        weighted_jacobian = jacobian * weights[..., None]
+        alpha = np.einsum('blp,blq->bpq', weighted_jacobian, jacobian)
+        beta = np.einsum('blp,bl->bp', weighted_jacobian, y - model)
+
+        # Marquardt scaling of the diagonal
+        diagonal = np.einsum('bpp->bp', alpha)
+        damped = alpha + damping[:, None, None] * diagonal[:, :, None] * identity
+        with np.errstate(all='ignore'):
+            try:
+                step = np.linalg.solve(damped, beta[..., None])[..., 0]
+            except np.linalg.LinAlgError:
+                step = np.stack([np.linalg.lstsq(d, b, rcond=None)[0] if np.all(np.isfinite(d)) else np.full_like(b, np.nan)
+                                 for d, b in zip(damped, beta)])
+            trial = params + step
+            trial_chi2 = chi_square(trial)
+
+        # Accept the steps that lower chi2, and adapt the damping of each ROI
+        improved = active & np.isfinite(trial_chi2) & (trial_chi2 < chi2)
+        relative_change = np.where(improved, (chi2 - trial_chi2) / np.maximum(chi2, 1e-300), 0)
+        params[improved] = trial[improved]
+        accepted |= improved
+        chi2 = np.where(improved, trial_chi2, chi2)
+        damping = np.where(improved, damping / 10, damping * 10)
+
+        # ROIs stop when chi2 no longer changes or the damping saturates
+        # (a saturated ROI that never accepted a step did not converge)
+        active &= ~((improved & (relative_change < tolerance)) | (damping > 1e12))
+        if not np.any(active):
+            break
+
+    # Covariance from the curvature matrix at the solution
+    _, jacobian = gaussian_linear_jacobian(x, params)
+    alpha = np.einsum('blp,blq->bpq', jacobian * weights[..., None], jacobian)
+    dof = np.count_nonzero(weights, axis=-1) - n_params
+    covariance = np.full_like(alpha, np.inf)
+    invertible = np.all(np.isfinite(alpha), axis=(1, 2))
+    invertible[invertible] = np.linalg.matrix_rank(alpha[invertible]) == n_params
+    covariance[invertible] = np.linalg.inv(alpha[invertible])
+    if not absolute_sigma:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            covariance *= np.where(dof > 0, chi2 / dof, np.inf)[:, None, None]
+
+    return {
+        'params': params,
+        'covariance': covariance,
+        'errors': np.sqrt(np.abs(np.einsum('bpp->bp', covariance))),
+        'chi2': chi2,
+        'dof': dof,
+        'converged': ~active & accepted & np.isfinite(chi2),
+    }
+
+# Cut ROIs out of spectra and stack them padded to a common length.
+# channels, counts, errors: (N, C) or (C,) arrays; rois: list of
+# (spectrum index, min channel, max channel) with inclusive limits.
+def stack_rois(channels, counts, errors, rois):
+    channels, counts, errors = (np.atleast_2d(np.asarray(a, dtype=float)) for a in (channels, counts, errors))
+    masks = [(channels[i] >= lo) & (channels[i] <= hi) for i, lo, hi in rois]
+    length = max(np.count_nonzero(mask) for mask in masks)
+
+    x = np.zeros((len(rois), length))
+    y = np.zeros((len(rois), length))
+    sigma = np.zeros((len(rois), length))
+    for row, ((i, lo, hi), mask) in enumerate(zip(rois, masks)):
+        n = np.count_nonzero(mask)
+        x[row, :n] = channels[i][mask]
+        y[row, :n] = counts[i][mask]
+        sigma[row, :n] = errors[i][mask]
+        # Padding repeats the last channel with zero weight (sigma = 0)
+        x[row, n:] = x[row, n - 1] if n else 0
+    return x, y, sigma
+
+# Fit every ROI of every spectrum in one call; p0: (len(rois), P)
+def fit_peaks(channels, counts, errors, rois, p0, **options):
+    x, y, sigma = stack_rois(channels, counts, errors, rois)
+    return fit_batch(x, y, sigma, np.atleast_2d(p0), **options)
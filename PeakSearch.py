@@ -0,0 +1,137 @@
+import numpy as np
+
+# Vectorized peak search for stacks of spectra.
+# Each spectrum is filtered with the negative second derivative of a Gaussian
+# (a smoothed second difference). Peaks show up as positive lobes of the
+# filtered spectrum; their significance is the filter output divided by its
+# Poisson standard deviation. The whole (N, channels) stack is filtered with
+# one convolution per kernel and the candidates of every spectrum come back
+# in a single structured array.
+
+# Fields of each peak candidate
+candidate_dtype = np.dtype([
+    ('spectrum', int),        # Index of the spectrum in the stack
+    ('channel', int),         # Channel of the filter maximum
+    ('centroid', float),      # Interpolated centroid (channel)
+    ('width', float),         # Gaussian sigma estimated from the filter lobe (channel)
+    ('height', float),        # Net peak height above the local background
+    ('significance', float),  # Filter output / its standard deviation
+])
+
+# Negative second derivative of a unit Gaussian, with zero sum so that linear backgrounds cancel
+def second_difference_kernel(sigma):
+    half_width = int(np.ceil(4 * sigma))
+    x = np.arange(-half_width, half_width + 1)
+    kernel = (1 - x**2 / sigma**2) * np.exp(-x**2 / (2 * sigma**2))
+    kernel -= kernel.mean()
+    return kernel
+
+# Convolve every row of the stack with a 1D kernel (same length, edges reflected)
+def convolve_rows(stack, kernel):
+    half_width = kernel.size // 2
+    padded = np.pad(stack, ((0, 0), (half_width, half_width)), mode='reflect')
+    windows = np.lib.stride_tricks.sliding_window_view(padded, kernel.size, axis=1)
+    return windows @ kernel[::-1]
+
+# Filtered spectra and significance for a stack of spectra (N, C)
+def filter_spectra(counts, sigma=3.0):
+    counts = np.atleast_2d(np.asarray(counts, dtype=float))
+    kernel = second_difference_kernel(sigma)
+    filtered = convolve_rows(counts, kernel)
+
+    # Poisson variance of the filter output
+    variance = convolve_rows(np.maximum(counts, 0), kernel**2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        significance = np.where(variance > 0, filtered / np.sqrt(variance), 0)
+    return filtered, significance
+
+# Find the peak candidates of every spectrum in the stack.
+# sigma is the expected peak width in channels; candidates below
+# min_significance or within edge channels of the ends are dropped.
+def find_peaks(counts, sigma=3.0, min_significance=5.0, edge=None):
+    counts = np.atleast_2d(np.asarray(counts, dtype=float))
+    filtered, significance = filter_spectra(counts, sigma)
+    n_channels = counts.shape[1]
+    edge = int(np.ceil(2 * sigma)) if edge is None else edge
+
+    # Local maxima of the significance above threshold
+    inner = significance[:, 1:-1]
+    is_peak = (inner > significance[:, :-2]) & (inner >= significance[:, 2:]) & (inner > min_significance)
+    spectrum, channel = np.nonzero(is_peak)
+    channel = channel + 1
+    keep = (channel >= edge) & (channel < n_channels - edge)
+    spectrum, channel = spectrum[keep], channel[keep]
+
+    # Centroid from a parabola through the filter maximum and its neighbours
+    left = filtered[spectrum, channel - 1]
+    center = filtered[spectrum, channel]
+    right = filtered[spectrum, channel + 1]
+    curvature = left - 2 * center + right
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = np.where(curvature < 0, 0.5 * (left - right) / curvature, 0)
+    centroid = channel + np.clip(offset, -0.5, 0.5)
+
+    # Width from the lobe: the filter response of a Gaussian peak of width w
+    # crosses zero at +-sqrt(w^2 + sigma^2) from the centroid
+    positive = filtered > 0
+    lobe_left = lobe_edge(positive, spectrum, channel, -1)
+    lobe_right = lobe_edge(positive, spectrum, channel, +1)
+    half_lobe = 0.5 * (lobe_right - lobe_left)
+    width = np.sqrt(np.maximum(half_lobe**2 - sigma**2, 0.25 * sigma**2))
+
+    # Height: the filter response of a Gaussian of height h and width w at its center
+    height = center / response_at_center(width, sigma)
+
+    candidates = np.zeros(spectrum.size, dtype=candidate_dtype)
+    candidates['spectrum'] = spectrum
+    candidates['channel'] = channel
+    candidates['centroid'] = centroid
+    candidates['width'] = width
+    candidates['height'] = height
+    candidates['significance'] = significance[spectrum, channel]
+    return candidates
+
+# Edge of the positive filter lobe around each candidate in the given direction (vectorized walk)
+def lobe_edge(positive, spectrum, channel, direction):
+    n_channels = positive.shape[1]
+    position = channel.copy()
+    moving = np.ones(channel.size, dtype=bool)
+    while np.any(moving):
+        step = position + direction
+        inside = (step >= 0) & (step < n_channels)
+        moving &= inside
+        moving[moving] = positive[spectrum[moving], step[moving]]
+        position[moving] = step[moving]
+    return position + 0.5 * direction
+
+# Filter output at the center of a unit-height Gaussian of width w (continuum approximation):
+# integral of exp(-x^2/2w^2) * (1 - x^2/sigma^2) * exp(-x^2/2sigma^2)
+def response_at_center(width, sigma):
+    total = width**2 + sigma**2
+    return np.sqrt(2 * np.pi) * width * sigma**3 / total**1.5
+
+# Initial guesses and ROIs for PeakFitting.fit_peaks from peak candidates.
+# Each ROI spans window_widths peak widths on each side of the centroid.
+def seed_fits(counts, candidates, window_widths=2.5, channels=None):
+    counts = np.atleast_2d(np.asarray(counts, dtype=float))
+    n_channels = counts.shape[1]
+    if channels is None:
+        channels = np.arange(n_channels)
+
+    lo = np.clip(np.floor(candidates['centroid'] - window_widths * candidates['width']), 0, n_channels - 1).astype(int)
+    hi = np.clip(np.ceil(candidates['centroid'] + window_widths * candidates['width']), 0, n_channels - 1).astype(int)
+
+    # Linear background through the counts at the ROI edges
+    y_lo = counts[candidates['spectrum'], lo]
+    y_hi = counts[candidates['spectrum'], hi]
+    x_lo = channels[lo]
+    x_hi = channels[hi]
+    slope = np.where(x_hi > x_lo, (y_hi - y_lo) / np.maximum(x_hi - x_lo, 1e-12), 0)
+    offset = y_lo - slope * x_lo
+
+    background = offset + slope * candidates['centroid']
+    peak = counts[candidates['spectrum'], candidates['channel']] - background
+    p0 = np.column_stack((offset, slope, np.maximum(peak, candidates['height']),
+                          candidates['centroid'], candidates['width']))
+    rois = list(zip(candidates['spectrum'], channels[lo], channels[hi]))
+    return rois, p0
@@ -0,0 +1,360 @@
+import os
+import sys
+import ast
+import glob
+import json
+import fnmatch
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from IsotopeConfig import isotope_configs
+
+# Incremental runner for the analysis chain.
+# Each stage declares the files it reads and writes. A stage is rerun only
+# when the content hash of its script or of any input differs from the last
+# successful run, or when one of its outputs was deleted or modified.
+# Inputs may be glob patterns, for the runs of the spectrum store whose
+# names are only known at run time. Stages whose inputs are ready run in
+# parallel.
+
+# Names of nucleus isotopes
+nucleus_names = ["Cesio137", "Europio152", "Bario133", "Talio204"]
+
+# File with the hashes of the last successful run of each stage
+state_file = './.pipeline_state.json'
+
+channel_files = [f'Data/Data_{name}_WithErrors_channel.txt' for name in nucleus_names]
+energy_files = [f'Data/Data_{name}_WithErrors_energy.txt' for name in nucleus_names]
+calibration_file = 'Results/EnergyCalibration.json'
+
+# Files read by a stage that loads energy spectra (calibration applied to the channel spectra)
+def energy_inputs(names):
+    return ([f'Data/Data_{name}_WithErrors_energy.txt' for name in names] +
+            [f'Data/Data_{name}_WithErrors_channel.txt' for name in names] +
+            [store_file(name, kind) for name in names for kind in ('energy', 'channel')] + [calibration_file])
+
+# Results store record of a stage (default run)
+def record_file(isotope, stage):
+    return f'Results/Store/{isotope}/default/{stage}.json'
+
+# Spectrum store entry of one run (see SpectrumStore.py)
+def store_file(name, kind, run='default'):
+    return f'Data/Store/{name}/{run}/{kind}.npy'
+
+# Spectrum store entries of every run of one kind: saved one by one or in a stack
+def store_runs(name, kind):
+    return [store_file(name, kind, '*'), f'Data/Store/{name}/{kind}_stack.npy', f'Data/Store/{name}/{kind}_stack_runs.txt']
+
+# List-mode event file of each isotope, turned into its channel spectrum when present
+list_mode_files = {name: f'Data/Events_{name}.bin' for name in nucleus_names}
+
+# Extensions of the plot outputs, not produced in compute-only mode
+plot_extensions = ('.pdf', '.png')
+
+# Stages of the analysis: script (with optional arguments), input files and output files
+stages = {
+    **{f'ListModeIngest_{name}': {
+        'script': 'ListModeIngest.py',
+        'args': [events, name],
+        'inputs': [events],
+        'outputs': [f'Data/Datos_{name}_(canales).txt'],
+    } for name, events in list_mode_files.items()},
+    'AddErrorInCounts': {
+        'script': 'Data/AddErrorInCounts.py',
+        'inputs': ['Data/Datos_Fondo_(canales).txt'] + [f'Data/Datos_{name}_(canales).txt' for name in nucleus_names],
+        'outputs': ['Data/Data_Background_WithErrors_channel.txt'] + channel_files
+                   + [store_file(name, 'channel') for name in ['Background'] + nucleus_names],
+    },
+    'GainAlignment': {
+        'script': 'GainAlignment.py',
+        'inputs': store_runs('Cesio137', 'channel'),
+        'outputs': ['Data/Data_Cesio137_Aligned_channel.txt', store_file('Cesio137', 'channel', 'aligned')],
+    },
+    'CalculateCalibration': {
+        'script': 'CalculateCalibration.py',
+        'inputs': ['Data/Data_Cesio137_WithErrors_channel.txt'] + store_runs('Cesio137', 'channel'),
+        'outputs': ['Results/Cesio137_fitted_parameters.txt', 'Results/Cesio137_calculate_activity.txt',
+                    record_file('Cesio137', 'PeakFit'), record_file('Cesio137', 'Activity'),
+                    'Results/Cesio137_Fit.pdf'],
+    },
+    'CalculateActivityCs': {
+        'script': 'CalculateActivityCs.py',
+        'inputs': [record_file('Cesio137', 'Activity')],
+        'outputs': [record_file('Cesio137', 'Efficiency')],
+    },
+    'CalculateSlope': {
+        'script': 'Results/CalculateSlope.py',
+        'inputs': [record_file('Cesio137', 'PeakFit')],
+        'outputs': ['Results/Slope_fitted_parameters.txt', 'Results/energy_calibration.pdf', calibration_file,
+                    record_file('Detector', 'Calibration')],
+    },
+    'CreateDataEnergy': {
+        'script': 'Data/CreateDataEnergy.py',
+        'inputs': [record_file('Detector', 'Calibration'), calibration_file] + channel_files
+                  + [store_file(name, 'channel') for name in nucleus_names],
+        'outputs': energy_files + [store_file(name, 'energy') for name in nucleus_names],
+    },
+    'InterpolacionLineal': {
+        'script': 'InterpolacionLineal.py',
+        'inputs': ['ValoresInterpolacion.txt'] + energy_inputs(['Talio204']),
+        'outputs': ['TableValues.txt', 'TableValues_Np.txt', store_file('Talio204', 'table'), store_file('Talio204', 'momentum')],
+    },
+    'CurieCalibrationItemize': {
+        'script': 'CurieCalibrationItemize.py',
+        'inputs': ['TableValues.txt', store_file('Talio204', 'table')],
+        'outputs': ['Results/QBest_Values.txt', record_file('Talio204', 'QBest')],
+    },
+    'CurieCalibrationPlots': {
+        'script': 'CurieCalibrationPlots.py',
+        'inputs': ['TableValues.txt', record_file('Talio204', 'QBest')] + store_runs('Talio204', 'table'),
+        'outputs': ['Results/LinearFits_QValue.pdf', 'Results/Q_ValuesErrors.txt', record_file('Talio204', 'QValue')],
+    },
+    'MonteCarloErrors': {
+        'script': 'MonteCarloErrors.py',
+        'inputs': ['Data/Data_Cesio137_WithErrors_channel.txt', record_file('Cesio137', 'PeakFit'),
+                   'TableValues.txt', store_file('Talio204', 'table'), record_file('Talio204', 'QBest')]
+                  + [store_file('Cesio137', 'channel')] + energy_inputs(['Talio204']),
+        'outputs': ['Results/MonteCarlo_Errors.txt', record_file('Cesio137', 'PeakFitMC'),
+                    record_file('Talio204', 'QValueMC')],
+    },
+    'BetaShapeFit': {
+        'script': 'BetaShapeFit.py',
+        'inputs': ['Fermi_204Tl.txt', 'ValoresInterpolacion.txt', record_file('Cesio137', 'PeakFit')]
+                  + energy_inputs(['Talio204']),
+        'outputs': ['Results/QFold_Results.txt', record_file('Talio204', 'QFold')],
+    },
+    'DetectorResponse': {
+        'script': 'DetectorResponse.py',
+        'inputs': [record_file('Cesio137', 'PeakFit')] + energy_inputs(['Talio204']),
+        'outputs': ['Data/Data_Talio204_Unfolded_energy.txt', store_file('Talio204', 'unfolded')],
+    },
+    'BranchDecomposition': {
+        'script': 'BranchDecomposition.py',
+        'inputs': [record_file('Cesio137', 'PeakFit')]
+                  + energy_inputs([name for name, config in isotope_configs.items() if config['beta_branches']]),
+        'outputs': [f'Results/{name}_BranchResults.txt' for name, config in isotope_configs.items() if config['beta_branches']]
+                   + [record_file(name, 'Branches') for name, config in isotope_configs.items() if config['beta_branches']],
+    },
+    'CurieQPlot': {
+        'script': 'CurieQPlot.py',
+        'inputs': ['TableValues_Np.txt', store_file('Talio204', 'momentum'), record_file('Talio204', 'QValue'), 'Fermi_204Tl.txt'],
+        'outputs': ['Results/QCuriePlot.png'],
+    },
+    'PlotBothMethods': {
+        'script': 'PlotBothMethods.py',
+        'inputs': ['TableValues.txt', store_file('Talio204', 'table')],
+        'outputs': ['Results/BothKurieN(E)Plot.pdf'],
+    },
+    'PlotAllChannelSpectrumsNEW': {
+        'script': 'PlotAllChannelSpectrumsNEW.py',
+        'inputs': ['Data/Datos_Fondo_(canales).txt'] + [f'Data/Datos_{name}_(canales).txt' for name in nucleus_names],
+        'outputs': [f'Results/{name}_ChannelSpectreLog.png' for name in nucleus_names + ['BackGround']],
+    },
+    'PlotAllEnergySpectrumsNEW': {
+        'script': 'PlotAllEnergySpectrumsNEW.py',
+        'inputs': energy_inputs(nucleus_names),
+        'outputs': [f'Results/{name}_EnergySpectreLog.png' for name in nucleus_names],
+    },
+    'SpectrumEngine': {
+        'script': 'SpectrumEngine.py',
+        'inputs': energy_inputs(list(isotope_configs)),
+        'outputs': [f"Results/{name}{config['suffix']}{'Log' if config['use_log_scale'] else ''}.pdf"
+                    for name, config in isotope_configs.items()]
+                   + [f'Results/{name}_IntensityResults.txt' for name, config in isotope_configs.items() if config['energy_ranges']]
+                   + [record_file(name, 'Intensity') for name, config in isotope_configs.items() if config['energy_ranges']],
+    },
+}
+
+# SHA-256 of a file's contents, or None if the file does not exist
+def file_hash(path):
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Modules of the repository imported by a script, directly or through other modules.
+# A module is looked up next to the importing file, then in the repository root.
+def local_imports(script):
+    found, pending = set(), [script]
+    while pending:
+        path = pending.pop()
+        with open(path, 'r') as f:
+            tree = ast.parse(f.read(), filename=path)
+        names = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names.update(alias.name.split('.')[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+                names.add(node.module.split('.')[0])
+        for name in names:
+            for directory in (os.path.dirname(path), '.'):
+                module = os.path.normpath(os.path.join(directory, f'{name}.py'))
+                if os.path.exists(module):
+                    if module not in found and module != os.path.normpath(script):
+                        found.add(module)
+                        pending.append(module)
+                    break
+    return sorted(found)
+
+# Input files of a stage with the glob patterns expanded, leaving out the stage's own outputs
+def input_paths(stage):
+    paths = set()
+    for path in stage['inputs']:
+        paths.update(sorted(glob.glob(path)) if glob.has_magic(path) else [path])
+    return sorted(paths - set(stage['outputs']))
+
+# Hash of everything that determines a stage's outputs: its script and arguments,
+# the local modules it imports and its inputs
+def stage_signature(stage):
+    digest = hashlib.sha256()
+    digest.update(json.dumps(stage.get('args', [])).encode())
+    for path in [stage['script']] + local_imports(stage['script']) + input_paths(stage):
+        digest.update(path.encode())
+        digest.update(str(file_hash(path)).encode())
+    return digest.hexdigest()
+
+# Stages that produce at least one input of each stage (an input pattern depends on every output it matches)
+def stage_dependencies(stages):
+    producers = {output: name for name, stage in stages.items() for output in stage['outputs']}
+    return {name: sorted({producer for path in stage['inputs'] for output, producer in producers.items()
+                          if producer != name and (output == path or
+                                                   (glob.has_magic(path) and fnmatch.fnmatch(output, path)))})
+            for name, stage in stages.items()}
+
+# Stages needed to build the requested targets (all stages if none requested)
+def select_stages(targets, dependencies):
+    if not targets:
+        return set(dependencies)
+    selected = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(dependencies[name])
+    return selected
+
+# Load and save the hashes of the last successful runs
+def load_state():
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file, 'r') as f:
+        return json.load(f)
+
+def save_state(state):
+    with open(state_file, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+
+# Outputs a stage writes: only the numeric ones in compute-only mode
+def stage_outputs(stage, compute_only=False):
+    if not compute_only:
+        return stage['outputs']
+    return [path for path in stage['outputs'] if not path.endswith(plot_extensions)]
+
+# Decide whether a stage must run: new signature, outputs not recorded, deleted or modified.
+# An output the stage did not write on its last run (nothing to do, e.g. no list-mode file)
+# is recorded as missing and does not rerun it.
+def is_outdated(name, stage, state, compute_only=False):
+    record = state.get(name)
+    if record is None or record['signature'] != stage_signature(stage):
+        return True
+    return any(path not in record['outputs'] or file_hash(path) != record['outputs'][path]
+               for path in stage_outputs(stage, compute_only))
+
+# Run one stage script from the repository root with a non-interactive backend
+def run_stage(name, stage, compute_only=False):
+    env = dict(os.environ, MPLBACKEND='Agg')
+    if compute_only:
+        env['BETA_COMPUTE_ONLY'] = '1'
+    process = subprocess.run([sys.executable, stage['script']] + stage.get('args', []), env=env,
+                             capture_output=True, text=True)
+    return name, process
+
+# Run the selected stages in dependency order, in parallel where possible
+def run_pipeline(targets=None, jobs=None, force=False, dry_run=False, compute_only=False):
+    dependencies = stage_dependencies(stages)
+    selected = select_stages(targets, dependencies)
+    if compute_only:
+        # Stages that only make plots have nothing to do
+        selected = {name for name in selected if stage_outputs(stages[name], compute_only)}
+    state = {} if force else load_state()
+    saved_state = load_state()
+
+    done, failed, running = set(), set(), {}
+    summary = {'run': [], 'skipped': [], 'failed': []}
+
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+        while len(done) + len(failed) < len(selected):
+            progress = len(done) + len(failed) + len(running)
+            # Stages whose upstream stages all finished
+            for name in sorted(selected - done - failed - set(running.values())):
+                upstream = [dep for dep in dependencies[name] if dep in selected]
+                if any(dep in failed for dep in upstream):
+                    print(f"Skipping {name}: an upstream stage failed.")
+                    failed.add(name)
+                    summary['failed'].append(name)
+                elif all(dep in done for dep in upstream):
+                    # In a dry run, upstream stages that would run may change the inputs
+                    upstream_changed = dry_run and any(dep in summary['run'] for dep in upstream)
+                    if not upstream_changed and not is_outdated(name, stages[name], state, compute_only):
+                        print(f"{name} is up to date.")
+                        done.add(name)
+                        summary['skipped'].append(name)
+                    elif dry_run:
+                        print(f"{name} would run.")
+                        done.add(name)
+                        summary['run'].append(name)
+                    else:
+                        print(f"Running {name} ({stages[name]['script']})")
+                        running[executor.submit(run_stage, name, stages[name], compute_only)] = name
+
+            if not running:
+                # Nothing is running and this pass settled no stage: the rest can never run
+                if len(done) + len(failed) == progress:
+                    blocked = sorted(selected - done - failed)
+                    raise RuntimeError(f"Stages {', '.join(blocked)} are waiting for stages that will never finish "
+                                       f"(dependency cycle or upstream stage not selected).")
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, process = future.result()
+                del running[future]
+                if process.returncode != 0:
+                    print(f"Stage {name} failed:\n{process.stderr}")
+                    failed.add(name)
+                    summary['failed'].append(name)
+                    continue
+                done.add(name)
+                summary['run'].append(name)
+                # Record the hashes of this successful run
+                stage = stages[name]
+                saved_state[name] = state[name] = {
+                    'signature': stage_signature(stage),
+                    'outputs': {path: file_hash(path) for path in stage_outputs(stage, compute_only)},
+                }
+                save_state(saved_state)
+
+    return summary
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the analysis chain, rerunning only outdated stages")
+    parser.add_argument('targets', nargs='*', help="Stages to build (default: all)")
+    parser.add_argument('--jobs', type=int, default=None, help="Number of stages run in parallel")
+    parser.add_argument('--force', action='store_true', help="Rerun every selected stage")
+    parser.add_argument('--dry-run', action='store_true', help="Only report which stages would run")
+    parser.add_argument('--compute-only', action='store_true', help="Write only numeric results, no plots")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.targets if name not in stages]
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(unknown)}. Available: {', '.join(stages)}")
+
+    # Stage paths are relative to the repository root
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    summary = run_pipeline(args.targets, args.jobs, args.force, args.dry_run, args.compute_only)
+    print(f"Ran {len(summary['run'])}, up to date {len(summary['skipped'])}, failed {len(summary['failed'])}.")
@@ -1,17 +1,11 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.pylab as pylab
 import os
+from Plotting import exit_if_compute_only, pyplot
+from Decimation import decimate, point_budget
 
-# Configure parameters for plot appearance
-params = {
-    'xtick.labelsize': 17,    
-    'ytick.labelsize': 17,      
-    'axes.titlesize': 18,
-    'axes.labelsize': 18,
-    'legend.fontsize': 16
-}
-pylab.rcParams.update(params)
+# This script only makes plots: nothing to do in compute-only mode
+exit_if_compute_only("PlotAllChannelSpectrums")
+plt = pyplot()
 
 use_log_scale = False  # True for log scale, False for linear scale
 
@@ -30,7 +24,7 @@ os.makedirs(output_dir, exist_ok=True)
 # Function to plot channel spectrum
 def plot_spectrum(name, channel_number, net_counts):
     plt.figure(figsize=(10, 6))
-    plt.plot(channel_number, net_counts, label=name, color="black")
+    plt.plot(*decimate(channel_number, net_counts, point_budget((10, 6)), (0, 520)), label=name, color="black")
     plt.xlabel("Canal")
     plt.ylabel("Número de cuentas")
     plt.xlim(0, 520)
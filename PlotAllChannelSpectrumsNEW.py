@@ -1,20 +1,16 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.pylab as pylab
 import os
+from Plotting import exit_if_compute_only
+from RenderFarm import spectrum_spec, render_figures, report
 
-# Configure parameters for plot appearance
-params = {
-    'xtick.labelsize': 17,    
-    'ytick.labelsize': 17,      
-    'axes.titlesize': 18,
-    'axes.labelsize': 18,
-    'legend.fontsize': 16
-}
-pylab.rcParams.update(params)
+# This script only makes plots: nothing to do in compute-only mode
+exit_if_compute_only("PlotAllChannelSpectrumsNEW")
 
 use_log_scale = True  # True for log scale, False for linear scale
 
+# Also put every spectrum in one multi-page PDF (None for no combined file)
+combined_pdf = None  # e.g. './Results/AllChannelSpectra.pdf'
+
 # Names of nucleus isotopes
 nucleus_names = {"Cesio137", "Europio152", "Bario133", "Talio204"}
 
@@ -22,26 +18,16 @@ nucleus_names = {"Cesio137", "Europio152", "Bario133", "Talio204"}
 output_dir = './Results'
 os.makedirs(output_dir, exist_ok=True)
 
-# Function to plot channel spectrum
-def plot_spectrum(name, channel_number, net_counts):
-    plt.figure(figsize=(10, 6))
-    plt.plot(channel_number, net_counts, label=name, color="black")
-    plt.xlabel("Canal")
-    plt.ylabel("Número de cuentas")
-    plt.xlim(0, 520)
-    plt.legend()
-    #plt.title(f"Spectre for {name}")
+if use_log_scale:
+    suffix = '_ChannelSpectreLog.png'
+else:
+    suffix = '_ChannelSpectre.png'
 
-    if use_log_scale:
-        plt.semilogy()
-        suffix = '_ChannelSpectreLog.png'
-    else:
-        suffix = '_ChannelSpectre.png'
-    plt.savefig(os.path.join(output_dir, name + suffix))
-    plt.close()
+# Figures to render: output file -> pages
+jobs = {}
 
 # Process each nucleus
-for name in nucleus_names:
+for name in sorted(nucleus_names):
     file_path = f'./Data/Datos_{name}_(canales).txt'
     if not os.path.exists(file_path):
         print(f"File {file_path} does not exist. Skipping {name}.")
@@ -51,23 +37,19 @@ for name in nucleus_names:
     data_nucleus = np.loadtxt(file_path, skiprows=1)
     channel_number = data_nucleus[:, 0]
     nucleus_counts = data_nucleus[:, 1]
-    
-    # Plot spectrum
-    plot_spectrum(name, channel_number, nucleus_counts)
 
-# Plot background data
-data_fondo_canales = np.loadtxt('./Data/Datos_Fondo_(canales).txt', skiprows=1) 
+    # Spectrum figure
+    jobs[os.path.join(output_dir, name + suffix)] = [
+        spectrum_spec(channel_number, nucleus_counts, label=name, xlim=(0, 520), log_scale=use_log_scale)]
 
-# Plot spectre
-plt.figure(figsize=(10, 6))
-plt.plot(data_fondo_canales[:, 0], data_fondo_canales[:, 1], color="black")
+# Background spectrum
+data_fondo_canales = np.loadtxt('./Data/Datos_Fondo_(canales).txt', skiprows=1)
+jobs[os.path.join(output_dir, "BackGround" + suffix)] = [
+    spectrum_spec(data_fondo_canales[:, 0], data_fondo_canales[:, 1], ylabel="Numero de cuentas", log_scale=use_log_scale)]
 
-plt.xlabel("Canal")
-plt.ylabel("Numero de cuentas")
-if use_log_scale:
-    plt.semilogy()
-    suffix = '_ChannelSpectreLog.png'
-else:
-    suffix = '_ChannelSpectre.png'
-plt.savefig(os.path.join(output_dir, "BackGround" + suffix))
-plt.close()
\ No newline at end of file
+if combined_pdf:
+    jobs[combined_pdf] = [pages[0] for pages in jobs.values()]
+
+# Render the figures whose data or style changed (guarded for process start methods that re-import this script)
+if __name__ == '__main__':
+    report(*render_figures(jobs))
@@ -1,20 +1,26 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.pylab as pylab
 import os
+from Plotting import exit_if_compute_only
+from SpectrumStore import has_spectrum
+from EnergyCalibration import load_energy_spectrum
+from Rebinning import edges_from_centers, rebin
+from RenderFarm import spectrum_spec, render_figures, report
 
-# Configure parameters for plot appearance
-params = {
-    'xtick.labelsize': 17,    
-    'ytick.labelsize': 17,      
-    'axes.titlesize': 18,
-    'axes.labelsize': 18,
-    'legend.fontsize': 16
-}
-pylab.rcParams.update(params)
+# This script only makes plots: nothing to do in compute-only mode
+exit_if_compute_only("PlotAllEnergySpectrumsNEW")
 
 use_log_scale = True  # True for log scale, False for linear scale
 
+# Common energy grid (keV) all spectra are rebinned onto; None plots each on its own channel energies.
+# Off by default: the spectra plotted here share one calibration, so the grid would only resample
+# them. Set a step (e.g. 3, about one channel) to compare runs taken with different gains.
+# The intensity sums of SpectrumEngine.py switch to a common grid by themselves when the axes differ.
+energy_grid_step = None
+energy_grid_edges = np.arange(0, 1600 + energy_grid_step, energy_grid_step) if energy_grid_step else None
+
+# Also put every spectrum in one multi-page PDF (None for no combined file)
+combined_pdf = None  # e.g. './Results/AllEnergySpectra.pdf'
+
 # Names of nucleus isotopes
 nucleus_names = {"Cesio137", "Europio152", "Bario133", "Talio204"}
 
@@ -22,35 +28,39 @@ nucleus_names = {"Cesio137", "Europio152", "Bario133", "Talio204"}
 output_dir = './Results'
 os.makedirs(output_dir, exist_ok=True)
 
-# Function to plot channel spectrum
-def plot_spectrum(name, energy_number, net_counts):
-    plt.figure(figsize=(10, 6))
-    plt.plot(energy_number, net_counts, label=name, color="black")
-    plt.xlabel("Energia (keV)")
-    plt.ylabel("Número de cuentas")
-    plt.xlim(0, 1600)
-    plt.legend()
-    #plt.title(f"Spectre for {name}")
-
-    if use_log_scale:
-        plt.semilogy()
-        suffix = '_EnergySpectreLog.png'
-    else:
-        suffix = '_EnergySpectre.png'
-    plt.savefig(os.path.join(output_dir, name + suffix))
-    plt.close()
+if use_log_scale:
+    suffix = '_EnergySpectreLog.png'
+else:
+    suffix = '_EnergySpectre.png'
+
+# Figures to render: output file -> pages
+jobs = {}
 
 # Process each nucleus
-for name in nucleus_names:
+for name in sorted(nucleus_names):
     file_path = f'./Data/Data_{name}_WithErrors_energy.txt'
-    if not os.path.exists(file_path):
+    if not has_spectrum(name, "energy", text_file=file_path) and not has_spectrum(name, "channel"):
         print(f"File {file_path} does not exist. Skipping {name}.")
         continue
 
     # Load data for the nucleus
-    data_nucleus = np.loadtxt(file_path, skiprows=1)
+    data_nucleus = load_energy_spectrum(name, text_file=file_path)
     energy = data_nucleus[:, 3]
     counts = data_nucleus[:, 1]
-    
-    # Plot spectrum
-    plot_spectrum(name, energy, counts)
+
+    # Redistribute the counts onto the common energy grid
+    if energy_grid_edges is not None:
+        counts, _ = rebin(counts, data_nucleus[:, 2]**2, edges_from_centers(energy), energy_grid_edges)
+        counts = counts[0]
+        energy = 0.5 * (energy_grid_edges[1:] + energy_grid_edges[:-1])
+
+    # Spectrum figure
+    jobs[os.path.join(output_dir, name + suffix)] = [
+        spectrum_spec(energy, counts, label=name, xlabel="Energia (keV)", xlim=(0, 1600), log_scale=use_log_scale)]
+
+if combined_pdf:
+    jobs[combined_pdf] = [pages[0] for pages in jobs.values()]
+
+# Render the figures whose data or style changed (guarded for process start methods that re-import this script)
+if __name__ == '__main__':
+    report(*render_figures(jobs))
@@ -1,17 +1,11 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.pylab as pylab
 import os
+from Plotting import exit_if_compute_only, pyplot
+from SpectrumStore import load_spectrum
 
-# Set parameters for plot appearance
-params = {
-    'xtick.labelsize': 17,    
-    'ytick.labelsize': 17,      
-    'axes.titlesize': 18,
-    'axes.labelsize': 18,
-    'legend.fontsize': 16
-}
-pylab.rcParams.update(params)
+# This script only makes plots: nothing to do in compute-only mode
+exit_if_compute_only("PlotBothMethods")
+plt = pyplot()
 
 output_dir = './Resultados'
 os.makedirs(output_dir, exist_ok=True)  # Create the output directory if it doesn't exist
@@ -22,7 +16,7 @@ output_plot = './Results/BothKurieN(E)Plot.pdf'
 
 # Load data from the file
 try:
-    data = np.loadtxt(input_file, skiprows=1)  # Skip the header row
+    data = load_spectrum("Talio204", "table", text_file=input_file)  # From the store, else the text table
     channel, N_E, W, P, G_ZW, value, energy_mev = data.T  # Transpose to extract columns
 except Exception as e:
     print(f"Error loading data from {input_file}: {e}")
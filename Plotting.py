@@ -0,0 +1,68 @@
+import os
+import sys
+
+# Plotting mode shared by the analysis scripts.
+# In compute-only mode (BETA_COMPUTE_ONLY=1 or --no-plots) matplotlib is never
+# imported and the scripts write only their numeric results. Otherwise
+# matplotlib is imported on first use and styled once. It uses the Agg
+# backend unless the plots are to be shown (BETA_SHOW_PLOTS=1 or --show), so
+# a batch job never waits on a display.
+
+# Configure parameters for plot appearance
+params = {
+    'xtick.labelsize': 17,
+    'ytick.labelsize': 17,
+    'axes.titlesize': 18,
+    'axes.labelsize': 18,
+    'legend.fontsize': 16
+}
+
+# Modes set from code (None: read the environment and the command line)
+_modes = {'compute_only': None, 'show': None}
+
+# matplotlib.pyplot once imported
+_pyplot = None
+
+# A flag is on if set from code, in the environment or on the command line
+def _flag(mode, variable, option):
+    if _modes[mode] is not None:
+        return _modes[mode]
+    return os.environ.get(variable, '0') not in ('', '0') or option in sys.argv[1:]
+
+# Set the modes from code (e.g. from a script's own argument parser)
+def set_mode(compute_only=None, show=None):
+    _modes['compute_only'] = compute_only
+    _modes['show'] = show
+
+def compute_only():
+    return _flag('compute_only', 'BETA_COMPUTE_ONLY', '--no-plots')
+
+def show_enabled():
+    return not compute_only() and _flag('show', 'BETA_SHOW_PLOTS', '--show')
+
+# matplotlib.pyplot, imported and styled on first use
+def pyplot():
+    global _pyplot
+    if compute_only():
+        raise RuntimeError("Plotting requested in compute-only mode")
+    if _pyplot is None:
+        import matplotlib
+        if not show_enabled():
+            matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        plt.rcParams.update(params)
+        _pyplot = plt
+    return _pyplot
+
+# Show the open figures only when asked to; closes them otherwise
+def show():
+    if show_enabled():
+        pyplot().show()
+    elif _pyplot is not None:
+        _pyplot.close('all')
+
+# Stop a script that only makes plots
+def exit_if_compute_only(name):
+    if compute_only():
+        print(f"Compute-only mode: {name} makes only plots. Skipping.")
+        sys.exit(0)
@@ -0,0 +1,197 @@
+import numpy as np
+from ResultsStore import save_record, get_values
+from SpectrumStore import default_run
+
+# Closed-form engine for straight-line fits over many energy windows.
+# Cumulative sums of w, w*x, w*y, w*x^2, w*x*y and w*y^2 are built once per
+# data set, so the weighted least-squares fit of any window [i0, i1) costs
+# a handful of array operations and every window is evaluated at once.
+
+# Names of the accumulated columns, in the order stored in the prefix table
+sum_names = ('S', 'Sx', 'Sy', 'Sxx', 'Sxy', 'Syy')
+
+# Build the prefix-sum table for the data (x, y) with optional weights 1/sigma^2.
+# y may be a stack (K, n) of data sets sharing x: the sums then have shape
+# (6, K, n + 1) and window_fit returns one fit per data set.
+def build_prefix_sums(x, y, weights=None):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if weights is None:
+        weights = np.ones_like(x)
+    weights = np.asarray(weights, dtype=float)
+
+    # Shift to the weighted mean so the differences of large sums stay accurate
+    total_weight = np.sum(weights, axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x0 = np.where(total_weight > 0, np.sum(weights * x, axis=-1) / total_weight, 0.0)
+        y0 = np.where(total_weight > 0, np.sum(weights * y, axis=-1) / total_weight, 0.0)
+    dx = x - x0[..., None]
+    dy = y - y0[..., None]
+
+    terms = np.stack(np.broadcast_arrays(weights, weights * dx, weights * dy,
+                                         weights * dx**2, weights * dx * dy, weights * dy**2))
+    sums = np.zeros(terms.shape[:-1] + (terms.shape[-1] + 1,))
+    np.cumsum(terms, axis=-1, out=sums[..., 1:])
+
+    return {'x': x, 'sums': sums, 'x0': x0, 'y0': y0}
+
+# Convert energy limits into index windows with the same semantics as the mask
+# (x >= min_val) & (x <= max_val) on ascending x
+def window_indices(x, min_values, max_values):
+    start = np.searchsorted(x, min_values, side='left')
+    stop = np.searchsorted(x, max_values, side='right')
+    return start, stop
+
+# Weighted linear fit y = a * x + b over the index windows [start, stop).
+# start and stop broadcast against each other; every output has their shape
+# (preceded by the data-set axis for a stack).
+# Parameter errors follow curve_fit with absolute_sigma=False (scaled by chi2/dof).
+def window_fit(prefix, start, stop):
+    start = np.asarray(start)
+    stop = np.asarray(stop)
+    sums = prefix['sums']
+    S, Sx, Sy, Sxx, Sxy, Syy = sums[..., stop] - sums[..., start]
+    n = np.maximum(stop - start, 0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        det = S * Sxx - Sx**2
+        slope = (S * Sxy - Sx * Sy) / det
+        shifted_intercept = (Sxx * Sy - Sx * Sxy) / det
+
+        # Residual sum of squares of the fitted line
+        chi2 = np.maximum(Syy - slope * Sxy - shifted_intercept * Sy, 0)
+        dof = n - 2
+        scale = np.where(dof > 0, chi2 / dof, np.nan)
+
+        var_slope = S / det * scale
+        var_shifted = Sxx / det * scale
+        cov_shifted = -Sx / det * scale
+
+        # Back to the original frame: b = b' + y0 - a * x0
+        extra_axes = (1,) * np.broadcast(start, stop).ndim
+        x0 = np.reshape(prefix['x0'], np.shape(prefix['x0']) + extra_axes)
+        y0 = np.reshape(prefix['y0'], np.shape(prefix['y0']) + extra_axes)
+        intercept = shifted_intercept + y0 - slope * x0
+        var_intercept = var_shifted + x0**2 * var_slope - 2 * x0 * cov_shifted
+        covariance = cov_shifted - x0 * var_slope
+
+        # Intersection with the x-axis (Q value)
+        Q_value = -intercept / slope
+
+    invalid = (n < 3) | ~(det > 0)
+    results = {
+        'slope': slope,
+        'intercept': intercept,
+        'slope_err': np.sqrt(np.abs(var_slope)),
+        'intercept_err': np.sqrt(np.abs(var_intercept)),
+        'covariance': covariance,
+        'Q': Q_value,
+        'chi2': chi2,
+        'n': n,
+    }
+    for key in results:
+        if key != 'n':
+            results[key] = np.where(invalid, np.nan, results[key])
+    return results
+
+# Fit every (min_val, max_val) combination of the two energy grids.
+# Outputs have shape (len(min_values), len(max_values)).
+def scan_energy_windows(x, y, min_values, max_values, weights=None):
+    prefix = build_prefix_sums(x, y, weights)
+    start, stop = window_indices(prefix['x'], np.asarray(min_values), np.asarray(max_values))
+    results = window_fit(prefix, start[:, None], stop[None, :])
+    results['min'] = np.broadcast_to(np.asarray(min_values, dtype=float)[:, None], results['n'].shape)
+    results['max'] = np.broadcast_to(np.asarray(max_values, dtype=float)[None, :], results['n'].shape)
+    return results
+
+# Energy grid built the same way as the original nested np.arange loops
+def energy_grid(value_range, step):
+    return np.arange(value_range[0], value_range[1] + step, step)
+
+# Fit every channel-pair window with at least min_points channels.
+# Rows of start channels are processed in chunks to bound memory on large
+# spectra; each chunk yields (start, results) with results[key][k, j] the fit
+# over channels [start[k], j).
+def iter_channel_windows(prefix, min_points=3, rows_per_chunk=256):
+    n_channels = prefix['x'].size
+    stop = np.arange(n_channels + 1)
+    for first in range(0, n_channels, rows_per_chunk):
+        start = np.arange(first, min(first + rows_per_chunk, n_channels))
+        results = window_fit(prefix, start[:, None], stop[None, :])
+        too_short = (stop[None, :] - start[:, None]) < min_points
+        for key in results:
+            if key != 'n':
+                results[key][too_short] = np.nan
+        yield start, results
+
+# Q of the index windows [start, stop) only, with in-place operations.
+# Cheaper than window_fit when scanning every channel pair of a large spectrum.
+# For a stack, the output is preceded by the data-set axes as in window_fit.
+def window_Q(prefix, start, stop):
+    sums = prefix['sums']
+    S, Sx, Sy, Sxx, Sxy = (sums[k][..., stop] - sums[k][..., start] for k in range(5))
+    extra_axes = (1,) * np.broadcast(start, stop).ndim
+    x0 = np.reshape(prefix['x0'], np.shape(prefix['x0']) + extra_axes)
+    y0 = np.reshape(prefix['y0'], np.shape(prefix['y0']) + extra_axes)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        det = S * Sxx
+        det -= Sx * Sx
+        slope_num = S * Sxy
+        slope_num -= Sx * Sy
+        # Q = x0 - (b' + y0) / a = x0 - (b' * det + y0 * det) / (a * det)
+        Q_value = Sxx * Sy
+        Q_value -= Sx * Sxy
+        Q_value += y0 * det
+        Q_value /= slope_num
+        np.subtract(x0, Q_value, out=Q_value)
+    Q_value[~(det > 0)] = np.nan
+    return Q_value
+
+# Find the channel window whose Q is closest to target_Q, breaking ties by the
+# smallest slope error. Returns (start, stop, results of that window).
+# Every channel pair is evaluated, so the cost grows with the square of the
+# number of channels: about 20 ms for 512 channels, 0.5 s for 4096 and 8 s
+# for 16384 (1.3e8 windows) on one core. Q is not monotonic in the window
+# limits, so there is no bound that would let whole chunks be skipped.
+def best_channel_window(prefix, target_Q, min_points=3, rows_per_chunk=256):
+    n_channels = prefix['x'].size
+    best = None
+    best_key = (np.inf, np.inf)
+    for first in range(0, n_channels - min_points + 1, rows_per_chunk):
+        # Only stops that can close a window for some start of this chunk
+        start = np.arange(first, min(first + rows_per_chunk, n_channels))[:, None]
+        stop = np.arange(first + min_points, n_channels + 1)[None, :]
+        Q_error = np.abs(window_Q(prefix, start, stop) - target_Q)
+        Q_error[(stop - start) < min_points] = np.nan
+        if np.all(np.isnan(Q_error)):
+            continue
+
+        # Slope errors are only needed to break ties on the closest Q
+        rows, cols = np.nonzero(Q_error == np.nanmin(Q_error))
+        results = window_fit(prefix, start[rows, 0], stop[0, cols])
+        pick = np.lexsort((results['slope_err'], np.abs(results['Q'] - target_Q)))[0]
+        key = (abs(results['Q'][pick] - target_Q), results['slope_err'][pick])
+        if key < best_key:
+            best_key = key
+            best = (start[rows[pick], 0], stop[0, cols[pick]], {k: v[pick] for k, v in results.items()})
+    return best
+
+# Save the best window of each fit type to the results store (stage 'QBest').
+# best_combinations: {fit_type: (min, max, Q, slope_err)}. The window limits
+# are grid values, rounded to drop the floating-point noise of the grid.
+def save_best_windows(isotope, best_combinations, run=default_run):
+    values, units = {}, {}
+    for fit_type, (min_val, max_val, Q_value, slope_err) in best_combinations.items():
+        values[f'{fit_type}.min'] = round(float(min_val), 6)
+        values[f'{fit_type}.max'] = round(float(max_val), 6)
+        values[f'{fit_type}.Q'] = Q_value
+        values[f'{fit_type}.slope_err'] = slope_err
+        units.update({f'{fit_type}.min': 'MeV', f'{fit_type}.max': 'MeV', f'{fit_type}.Q': 'MeV'})
+    return save_record(isotope, 'QBest', values, units=units, run=run)
+
+# Best window of each fit type from the results store: {fit_type: (min, max, Q)}
+def load_best_windows(isotope, run=default_run):
+    values = get_values(isotope, 'QBest', run)
+    fit_types = [name[:-len('.min')] for name in values if name.endswith('.min')]
+    return {fit_type: (values[f'{fit_type}.min'], values[f'{fit_type}.max'], values[f'{fit_type}.Q'])
+            for fit_type in fit_types}
@@ -0,0 +1,74 @@
+import numpy as np
+
+# Region-of-interest (ROI) integration through cumulative sums.
+# The index stores, for every spectrum, the cumulative counts and the
+# cumulative variance along its (increasing) energy axis. The counts of any
+# energy range are then the difference of two entries, so M ROIs over N
+# spectra cost two searchsorted calls and a few array operations.
+
+# searchsorted of values in each row of sorted_rows.
+# sorted_rows: (N, C) increasing along each row; values: (M,) -> (N, M)
+def batched_searchsorted(sorted_rows, values, side='left'):
+    sorted_rows = np.atleast_2d(sorted_rows)
+    values = np.asarray(values, dtype=float)
+    n_rows, n_columns = sorted_rows.shape
+    if n_rows == 1:
+        return np.searchsorted(sorted_rows[0], values, side=side)[None, :]
+
+    # Shift each row into its own range so one searchsorted covers the stack
+    low = min(sorted_rows.min(), values.min())
+    span = max(sorted_rows.max(), values.max()) - low + 1
+    shift = (np.arange(n_rows) * span)[:, None]
+    flat_rows = (sorted_rows - low + shift).ravel()
+    index = np.searchsorted(flat_rows, values[None, :] - low + shift, side=side)
+    return index - np.arange(n_rows)[:, None] * n_columns
+
+# Build the index of a stack of spectra.
+# energy: (C,) shared axis or (N, C); counts, errors: (N, C) or (C,)
+def build_roi_index(energy, counts, errors=None):
+    counts = np.atleast_2d(np.asarray(counts, dtype=float))
+    errors = np.sqrt(np.maximum(counts, 0)) if errors is None else np.atleast_2d(np.asarray(errors, dtype=float))
+    n_spectra, n_channels = counts.shape
+
+    cumulative_counts = np.zeros((n_spectra, n_channels + 1))
+    np.cumsum(counts, axis=1, out=cumulative_counts[:, 1:])
+    cumulative_variance = np.zeros((n_spectra, n_channels + 1))
+    np.cumsum(errors**2, axis=1, out=cumulative_variance[:, 1:])
+
+    return {
+        'energy': np.atleast_2d(np.asarray(energy, dtype=float)),
+        'counts': cumulative_counts,
+        'variance': cumulative_variance,
+    }
+
+# Counts, uncertainties and intensity fractions of M ROIs in every spectrum.
+# ROI k covers roi_min[k] <= energy <= roi_max[k], like the boolean masks of
+# the PlotSpectrum scripts. Every output has shape (N, M).
+def query_rois(index, roi_min, roi_max):
+    roi_min = np.atleast_1d(np.asarray(roi_min, dtype=float))
+    roi_max = np.atleast_1d(np.asarray(roi_max, dtype=float))
+    n_spectra = index['counts'].shape[0]
+    rows = np.arange(n_spectra)[:, None]
+
+    start = np.broadcast_to(batched_searchsorted(index['energy'], roi_min, 'left'), (n_spectra, roi_min.size))
+    stop = np.broadcast_to(batched_searchsorted(index['energy'], roi_max, 'right'), (n_spectra, roi_max.size))
+    stop = np.maximum(stop, start)
+
+    counts = index['counts'][rows, stop] - index['counts'][rows, start]
+    variance = index['variance'][rows, stop] - index['variance'][rows, start]
+    total_counts = index['counts'][:, -1:]
+    total_variance = index['variance'][:, -1:]
+
+    # Intensity I = A / T with A part of T: var(I) = ((T - A)^2 var(A) + A^2 var(T - A)) / T^4
+    with np.errstate(divide='ignore', invalid='ignore'):
+        intensity = counts / total_counts
+        intensity_variance = ((total_counts - counts)**2 * variance
+                              + counts**2 * (total_variance - variance)) / total_counts**4
+
+    return {
+        'counts': counts,
+        'error': np.sqrt(variance),
+        'intensity': intensity,
+        'intensity_error': np.sqrt(np.maximum(intensity_variance, 0)),
+        'total_counts': total_counts[:, 0],
+    }
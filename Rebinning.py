@@ -0,0 +1,88 @@
+import numpy as np
+from ROIIndex import batched_searchsorted
+
+# Flux-conserving rebinning of spectra onto a common energy grid.
+# Counts in each source bin are assumed uniform across the bin and are
+# redistributed to the target bins by exact fractional overlap. A whole stack
+# of spectra, each with its own bin edges (e.g. its own gain), is rebinned in
+# one vectorized pass.
+
+# Energy edges of channel bins: channel i spans [i - 0.5, i + 0.5]
+def channel_edges(n_channels):
+    return np.arange(n_channels + 1) - 0.5
+
+# Bin edges from increasing bin centers (midpoints, ends extrapolated)
+def edges_from_centers(centers):
+    centers = np.asarray(centers, dtype=float)
+    middle = 0.5 * (centers[..., 1:] + centers[..., :-1])
+    first = 2 * centers[..., :1] - middle[..., :1]
+    last = 2 * centers[..., -1:] - middle[..., -1:]
+    return np.concatenate((first, middle, last), axis=-1)
+
+# Energy edges of the channel bins of one or several calibrations -> (N, C + 1)
+def energy_edges(calibrations, n_channels):
+    edges = channel_edges(n_channels)
+    return np.stack([calibration.evaluate(edges) for calibration in np.atleast_1d(calibrations)])
+
+# Fractional source-bin position of each target edge, for every spectrum.
+# source_edges: (N, C + 1) increasing; target_edges: (M + 1,) -> (N, M + 1) in [0, C]
+def fractional_positions(source_edges, target_edges):
+    n_spectra, n_edges = source_edges.shape
+    n_bins = n_edges - 1
+
+    index = batched_searchsorted(source_edges, target_edges, side='right') - 1
+    index = np.clip(index, 0, n_bins - 1)
+
+    rows = np.arange(n_spectra)[:, None]
+    left = source_edges[rows, index]
+    right = source_edges[rows, index + 1]
+    position = index + (target_edges[None, :] - left) / (right - left)
+    return np.clip(position, 0, n_bins)
+
+# Rebin counts (N, C) with variances (N, C) from source_edges ((C + 1,) or
+# (N, C + 1)) onto target_edges (M + 1,). Returns counts and variances (N, M).
+# The variance of each target bin is sum_i f_i^2 * var_i over the source bins
+# i it overlaps with fractions f_i (uncorrelated source bins).
+def rebin(counts, variances, source_edges, target_edges):
+    counts = np.atleast_2d(np.asarray(counts, dtype=float))
+    variances = np.atleast_2d(np.asarray(variances, dtype=float))
+    target_edges = np.asarray(target_edges, dtype=float)
+    source_edges = np.broadcast_to(np.asarray(source_edges, dtype=float), (counts.shape[0], counts.shape[1] + 1))
+    n_spectra, n_bins = counts.shape
+    rows = np.arange(n_spectra)[:, None]
+
+    position = fractional_positions(source_edges, target_edges)
+    bin_index = np.minimum(np.floor(position).astype(int), n_bins - 1)
+    fraction = position - bin_index
+
+    # Counts: differences of the cumulative counts at the target edges
+    cumulative = np.zeros((n_spectra, n_bins + 1))
+    np.cumsum(counts, axis=1, out=cumulative[:, 1:])
+    edge_counts = cumulative[rows, bin_index] + fraction * counts[rows, bin_index]
+    new_counts = np.diff(edge_counts, axis=1)
+
+    # Variances: partial first and last source bins weighted by their fraction squared
+    padded = np.zeros((n_spectra, n_bins + 1))
+    padded[:, :n_bins] = variances
+    cumulative_variance = np.zeros((n_spectra, n_bins + 2))
+    np.cumsum(padded, axis=1, out=cumulative_variance[:, 1:])
+
+    lo, hi = bin_index[:, :-1], bin_index[:, 1:]
+    p_lo, p_hi = position[:, :-1], position[:, 1:]
+    hi_fraction = np.where(p_hi >= n_bins, 1.0, p_hi - hi)
+    same_bin = lo == hi
+    inside = (p_hi - p_lo)**2 * padded[rows, lo]
+    spanning = ((lo + 1 - p_lo)**2 * padded[rows, lo]
+                + np.maximum(cumulative_variance[rows, hi] - cumulative_variance[rows, lo + 1], 0)
+                + hi_fraction**2 * padded[rows, hi])
+    new_variances = np.where(same_bin, inside, spanning)
+
+    return new_counts, new_variances
+
+# Rebin a stack of channel spectra with their calibrations onto an energy grid (keV).
+# counts, errors: (N, C); calibrations: one per spectrum or a single shared one.
+def rebin_to_energy_grid(counts, errors, calibrations, grid_edges):
+    counts = np.atleast_2d(counts)
+    edges = energy_edges(calibrations, counts.shape[1])
+    new_counts, new_variances = rebin(counts, np.atleast_2d(errors)**2, edges, grid_edges)
+    return new_counts, np.sqrt(new_variances)
@@ -0,0 +1,185 @@
+import os
+import json
+import hashlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from Plotting import params, compute_only, show_enabled, set_mode, pyplot, show
+from Decimation import decimate, point_budget
+
+# Figure rendering for the plot scripts.
+# Each figure is described by a spec (data arrays plus plot configuration)
+# and keyed on a hash of the data, the configuration, the shared rcParams and
+# the source of the drawing code. A figure whose output exists with the same key is
+# skipped; the others are drawn in a process pool. A job with several specs
+# writes one multi-page PDF.
+
+# Directory with the key of every rendered output
+cache_dir = './Results/.render_cache'
+
+# Modules whose source changes the drawn figures
+drawing_sources = [os.path.abspath(__file__)] + [os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+                                                 for name in ('Decimation.py', 'Plotting.py')]
+
+# Default plot configuration of a spectrum figure
+default_config = {
+    'label': None,          # legend label (no legend if None)
+    'xlabel': "Canal",
+    'ylabel': "Número de cuentas",
+    'xlim': None,
+    'log_scale': False,
+    'linewidth': None,
+    'annotations': [],      # (x_value, "label") arrows
+    'figsize': (10, 6),
+    'decimation': 'minmax', # 'minmax', 'lttb' or None to plot every point
+    'max_points': None,     # point budget (None: two points per pixel of width)
+}
+
+# Spec of a spectrum figure: y against x with the given configuration
+def spectrum_spec(x, y, **config):
+    unknown = set(config) - set(default_config)
+    if unknown:
+        raise ValueError(f"Unknown plot options: {', '.join(sorted(unknown))}")
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    return {'x': x, 'y': y, 'data_key': data_key(x, y), 'config': dict(default_config, **config)}
+
+# Hash of the data of a spec, shared by the job key and the decimation cache
+def data_key(x, y):
+    digest = hashlib.sha256()
+    for values in (x, y):
+        digest.update(str(values.shape).encode())
+        digest.update(np.ascontiguousarray(values).tobytes())
+    return digest.hexdigest()
+
+# Hash of the drawing code, so a change in it redraws every figure
+def _source_hash():
+    digest = hashlib.sha256()
+    for path in drawing_sources:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+# Key of an output from its pages: data, configuration, style and drawing code
+def job_key(pages, source_hash=None):
+    digest = hashlib.sha256()
+    digest.update((source_hash or _source_hash()).encode())
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    for spec in pages:
+        digest.update(json.dumps(spec['config'], sort_keys=True, default=list).encode())
+        digest.update(spec['data_key'].encode())
+    return digest.hexdigest()
+
+# File holding the key of an output
+def key_path(output):
+    name = os.path.normpath(output).replace(os.sep, '_').lstrip('._')
+    return os.path.join(cache_dir, name + '.key')
+
+def stored_key(output):
+    path = key_path(output)
+    if not os.path.exists(path) or not os.path.exists(output):
+        return None
+    with open(path, 'r') as f:
+        return f.read().strip()
+
+def store_key(output, key):
+    os.makedirs(cache_dir, exist_ok=True)
+    temporary = key_path(output) + f'.{os.getpid()}.tmp'
+    with open(temporary, 'w') as f:
+        f.write(key)
+    os.replace(temporary, key_path(output))
+
+# Draw one spectrum figure and return it
+def draw_spectrum(plt, spec):
+    config = spec['config']
+    x, y = spec['x'], spec['y']
+    figure = plt.figure(figsize=config['figsize'])
+    style = {} if config['linewidth'] is None else {'linewidth': config['linewidth']}
+    max_points = config['max_points'] or point_budget(config['figsize'])
+    x_plot, y_plot = decimate(x, y, max_points, config['xlim'], config['decimation'], spec['data_key'])
+    plt.plot(x_plot, y_plot, label=config['label'], color="black", **style)
+    plt.xlabel(config['xlabel'])
+    plt.ylabel(config['ylabel'])
+    if config['xlim'] is not None:
+        plt.xlim(*config['xlim'])
+    if config['label'] is not None:
+        plt.legend()
+
+    # Add annotations
+    for x_value, label in config['annotations']:
+        # Count value at the point closest to the specified position
+        y_value = y[np.abs(x - x_value).argmin()]
+
+        # Annotate with arrow pointing to the specified positions
+        plt.annotate(
+            label,
+            xy=(x_value, y_value),  # Arrow ends here
+            xytext=(x_value + 50, y_value + 1000),  # Arrow starts here
+            arrowprops=dict(
+                arrowstyle="->",  # Arrow style
+                color="blue",
+                connectionstyle="arc3,rad=0.2"  # Slightly curved arrow
+            ),
+            fontsize=14,
+            color='blue'
+        )
+
+    if config['log_scale']:
+        plt.semilogy()
+    return figure
+
+# Render one output: a single figure, or a multi-page PDF when there are several pages.
+# With close=False the figures stay open (to be shown after saving).
+def render_job(output, pages, close=True):
+    plt = pyplot()
+    if len(pages) == 1:
+        figure = draw_spectrum(plt, pages[0])
+        figure.savefig(output)
+        if close:
+            plt.close(figure)
+        return output
+
+    from matplotlib.backends.backend_pdf import PdfPages
+    with PdfPages(output) as pdf:
+        for spec in pages:
+            figure = draw_spectrum(plt, spec)
+            pdf.savefig(figure)
+            if close:
+                plt.close(figure)
+    return output
+
+# Render the outputs of jobs {output: [spec, ...]} that changed since their last rendering.
+# Returns the rendered and the skipped outputs.
+def render_figures(jobs, workers=None, force=False):
+    if compute_only() or not jobs:
+        return [], []
+
+    source_hash = _source_hash()
+    keys = {output: job_key(pages, source_hash) for output, pages in jobs.items()}
+    stale = [output for output in jobs if force or stored_key(output) != keys[output]]
+    skipped = [output for output in jobs if output not in stale]
+
+    for output in jobs:
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    if show_enabled():
+        # Figures to be shown are drawn once in this process, every one of them, and saved before showing
+        stale, skipped = list(jobs), []
+        for output in stale:
+            render_job(output, jobs[output], close=False)
+        show()
+    elif len(stale) == 1:
+        render_job(stale[0], jobs[stale[0]])
+    elif stale:
+        # Workers never show figures, whatever the command line of this process
+        with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(stale)),
+                                 initializer=set_mode, initargs=(None, False)) as executor:
+            list(executor.map(render_job, stale, [jobs[output] for output in stale]))
+
+    for output in stale:
+        store_key(output, keys[output])
+    return stale, skipped
+
+# Print a summary of a rendering
+def report(rendered, skipped):
+    for output in rendered:
+        print(f"Plot saved as {output}")
+    if skipped:
+        print(f"{len(skipped)} unchanged figures skipped.")
@@ -1,96 +1,88 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.pylab as pylab
 import os
-from scipy.optimize import curve_fit
+import sys
 
-# Configure parameters for plot appearance
-params = {
-    'xtick.labelsize': 17,    
-    'ytick.labelsize': 17,      
-    'axes.titlesize': 18,
-    'axes.labelsize': 18,
-    'legend.fontsize': 16
-}
-pylab.rcParams.update(params)
+# Make the modules in the repository root importable
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from EnergyCalibration import EnergyCalibration, calibration_file
+from Plotting import compute_only, pyplot
+from ResultsStore import save_record, has_record, get_parameter, detector
 
-# Linear function definition
-def linear_func(x, m, c):
-    return m * x + c
-
-# Input and output file paths
-input_file = './Results/Cesio137_fitted_parameters.txt'
+# Isotopes whose fitted peak (PeakFit results) enters the calibration
+calibration_peaks = ['Cesio137']
 output_plot = './Results/energy_calibration.pdf'
 
-# Function to read the xc, its error, and energy from the file
-def read_parameters(file_path):
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
-    
-    xc = None
-    xc_err = None
-    energy = None
-
-    # Parse lines to extract values
-    for line in lines:
-        if "xc (peak center)" in line:
-            xc = float(line.split(':')[1].split('+-')[0].strip())
-            xc_err = float(line.split('+-')[1].split()[0].strip())
-        if "Gaussian peak energy" in line:
-            energy = float(line.split(':')[1].split()[0])
-    
-    # Check for missing values
-    if xc is None or xc_err is None or energy is None:
-        raise ValueError("Failed to extract xc, xc_err, or energy from the file.")
-    
-    return xc, xc_err, energy
+# Calibration model ('linear' or 'quadratic'); with a single peak the line goes through the origin
+calibration_model = 'linear'
+through_origin = len(calibration_peaks) < 2
 
-# Check if the input file exists
-if not os.path.exists(input_file):
-    print(f"Input file {input_file} does not exist.")
+# Check that every peak has been fitted
+missing = [name for name in calibration_peaks if not has_record(name, 'PeakFit')]
+if missing:
+    print(f"No fitted peak for {missing[0]} in the results store. Run CalculateCalibration.py first.")
 else:
     try:
-        # Extract xc, its error, and energy
-        xc, xc_error, energy = read_parameters(input_file)
+        # Centroid xc, its error, and energy of every peak
+        xc, xc_error = np.array([get_parameter(name, 'PeakFit', 'xc') for name in calibration_peaks]).T
+        energy = np.array([get_parameter(name, 'PeakFit', 'Energy')[0] for name in calibration_peaks])
 
-        # Include the origin (0, 0) in the calibration
-        channels = np.array([0, xc])  # Channels: [0, xc]
-        energies = np.array([0, energy])  # Energies: [0, energy]
-        errors = np.array([0, xc_error])  # Errors: [0, xc_error]
+        # Fit the calibration through every peak (and the origin if requested)
+        calibration = EnergyCalibration.fit(xc, energy, channel_errors=xc_error,
+                                            model=calibration_model, through_origin=through_origin)
+        calibration.save(calibration_file)
+        # Slope at the fitted peak: the energy per channel where the calibration is anchored
+        # (the same everywhere for the linear model)
+        slope_channel = float(xc[0])
+        slope = float(calibration.slope(slope_channel))
 
-        # Perform linear fit
-        popt, pcov = curve_fit(linear_func, channels, energies)
-        slope, intercept = popt
-        slope_err, intercept_err = np.sqrt(np.diag(pcov))
+        # Plot the calibration (skipped in compute-only mode)
+        if not compute_only():
+            plt = pyplot()
 
-        # Generate fitted line for plotting
-        channel_range = np.linspace(0, xc * 1.5, 500)  # Generate a range of channels
-        fitted_energies = linear_func(channel_range, slope, intercept)
+            # Points shown in the plot, including the origin when it is fixed
+            channels = np.concatenate(([0], xc)) if through_origin else xc
+            energies = np.concatenate(([0], energy)) if through_origin else energy
+            errors = np.concatenate(([0], xc_error)) if through_origin else xc_error
 
-        # Plot the calibration
-        plt.figure(figsize=(10, 6))
-        plt.errorbar(channels, energies, yerr=errors, fmt='.', markersize=6, color="#074936", 
-                     elinewidth=1.5, ecolor="#000000", label="Data", capsize=3)
-        plt.plot(channel_range, fitted_energies, color="#AD3628", linewidth=2, linestyle="solid", label="Ajuste Lineal")
+            # Generate fitted line for plotting
+            channel_range = np.linspace(0, xc.max() * 1.5, 500)  # Generate a range of channels
+            fitted_energies = calibration.evaluate(channel_range)
 
-        # Labels and legend
-        plt.xlabel("Canal")
-        plt.ylabel("Energia (keV)")
-        plt.legend()
+            plt.figure(figsize=(10, 6))
+            plt.errorbar(channels, energies, yerr=errors, fmt='.', markersize=6, color="#074936", 
+                         elinewidth=1.5, ecolor="#000000", label="Data", capsize=3)
+            plt.plot(channel_range, fitted_energies, color="#AD3628", linewidth=2, linestyle="solid", label="Ajuste Lineal")
 
-        # Save the plot
-        plt.savefig(output_plot)
-        plt.close()
-        print(f"Energy calibration plot saved as {output_plot}")
+            # Labels and legend
+            plt.xlabel("Canal")
+            plt.ylabel("Energia (keV)")
+            plt.legend()
+
+            # Save the plot
+            plt.savefig(output_plot)
+            plt.close()
+            print(f"Energy calibration plot saved as {output_plot}")
 
         # Save the fitted slope and intercept with errors to a text file
         param_file = './Results/Slope_fitted_parameters.txt'
         with open(param_file, 'w') as f:
             f.write(f"Fitted parameters for slope:\n")
             f.write("------------------------------------------------\n")
-            f.write(f"Slope (keV/channel): {slope:.4f}\n")
+            f.write(f"Slope (keV/channel): {slope:.4f} (at channel {slope_channel:.2f})\n")
             f.write("------------------------------------------------\n")
         print(f"Fitted slope parameters saved to {param_file}")
+        print(f"Energy calibration saved to {calibration_file}")
+
+        # Save the calibration coefficients and their covariance to the results store
+        names = [f'c{k}' for k in range(calibration.coefficients.size)]
+        values = dict(zip(names, calibration.coefficients))
+        values['slope'] = slope
+        save_record(detector, 'Calibration', values,
+                    errors=dict(zip(names, np.sqrt(np.diag(calibration.covariance)))),
+                    covariance=calibration.covariance, covariance_parameters=names,
+                    units=dict(zip(names, ['keV', 'keV/channel', 'keV/channel^2']), slope='keV/channel'),
+                    metadata={'model': calibration_model, 'through_origin': through_origin,
+                              'peaks': calibration_peaks, 'slope_channel': slope_channel})
 
-    except ValueError as e:
-        print(f"Error while processing the file: {e}")
+    except (KeyError, ValueError) as e:
+        print(f"Error while processing the fitted peaks: {e}")
@@ -0,0 +1,128 @@
+import os
+import glob
+import json
+import numpy as np
+from SpectrumStore import default_run
+
+# Machine-readable store for the numeric results of every stage.
+# Each stage saves one record per isotope and run as
+# ./Results/Store/{isotope}/{run}/{stage}.json. A record holds every
+# parameter with its value, error and unit, plus the full covariance of the
+# fitted parameters. Readers look a record up by its path instead of parsing
+# the text reports, which are still written for people to read. Results
+# that do not belong to one isotope (e.g. the energy calibration) use the
+# isotope name 'Detector'.
+
+# Root directory of the store
+store_root = './Results/Store'
+
+# Isotope name of the detector-wide results
+detector = 'Detector'
+
+# Records loaded in this process, keyed by path and modification time
+_loaded_records = {}
+
+# Path of one record
+def record_path(isotope, stage, run=default_run):
+    return os.path.join(store_root, isotope, run, f'{stage}.json')
+
+# Save the results of a stage.
+# values: {parameter: value}; errors: {parameter: error}; units: {parameter: unit}
+# covariance: matrix over the parameters in the order of values (or of
+# covariance_parameters when given). The previous record is replaced.
+def save_record(isotope, stage, values, errors=None, covariance=None, units=None,
+                run=default_run, covariance_parameters=None, metadata=None):
+    errors = errors or {}
+    units = units or {}
+    record = {
+        'isotope': isotope,
+        'stage': stage,
+        'run': run,
+        'parameters': {name: {'value': _plain(value),
+                              'error': _plain(errors.get(name)),
+                              'unit': units.get(name)}
+                       for name, value in values.items()},
+        'covariance': None,
+        'metadata': metadata or {},
+    }
+    if covariance is not None:
+        names = list(covariance_parameters or values)
+        matrix = np.asarray(covariance, dtype=float)
+        if matrix.shape != (len(names), len(names)):
+            raise ValueError(f"Covariance of shape {matrix.shape} does not match {len(names)} parameters")
+        record['covariance'] = {'parameters': names, 'matrix': matrix.tolist()}
+
+    # Write to a temporary file first so readers never see a partial record
+    path = record_path(isotope, stage, run)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(record, f, indent=2)
+    os.replace(temp_path, path)
+    return path
+
+# Plain Python numbers for JSON (NaN and infinities become None)
+def _plain(value):
+    if value is None:
+        return None
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+# Check whether a record exists
+def has_record(isotope, stage, run=default_run):
+    return os.path.exists(record_path(isotope, stage, run))
+
+# Load a record once per process (reloaded if the file changes)
+def load_record(isotope, stage, run=default_run):
+    path = record_path(isotope, stage, run)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No {stage} results for {isotope} (run {run}) in {store_root}.")
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    if key not in _loaded_records:
+        with open(path, 'r') as f:
+            _loaded_records[key] = json.load(f)
+    return _loaded_records[key]
+
+# Value and error of one parameter
+def get_parameter(isotope, stage, parameter, run=default_run):
+    parameters = load_record(isotope, stage, run)['parameters']
+    if parameter not in parameters:
+        raise KeyError(f"No parameter {parameter} in the {stage} results for {isotope} (run {run}).")
+    entry = parameters[parameter]
+    value = np.nan if entry['value'] is None else entry['value']
+    error = np.nan if entry['error'] is None else entry['error']
+    return value, error
+
+# Values of all parameters of a record: {parameter: value}
+def get_values(isotope, stage, run=default_run):
+    return {name: (np.nan if entry['value'] is None else entry['value'])
+            for name, entry in load_record(isotope, stage, run)['parameters'].items()}
+
+# Parameter names and covariance matrix of a record (None if it has none)
+def get_covariance(isotope, stage, run=default_run):
+    covariance = load_record(isotope, stage, run)['covariance']
+    if covariance is None:
+        return None
+    return covariance['parameters'], np.array(covariance['matrix'])
+
+# Records matching the given isotope, stage and run ('*' matches any)
+def find_records(isotope='*', stage='*', run='*'):
+    paths = sorted(glob.glob(record_path(isotope, stage, run)))
+    records = []
+    for path in paths:
+        parts = os.path.normpath(path).split(os.sep)
+        records.append(load_record(parts[-3], os.path.splitext(parts[-1])[0], parts[-2]))
+    return records
+
+# One parameter across runs: runs, values and errors (NaN where missing)
+def query_parameter(isotope, stage, parameter, runs=None):
+    records = {record['run']: record for record in find_records(isotope, stage)}
+    runs = sorted(records) if runs is None else list(runs)
+    values = np.full(len(runs), np.nan)
+    errors = np.full(len(runs), np.nan)
+    for i, run in enumerate(runs):
+        entry = records.get(run, {'parameters': {}})['parameters'].get(parameter)
+        if entry is not None:
+            values[i] = np.nan if entry['value'] is None else entry['value']
+            errors[i] = np.nan if entry['error'] is None else entry['error']
+    return runs, values, errors
@@ -0,0 +1,210 @@
+import os
+import glob
+import json
+import time
+import sqlite3
+import argparse
+import datetime
+import numpy as np
+from ResultsStore import record_path, save_record, load_record, has_record
+from SpectrumStore import default_run
+
+# Catalog of the acquisitions (runs) and of their fitted parameters.
+# Every record of the results store (ResultsStore.py) is indexed in a local
+# SQLite file keyed by run, isotope, stage and parameter, together with the
+# time of the run and its detector settings. Queries such as "centroid of
+# the 630 keV line over the last month" or "Q vs run" then cost one indexed
+# SELECT and return NumPy arrays. The catalog is only an index: it is brought
+# up to date from the store (new, changed or deleted records) before every
+# query and can be deleted and rebuilt at any time.
+
+# File of the catalog
+catalog_file = './Results/RunCatalog.sqlite'
+
+# Stage name of the run description records (time and detector settings)
+run_stage = 'Run'
+
+schema = """
+CREATE TABLE IF NOT EXISTS records (path TEXT PRIMARY KEY, mtime REAL,
+                                    isotope TEXT, run TEXT, stage TEXT);
+CREATE TABLE IF NOT EXISTS runs (isotope TEXT, run TEXT, timestamp REAL, settings TEXT,
+                                 PRIMARY KEY (isotope, run));
+CREATE INDEX IF NOT EXISTS runs_by_time ON runs (isotope, timestamp);
+CREATE TABLE IF NOT EXISTS parameters (isotope TEXT, run TEXT, stage TEXT, parameter TEXT,
+                                       value REAL, error REAL,
+                                       PRIMARY KEY (isotope, stage, parameter, run));
+"""
+
+# Describe a run: its start time (Unix seconds, default now) and detector settings
+# (e.g. {'live_time': 600, 'high_voltage': 850}). Numeric settings are also
+# stored as parameters so they can be queried like any result.
+def register_run(isotope, run, timestamp=None, settings=None):
+    settings = settings or {}
+    values = {'timestamp': time.time() if timestamp is None else timestamp}
+    values.update({key: value for key, value in settings.items()
+                   if isinstance(value, (int, float)) and not isinstance(value, bool)})
+    return save_record(isotope, run_stage, values, units={'timestamp': 's'}, run=run,
+                       metadata={'settings': settings})
+
+# Detector settings of a run ({} if it was never registered)
+def run_settings(isotope, run=default_run):
+    if not has_record(isotope, run_stage, run):
+        return {}
+    return load_record(isotope, run_stage, run)['metadata'].get('settings', {})
+
+# Open the catalog, creating its tables if needed
+def connect(file_path=catalog_file):
+    os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+    connection = sqlite3.connect(file_path, timeout=30)
+    connection.executescript(schema)
+    return connection
+
+# Bring the catalog up to date with the results store. Returns the number of records indexed.
+def sync_catalog(connection):
+    paths = {os.path.normpath(path): os.path.getmtime(path)
+             for path in glob.glob(record_path('*', '*', '*'))}
+    indexed = {path: (mtime, isotope, run, stage) for path, mtime, isotope, run, stage
+               in connection.execute("SELECT path, mtime, isotope, run, stage FROM records")}
+
+    with connection:
+        # Records deleted from the store
+        for path in set(indexed) - set(paths):
+            _, isotope, run, stage = indexed[path]
+            connection.execute("DELETE FROM parameters WHERE isotope = ? AND run = ? AND stage = ?",
+                               (isotope, run, stage))
+            if stage == run_stage:
+                connection.execute("UPDATE runs SET timestamp = NULL, settings = NULL WHERE isotope = ? AND run = ?",
+                                   (isotope, run))
+            connection.execute("DELETE FROM records WHERE path = ?", (path,))
+
+        # New or modified records
+        changed = [path for path, mtime in paths.items() if path not in indexed or indexed[path][0] != mtime]
+        for path in changed:
+            parts = path.split(os.sep)
+            isotope, run, stage = parts[-3], parts[-2], os.path.splitext(parts[-1])[0]
+            record = load_record(isotope, stage, run)
+            connection.execute("DELETE FROM parameters WHERE isotope = ? AND run = ? AND stage = ?",
+                               (isotope, run, stage))
+            connection.executemany(
+                "INSERT INTO parameters VALUES (?, ?, ?, ?, ?, ?)",
+                [(isotope, run, stage, name, entry['value'], entry['error'])
+                 for name, entry in record['parameters'].items()])
+
+            # Time of the run: from its description, else when its first result was written
+            if stage == run_stage:
+                connection.execute("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?)",
+                                   (isotope, run, record['parameters']['timestamp']['value'],
+                                    json.dumps(record['metadata'].get('settings', {}))))
+            else:
+                connection.execute("INSERT OR IGNORE INTO runs VALUES (?, ?, ?, NULL)",
+                                   (isotope, run, paths[path]))
+                connection.execute("UPDATE runs SET timestamp = ? WHERE isotope = ? AND run = ? AND timestamp IS NULL",
+                                   (paths[path], isotope, run))
+            connection.execute("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)",
+                               (path, paths[path], isotope, run, stage))
+    return len(changed)
+
+# One parameter across runs, ordered by time: arrays 'run', 'timestamp', 'value', 'error'.
+# since / until: Unix times limiting the runs; runs: only these runs;
+# match: {parameter: value} other parameters of the same record must equal
+# (e.g. {'Energy': 630} to select the 630 keV line).
+def query(isotope, stage, parameter, since=None, until=None, runs=None, match=None, file_path=catalog_file):
+    connection = connect(file_path)
+    try:
+        sync_catalog(connection)
+        sql = ["SELECT p.run, r.timestamp, p.value, p.error FROM parameters p",
+               "JOIN runs r ON r.isotope = p.isotope AND r.run = p.run"]
+        conditions = ["p.isotope = ?", "p.stage = ?", "p.parameter = ?"]
+        join_arguments, arguments = [], [isotope, stage, parameter]
+        for k, (name, value) in enumerate((match or {}).items()):
+            sql.append(f"JOIN parameters m{k} ON m{k}.isotope = p.isotope AND m{k}.run = p.run "
+                       f"AND m{k}.stage = p.stage AND m{k}.parameter = ?")
+            conditions.append(f"abs(m{k}.value - ?) <= 1e-9 * max(1, abs(?))")
+            join_arguments.append(name)
+            arguments += [value, value]
+        if since is not None:
+            conditions.append("r.timestamp >= ?")
+            arguments.append(since)
+        if until is not None:
+            conditions.append("r.timestamp < ?")
+            arguments.append(until)
+        if runs is not None:
+            runs = list(runs)
+            conditions.append(f"p.run IN ({', '.join('?' * len(runs))})")
+            arguments += runs
+        sql.append("WHERE " + " AND ".join(conditions) + " ORDER BY r.timestamp, p.run")
+        rows = connection.execute(" ".join(sql), join_arguments + arguments).fetchall()
+    finally:
+        connection.close()
+
+    return {
+        'run': np.array([row[0] for row in rows], dtype=str),
+        'timestamp': np.array([row[1] for row in rows], dtype=float),
+        'value': np.array([np.nan if row[2] is None else row[2] for row in rows], dtype=float),
+        'error': np.array([np.nan if row[3] is None else row[3] for row in rows], dtype=float),
+    }
+
+# Drift of a parameter: its values relative to the first run of the period
+def drift(isotope, stage, parameter, since=None, until=None, match=None, file_path=catalog_file):
+    results = query(isotope, stage, parameter, since, until, match=match, file_path=file_path)
+    if results['value'].size:
+        results['drift'] = results['value'] - results['value'][0]
+        results['drift_error'] = np.hypot(results['error'], results['error'][0])
+    else:
+        results['drift'] = results['drift_error'] = np.array([])
+    return results
+
+# Runs of an isotope in the catalog with their time and settings, ordered by time
+def list_catalog_runs(isotope, file_path=catalog_file):
+    connection = connect(file_path)
+    try:
+        sync_catalog(connection)
+        rows = connection.execute("SELECT run, timestamp, settings FROM runs WHERE isotope = ? ORDER BY timestamp, run",
+                                  (isotope,)).fetchall()
+    finally:
+        connection.close()
+    return [(run, timestamp, json.loads(settings) if settings else {}) for run, timestamp, settings in rows]
+
+# Parse key=value pairs (numbers when possible)
+def parse_pairs(pairs):
+    values = {}
+    for pair in pairs or []:
+        key, _, value = pair.partition('=')
+        try:
+            values[key] = float(value)
+        except ValueError:
+            values[key] = value
+    return values
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Query fitted parameters across runs")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    query_parser = subparsers.add_parser('query', help="One parameter across runs, e.g. query Cesio137 PeakFit xc --match Energy=630")
+    query_parser.add_argument('isotope')
+    query_parser.add_argument('stage')
+    query_parser.add_argument('parameter')
+    query_parser.add_argument('--since-days', type=float, default=None, help="Only runs of the last N days")
+    query_parser.add_argument('--match', nargs='+', default=None, help="parameter=value conditions on the same record")
+    query_parser.add_argument('--drift', action='store_true', help="Also print the change since the first run")
+
+    register_parser = subparsers.add_parser('register', help="Record the time and detector settings of a run")
+    register_parser.add_argument('isotope')
+    register_parser.add_argument('run')
+    register_parser.add_argument('--time', default=None, help="Start of the run (ISO format, default now)")
+    register_parser.add_argument('--settings', nargs='+', default=None, help="key=value detector settings")
+    args = parser.parse_args()
+
+    if args.command == 'register':
+        timestamp = datetime.datetime.fromisoformat(args.time).timestamp() if args.time else None
+        path = register_run(args.isotope, args.run, timestamp, parse_pairs(args.settings))
+        print(f"Run {args.run} of {args.isotope} registered in {path}")
+    else:
+        since = time.time() - args.since_days * 86400 if args.since_days is not None else None
+        match = parse_pairs(args.match)
+        results = drift(args.isotope, args.stage, args.parameter, since, match=match)
+        print("Run\tTime\tValue\tError" + ("\tDrift" if args.drift else ""))
+        for k in range(results['run'].size):
+            moment = datetime.datetime.fromtimestamp(results['timestamp'][k]).isoformat(timespec='seconds')
+            line = f"{results['run'][k]}\t{moment}\t{results['value'][k]:.6g}\t{results['error'][k]:.3g}"
+            print(line + (f"\t{results['drift'][k]:+.6g}" if args.drift else ""))
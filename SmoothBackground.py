@@ -0,0 +1,69 @@
+import numpy as np
+from scipy.ndimage import uniform_filter1d
+from BackgroundSubtraction import background_scale
+
+# Smooth background of spectrum stacks with the SNIP algorithm.
+# The counts are compressed with the log-log-sqrt (LLS) transform, then each
+# channel is replaced by the smaller of itself and the mean of its neighbours
+# p channels away, for p = iterations ... 1. Peaks narrower than the largest
+# window are clipped away while slowly varying continua are kept. Every
+# iteration is one broadcasted operation over the whole (N, channels) stack.
+# The estimate can replace the measured background or be added on top of it,
+# for the continuum left under the lines after the measured background.
+
+# Largest clipping window (channels): about twice the FWHM of the lines to remove
+snip_iterations = 24
+
+# Windows from the largest to the smallest (smoother estimate) or the opposite
+decreasing_window = True
+
+# Moving average (channels) applied before clipping: clipping the Poisson
+# fluctuations biases the estimate low, about 12% without smoothing and 5% with 5 channels
+smoothing_window = 5
+
+# Log-log-sqrt transform and its inverse
+def lls(counts):
+    return np.log(np.log(np.sqrt(np.maximum(counts, 0) + 1) + 1) + 1)
+
+def inverse_lls(values):
+    return (np.exp(np.exp(values) - 1) - 1)**2 - 1
+
+# SNIP background of a stack of spectra. counts: (N, channels) or (channels,).
+def snip_background(counts, iterations=snip_iterations, decreasing=decreasing_window, smoothing=smoothing_window):
+    counts = np.asarray(counts, dtype=float)
+    values = np.atleast_2d(counts)
+    if smoothing > 1:
+        values = uniform_filter1d(values, smoothing, axis=-1, mode='nearest')
+    values = lls(values)
+    n_channels = values.shape[-1]
+    windows = range(min(iterations, (n_channels - 1) // 2), 0, -1)
+    for p in (windows if decreasing else reversed(windows)):
+        # Clip the inner channels against the mean of both neighbours at distance p
+        values[:, p:n_channels - p] = np.minimum(values[:, p:n_channels - p],
+                                                 0.5 * (values[:, :n_channels - 2 * p] + values[:, 2 * p:]))
+    background = np.maximum(inverse_lls(values), 0)
+    return background.reshape(counts.shape)
+
+# Background of every spectrum of the stack and its variance, both (N, channels).
+# method: 'measured' (measured background scaled by live time), 'snip' (SNIP of
+# each spectrum) or 'combined' (measured background plus the SNIP of what is left).
+# The SNIP estimate follows the counts of about 2 * iterations + 1 channels,
+# so its variance is taken as the estimate over that number of channels.
+def estimate_background(counts, method='measured', background=None, live_times=None, background_live_time=None,
+                        iterations=snip_iterations):
+    counts = np.atleast_2d(np.asarray(counts, dtype=float))
+    estimate = np.zeros_like(counts)
+    variance = np.zeros_like(counts)
+    if method in ('measured', 'combined'):
+        if background is None:
+            raise ValueError(f"The '{method}' background needs a measured background spectrum.")
+        scale = background_scale(counts.shape[0], live_times, background_live_time)[:, None]
+        estimate = estimate + scale * np.asarray(background, dtype=float)
+        variance = variance + scale**2 * np.asarray(background, dtype=float)
+    elif method != 'snip':
+        raise ValueError(f"Unknown background method: {method}")
+    if method in ('snip', 'combined'):
+        continuum = snip_background(counts - estimate, iterations)
+        estimate = estimate + continuum
+        variance = variance + continuum / (2 * iterations + 1)
+    return estimate, variance
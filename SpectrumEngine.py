@@ -0,0 +1,133 @@
+import os
+import argparse
+import numpy as np
+from Plotting import compute_only, set_mode
+from RenderFarm import spectrum_spec, render_figures, report
+from EnergyCalibration import load_energy_spectrum
+from ROIIndex import build_roi_index, query_rois
+from Rebinning import edges_from_centers, rebin
+from SpectrumStore import list_runs, default_run
+from ResultsStore import save_record
+from IsotopeConfig import isotope_configs
+
+# Annotated energy spectra and intensity tables for every isotope.
+# One process handles every isotope in IsotopeConfig.py, and every stored
+# run of each, so imports and plot styling are paid once. The figures are
+# rendered together by RenderFarm, skipping those whose data and style did
+# not change. In compute-only mode only the intensity tables are written.
+
+# Output directory
+output_dir = './Results'
+
+# Common energy grid (keV) of the intensity sums when the runs of an isotope have
+# different energy axes (different gains). The counts are rebinned onto it by exact
+# overlap, so that a range covers the same energies in every run. Runs sharing one
+# axis are summed on their own bins, which keeps the historical results.
+energy_grid_step = 1.0
+energy_grid_max = 1600
+
+# Prefix of the output files of a run (the default run keeps the historical names)
+def output_prefix(name, run):
+    return name if run == default_run else f'{name}_{run}'
+
+# Output file and figure spec of the annotated energy spectrum of one run
+def spectrum_figure(name, energy_number, net_counts, config, run=default_run):
+    suffix = config['suffix'] + ('Log.pdf' if config['use_log_scale'] else '.pdf')
+    plot_file = os.path.join(output_dir, output_prefix(name, run) + suffix)
+    spec = spectrum_spec(energy_number, net_counts, label=name, xlabel="Energia (keV)", xlim=(0, 1600),
+                         log_scale=config['use_log_scale'], linewidth=config['linewidth'],
+                         annotations=config['annotations'])
+    return plot_file, spec
+
+# Save the intensity of each component of one run
+def save_intensities(name, run, energy_ranges, rois, row):
+    output_file = os.path.join(output_dir, f"{output_prefix(name, run)}_IntensityResults.txt")
+    header = "Component\tEnergy (keV)\tIntensity\tError"  # Header for the file
+    with open(output_file, 'w') as f:
+        f.write(header + "\n")  # Write the header line
+        for k, (component, values) in enumerate(energy_ranges.items()):
+            f.write(f"{component}\t{values['Energy']}\t{rois['intensity'][row, k]:.6f}\t{rois['intensity_error'][row, k]:.6f}\n")
+
+    # Intensities and counts of every component in the results store
+    components = list(energy_ranges)
+    results = dict(zip(components, rois['intensity'][row]))
+    errors = dict(zip(components, rois['intensity_error'][row]))
+    results.update({f'{component}.counts': counts for component, counts in zip(components, rois['counts'][row])})
+    errors.update({f'{component}.counts': error for component, error in zip(components, rois['error'][row])})
+    results['total_counts'] = rois['total_counts'][row]
+    save_record(name, 'Intensity', results, errors=errors, run=run,
+                metadata={component: values for component, values in energy_ranges.items()})
+    return output_file
+
+# Compute the intensities of every run of an isotope with one ROI query.
+# Returns the figures of the runs, {output file: [spec]}, to be rendered.
+def process_isotope(name, runs=None):
+    config = isotope_configs[name]
+    runs = runs or list_runs(name) or [default_run]
+
+    spectra = []
+    for run in runs:
+        text_file = f'./Data/Data_{name}_WithErrors_energy.txt' if run == default_run else None
+        try:
+            spectra.append((run, load_energy_spectrum(name, run, text_file=text_file)))
+        except (FileNotFoundError, OSError) as e:
+            print(f"No spectrum for {name} run {run}: {e}. Skipping.")
+    if not spectra:
+        return {}
+
+    jobs = {}
+    for run, data_nucleus in spectra:
+        if compute_only():
+            break
+        plot_file, spec = spectrum_figure(name, data_nucleus[:, 3], data_nucleus[:, 1], config, run)
+        jobs[plot_file] = [spec]
+
+    energy_ranges = config['energy_ranges']
+    if not energy_ranges:
+        return jobs
+
+    # Cumulative-sum index of every run, then all ranges of all runs at once
+    energy = np.stack([data[:, 3] for _, data in spectra])
+    counts = np.stack([data[:, 1] for _, data in spectra])
+    errors = np.stack([data[:, 2] for _, data in spectra])
+    if not np.allclose(energy, energy[0]):
+        grid_edges = np.arange(0, energy_grid_max + energy_grid_step, energy_grid_step)
+        counts, variances = rebin(counts, errors**2, edges_from_centers(energy), grid_edges)
+        errors = np.sqrt(variances)
+        energy = 0.5 * (grid_edges[1:] + grid_edges[:-1])
+    rois = query_rois(build_roi_index(energy, counts, errors),
+                      [values['min'] for values in energy_ranges.values()],
+                      [values['max'] for values in energy_ranges.values()])
+
+    for row, (run, _) in enumerate(spectra):
+        output_file = save_intensities(name, run, energy_ranges, rois, row)
+        print(f"Results saved to {output_file}")
+    return jobs
+
+# Process several isotopes and render all their figures together.
+# With combined_pdf every figure also goes into that multi-page PDF.
+def process_isotopes(names, runs=None, combined_pdf=None, workers=None):
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = {}
+    for name in names:
+        if name not in isotope_configs:
+            print(f"No configuration for {name}. Skipping.")
+            continue
+        jobs.update(process_isotope(name, runs))
+
+    if combined_pdf and jobs:
+        jobs[combined_pdf] = [pages[0] for pages in jobs.values()]
+    report(*render_figures(jobs, workers))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Energy spectra plots and intensity tables for every isotope")
+    parser.add_argument('isotopes', nargs='*', default=list(isotope_configs), help="Isotopes to process (default: all)")
+    parser.add_argument('--runs', nargs='+', default=None, help="Runs to process (default: every stored run)")
+    parser.add_argument('--show', action='store_true', help="Show each plot on screen")
+    parser.add_argument('--no-plots', action='store_true', help="Compute-only mode: write only the intensity tables")
+    parser.add_argument('--pdf', default=None, help="Also write every figure to this multi-page PDF")
+    parser.add_argument('--workers', type=int, default=None, help="Processes rendering the figures")
+    args = parser.parse_args()
+    set_mode(compute_only=args.no_plots or None, show=args.show or None)
+
+    process_isotopes(args.isotopes, args.runs, args.pdf, args.workers)
@@ -0,0 +1,117 @@
+import os
+import glob
+import numpy as np
+
+# Binary store for the spectra and tables passed between scripts.
+# Each array is saved as ./Data/Store/{name}/{run}/{kind}.npy with the same
+# rows and columns as its text export, so readers memory-map it instead of
+# re-parsing text with np.loadtxt. The text files stay as the export format
+# and are used as a fallback when a store entry is missing or older.
+# Runs saved together in a stack ({kind}_stack.npy) are listed and loaded
+# like the runs saved one by one.
+
+# Root directory of the store
+store_root = './Data/Store'
+
+# Row of each run in the stacks read in this process, keyed by stack path and modification time
+_stack_rows = {}
+
+# Run used by the single-acquisition scripts
+default_run = 'default'
+
+# Path of one stored array
+def spectrum_path(name, kind, run=default_run):
+    return os.path.join(store_root, name, run, f'{kind}.npy')
+
+# Round each column like the text export and write the array atomically
+def write_array(path, data, decimals=None):
+    data = np.array(data, dtype=float)
+    if decimals is not None:
+        for column, digits in enumerate(decimals):
+            data[..., column] = np.round(data[..., column], digits)
+
+    # Write to a temporary file first so readers never see a partial array
+    temp_path = path + '.tmp.npy'
+    np.save(temp_path, data)
+    os.replace(temp_path, path)
+
+# Save an array (rows x columns, as written to text) to the store.
+# decimals rounds each column like the text export, so both give the same numbers.
+def save_spectrum(name, kind, data, run=default_run, decimals=None):
+    path = spectrum_path(name, kind, run)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    write_array(path, data, decimals)
+    return path
+
+# Load an array from the store as a read-only memory map.
+# If the entry is missing, or text_file was modified after it, the text file
+# is parsed instead (header row skipped, as the scripts do).
+def load_spectrum(name, kind, run=default_run, text_file=None):
+    path = spectrum_path(name, kind, run)
+    use_store = os.path.exists(path)
+    if use_store and text_file is not None and os.path.exists(text_file):
+        use_store = os.path.getmtime(path) >= os.path.getmtime(text_file)
+
+    if use_store:
+        return np.load(path, mmap_mode='r')
+    row = stack_row(name, kind, run)
+    if row is not None and not os.path.exists(path):
+        return np.load(stack_paths(name, kind)[0], mmap_mode='r')[row]
+    if text_file is None:
+        raise FileNotFoundError(f"No stored {kind} spectrum for {name} (run {run}).")
+    return np.loadtxt(text_file, skiprows=1)
+
+# Check whether a spectrum is available in the store or as text
+def has_spectrum(name, kind, run=default_run, text_file=None):
+    return (os.path.exists(spectrum_path(name, kind, run)) or stack_row(name, kind, run) is not None
+            or (text_file is not None and os.path.exists(text_file)))
+
+# Names stored for an isotope's runs, one by one or in stacks of any kind, sorted
+def list_runs(name):
+    directory = os.path.join(store_root, name)
+    if not os.path.isdir(directory):
+        return []
+    runs = {run for run in os.listdir(directory) if os.path.isdir(os.path.join(directory, run))}
+    for runs_path in glob.glob(stack_paths(name, '*')[1]):
+        with open(runs_path, 'r') as f:
+            runs.update(f.read().split())
+    return sorted(runs)
+
+# Row of a run in the stack of one kind, or None if the run is not in it
+def stack_row(name, kind, run):
+    path, runs_path = stack_paths(name, kind)
+    if not os.path.exists(path) or not os.path.exists(runs_path):
+        return None
+    key = (runs_path, os.path.getmtime(runs_path))
+    if key not in _stack_rows:
+        with open(runs_path, 'r') as f:
+            _stack_rows[key] = {stacked: row for row, stacked in enumerate(f.read().split())}
+    return _stack_rows[key].get(run)
+
+# Stack one kind of spectrum for several runs into an (N, rows, columns) array
+def load_runs(name, kind, runs=None):
+    runs = list_runs(name) if runs is None else runs
+    return runs, np.stack([load_spectrum(name, kind, run) for run in runs])
+
+# Path of a stack of runs saved in a single array, and of its run names
+def stack_paths(name, kind):
+    directory = os.path.join(store_root, name)
+    return os.path.join(directory, f'{kind}_stack.npy'), os.path.join(directory, f'{kind}_stack_runs.txt')
+
+# Save an (N, rows, columns) stack of runs with one write
+def save_stack(name, kind, runs, data, decimals=None):
+    path, runs_path = stack_paths(name, kind)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    write_array(path, data, decimals)
+    with open(runs_path, 'w') as f:
+        f.write('\n'.join(runs) + '\n')
+    return path
+
+# Load a stack saved with save_stack as (runs, read-only memory map)
+def load_stack(name, kind):
+    path, runs_path = stack_paths(name, kind)
+    with open(runs_path, 'r') as f:
+        runs = f.read().split()
+    return runs, np.load(path, mmap_mode='r')
@@ -0,0 +1,24 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from BackgroundSubtraction import background_scale, subtract_background
+from SmoothBackground import estimate_background
+
+def test_live_times_scale_the_background():
+    counts = np.full((2, 4), 10.0)
+    net, error = subtract_background(counts, np.full(4, 4.0), [50, 100], 100)
+    np.testing.assert_allclose(net, [[8] * 4, [6] * 4])
+    np.testing.assert_allclose(error, np.sqrt([[11] * 4, [14] * 4]))
+    np.testing.assert_allclose(background_scale(1, np.float64(30), 60), [0.5])
+
+def test_live_times_without_the_background_live_time_raise():
+    with pytest.raises(ValueError):
+        background_scale(2, [50, 100])
+    with pytest.raises(ValueError):
+        background_scale(3, [50, 100], 100)
+    with pytest.raises(ValueError):
+        estimate_background(np.ones((2, 4)), 'measured', np.ones(4), [50, 100])
+    np.testing.assert_array_equal(background_scale(2), [1, 1])
@@ -0,0 +1,36 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+from BetaShapeFit import beta_shape, folded_templates, fit_Q
+
+Q_true = 0.7635
+k = 0.012
+edges = np.linspace(0, 1.2, 241)
+
+# The Fermi table is read from the repository root
+@pytest.fixture(autouse=True)
+def in_root(monkeypatch):
+    monkeypatch.chdir(root)
+
+def test_folding_conserves_the_spectrum_integral():
+    Q = np.array([0.60, Q_true, 0.85])
+    T = np.linspace(0, 1.2, 200001)
+    integral = np.trapezoid(beta_shape(T, Q), T, axis=1)
+    templates = folded_templates(Q, edges, k)
+    np.testing.assert_allclose(templates.sum(axis=1), integral, rtol=1e-4)
+
+def test_fit_recovers_the_endpoint_of_folded_spectra():
+    # Poisson spectra of 2e5 counts drawn from the folded template of Q_true
+    template = folded_templates(Q_true, edges, k)[0]
+    counts = np.random.default_rng(3).poisson(np.tile(template / template.sum() * 2e5, (20, 1))).astype(float)
+    results = fit_Q(0.5 * (edges[1:] + edges[:-1]), counts, np.sqrt(np.maximum(counts, 1)), k)
+
+    pulls = (results['Q'] - Q_true) / results['Q_err']
+    assert np.all(results['Q_err'] < 0.002)
+    assert abs(np.mean(pulls)) < 3 / np.sqrt(pulls.size)
+    assert 0.6 < np.std(pulls) < 1.4
+    assert 0.7 < np.mean(results['chi2'] / results['dof']) < 1.3
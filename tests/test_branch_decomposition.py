@@ -0,0 +1,28 @@
+import os
+import sys
+import numpy as np
+import pytest
+from scipy.optimize import nnls
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from BranchDecomposition import nnls_batch
+
+def scipy_reference(design, counts, weights):
+    root_weights = np.sqrt(weights)
+    return np.array([nnls(design * w[:, None], c * w)[0] for c, w in zip(counts, root_weights)])
+
+# 10 components go through the per-spectrum fallback
+@pytest.mark.parametrize('n_components', [4, 10])
+def test_nnls_matches_scipy(n_components):
+    rng = np.random.default_rng(n_components)
+    design = rng.random((60, n_components))
+    truth = np.where(rng.random((5, n_components)) < 0.5, 0, 100 * rng.random((5, n_components)))
+    counts = truth @ design.T + rng.normal(0, 1, (5, 60)) - 20 * design[:, 0]
+    weights = rng.uniform(0.5, 2, (5, 60))
+
+    coefficients, covariance, chi2 = nnls_batch(design, counts, weights)
+    np.testing.assert_allclose(coefficients, scipy_reference(design, counts, weights), rtol=1e-6, atol=1e-6)
+    residual = counts - coefficients @ design.T
+    np.testing.assert_allclose(chi2, np.sum(weights * residual**2, axis=1), rtol=1e-6)
+    assert covariance.shape == (5, n_components, n_components)
+    assert np.all(covariance[coefficients == 0] == 0)
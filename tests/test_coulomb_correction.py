@@ -0,0 +1,35 @@
+import os
+import sys
+import numpy as np
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+import CoulombCorrection
+from CoulombCorrection import fermi, fermi_function, G_function, kinematics
+
+def test_spline_table_matches_the_analytic_function(tmp_path, monkeypatch):
+    monkeypatch.setattr(CoulombCorrection, 'cache_dir', str(tmp_path))
+    monkeypatch.setattr(CoulombCorrection, '_splines', {})
+    T = np.linspace(0.005, 3, 500)
+    W, _ = kinematics(T)
+    np.testing.assert_allclose(fermi(82, T, 204), fermi_function(82, W, 204), rtol=1e-8)
+    assert np.all(fermi(82, T, 204, 'beta+') < fermi(82, T, 204))
+
+    # Reloaded from the file written on the first call
+    monkeypatch.setattr(CoulombCorrection, '_splines', {})
+    assert len(os.listdir(tmp_path)) == 2
+    np.testing.assert_allclose(fermi(82, T, 204), fermi_function(82, W, 204), rtol=1e-8)
+
+def test_analytic_corrections_follow_the_tabulated_ones(tmp_path, monkeypatch):
+    monkeypatch.setattr(CoulombCorrection, 'cache_dir', str(tmp_path))
+    # G(Z = 82, W) of ValoresInterpolacion.txt, up to a constant factor
+    table = np.loadtxt(os.path.join(root, 'ValoresInterpolacion.txt'), skiprows=1)
+    T = (np.sqrt(table[:, 0]**2 + 1) - 1) * CoulombCorrection.electron_mass
+    ratio = G_function(82, T, 204) / table[:, 1]
+    np.testing.assert_allclose(ratio, np.median(ratio), rtol=1e-3)
+
+    # F(Z = 82, T) of Fermi_204Tl.txt above 0.1 MeV: same shape within a few per cent
+    table = np.loadtxt(os.path.join(root, 'Fermi_204Tl.txt'), skiprows=2)
+    inside = table[:, 0] >= 0.1
+    ratio = fermi(82, table[inside, 0], 204) / table[inside, 1]
+    np.testing.assert_allclose(ratio, np.median(ratio), rtol=0.04)
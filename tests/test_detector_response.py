@@ -0,0 +1,38 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import DetectorResponse
+from DetectorResponse import response_matrix, unfold
+
+params = {'resolution': 0.03, 'backscatter_fraction': 0.08, 'backscatter_shape': (1.2, 2.5)}
+edges = np.linspace(0.05, 1.0, 39)
+centres = 0.5 * (edges[1:] + edges[:-1])
+true = np.sqrt(centres) * np.maximum(0.7635 - centres, 0)**2 * 1e6 + 1e3
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(DetectorResponse, 'cache_dir', str(tmp_path))
+    monkeypatch.setattr(DetectorResponse, '_responses', {})
+
+def test_response_is_cached_on_disk(tmp_path):
+    response = response_matrix(params, edges, edges)
+    assert len(os.listdir(tmp_path)) == 1
+    # Each column is a probability; backscattered electrons may fall below the first bin
+    assert np.all(response.sum(axis=0) <= 1 + 1e-12)
+
+    DetectorResponse._responses.clear()
+    np.testing.assert_array_equal(response_matrix(params, edges, edges), response)
+
+def test_unfolding_recovers_a_known_spectrum():
+    response = response_matrix(params, edges, edges)
+    measured = np.stack([true, 2 * true]) @ response.T
+    # The folding distorts the spectrum by far more than the unfolding tolerance
+    assert np.max(np.abs(measured[0] / true - 1)[5:-5]) > 0.1
+
+    unfolded = unfold(measured, response, iterations=200)
+    np.testing.assert_allclose(unfolded[:, 5:-5], np.stack([true, 2 * true])[:, 5:-5], rtol=0.05)
+    # MLEM keeps the number of detected counts
+    np.testing.assert_allclose(unfolded @ response.sum(axis=0), measured.sum(axis=1))
@@ -0,0 +1,46 @@
+import os
+import sys
+import time
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import SpectrumStore
+from EnergyCalibration import EnergyCalibration, load_energy_spectrum
+
+def test_quadratic_channel_is_the_exact_inverse():
+    calibration = EnergyCalibration([1.5, 0.5, 2e-5], model='quadratic')
+    channels = np.array([-10.0, 0.0, 123.4, 5000.0, 30000.0])
+    np.testing.assert_allclose(calibration.channel(calibration.evaluate(channels)), channels, rtol=1e-12, atol=1e-9)
+    linear = EnergyCalibration([0, 0.6])
+    np.testing.assert_allclose(linear.channel([0.6, 6000.0]), [1, 10000])
+
+def test_unreachable_energies_raise():
+    calibration = EnergyCalibration([0, 1.0, -1e-4], model='quadratic')
+    assert calibration.channel(2000.0) == pytest.approx(2763.93, abs=0.01)
+    with pytest.raises(ValueError):
+        calibration.channel(3000.0)
+
+def test_fit_recovers_the_calibration():
+    channels = np.array([100.0, 400.0, 900.0, 1500.0])
+    calibration = EnergyCalibration.fit(channels, 2 + 0.6 * channels + 1e-5 * channels**2, model='quadratic')
+    np.testing.assert_allclose(calibration.coefficients, [2, 0.6, 1e-5], rtol=1e-6)
+    assert calibration.slope(500.0) == pytest.approx(0.61)
+
+def test_other_runs_do_not_read_the_default_text_export(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(SpectrumStore, 'store_root', str(tmp_path / 'Store'))
+    calibration_path = str(tmp_path / 'calibration.json')
+    EnergyCalibration([0, 0.5]).save(calibration_path)
+    run_data = np.column_stack((np.arange(4.), [1., 2., 3., 4.], np.ones(4)))
+    SpectrumStore.save_spectrum("Cesio137", "channel", run_data, run='r1')
+
+    # Default-run text export written after the stored run
+    time.sleep(0.01)
+    os.makedirs('Data')
+    np.savetxt('./Data/Data_Cesio137_WithErrors_channel.txt', run_data * [1, 10, 1], header="Channel\tCounts\tError")
+
+    data = load_energy_spectrum("Cesio137", 'r1', file_path=calibration_path)
+    np.testing.assert_array_equal(data[:, 1], run_data[:, 1])
+    np.testing.assert_allclose(data[:, 3], 0.5 * run_data[:, 0])
+    assert load_energy_spectrum("Cesio137", file_path=calibration_path)[2, 1] == 30
@@ -0,0 +1,55 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Rebinning import rebin, channel_edges
+from GainAlignment import measure_drift, track_drift
+
+# Two lines on a broad continuum that vanishes at the ends, and Poisson runs drawn from it with c_run = gain * c_ref + offset
+n_channels = 1024
+channel = np.arange(n_channels)
+reference = (2000 * np.exp(-0.5 * ((channel - 250) / 80)**2) + 4000 * np.exp(-0.5 * ((channel - 205) / 8)**2)
+             + 2500 * np.exp(-0.5 * ((channel - 330) / 9)**2))
+
+def drifted_runs(gain, offset, seed=5):
+    edges = channel_edges(n_channels)
+    mean, _ = rebin(np.tile(reference, (gain.size, 1)), np.zeros((gain.size, n_channels)),
+                    edges[None, :] * gain[:, None] + offset[:, None], edges)
+    return np.random.default_rng(seed).poisson(mean).astype(float)
+
+def test_gain_and_offset_are_fitted_together():
+    rng = np.random.default_rng(1)
+    gain = 1 + rng.uniform(-0.04, 0.04, 50)
+    offset = rng.uniform(-8, 8, 50)
+    measured_gain, measured_offset, _ = measure_drift(drifted_runs(gain, offset), reference, model='both')
+    assert np.max(np.abs(measured_gain - gain)) < 0.005
+    assert np.max(np.abs(measured_offset - offset)) < 1.5
+
+def test_offset_drift_gives_no_fake_gain():
+    offset = np.random.default_rng(2).uniform(-8, 8, 50)
+    measured_gain, measured_offset, _ = measure_drift(drifted_runs(np.ones(50), offset), reference, model='both')
+    assert np.max(np.abs(measured_gain - 1)) < 0.005
+    assert np.corrcoef(measured_offset, offset)[0, 1] > 0.99
+
+def test_aligned_sum_keeps_counts_and_line_width():
+    rng = np.random.default_rng(3)
+    counts = drifted_runs(1 + rng.uniform(-0.04, 0.04, 50), rng.uniform(-8, 8, 50))
+    _, aligned, _ = track_drift(counts, np.sqrt(counts), model='both')
+    assert aligned.sum() == pytest.approx(counts.sum(), rel=1e-4)
+
+    # Width of the line at channel 330 close to that of a single run
+    region = (channel > 300) & (channel < 360)
+    summed = aligned.sum(axis=0)[region]
+    centre = np.sum(channel[region] * summed) / summed.sum()
+    width = np.sqrt(np.sum((channel[region] - centre)**2 * summed) / summed.sum())
+    single = reference[region]
+    single_centre = np.sum(channel[region] * single) / single.sum()
+    single_width = np.sqrt(np.sum((channel[region] - single_centre)**2 * single) / single.sum())
+    assert width < 1.05 * single_width
+
+def test_both_model_needs_two_lines():
+    single_line = 2000 * np.exp(-0.5 * ((channel - 250) / 80)**2) + 4000 * np.exp(-0.5 * ((channel - 205) / 8)**2)
+    with pytest.raises(ValueError):
+        measure_drift(single_line[None], single_line, model='both')
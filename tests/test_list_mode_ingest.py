@@ -0,0 +1,31 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ListModeIngest import event_dtype, histogram_events
+
+def write_events(path, timestamps, channels):
+    events = np.zeros(len(timestamps), dtype=event_dtype)
+    events['timestamp'], events['channel'] = timestamps, channels
+    events.tofile(path)
+
+def test_histograms_match_a_direct_count(tmp_path):
+    rng = np.random.default_rng(1)
+    timestamps = np.sort(rng.integers(0, 10_000, 5000))
+    channels = rng.integers(0, 70, 5000)
+    path = str(tmp_path / 'events.bin')
+    write_events(path, timestamps, channels)
+
+    # Small chunks so the events cross chunk boundaries
+    histogram, overflow = histogram_events(path, n_channels=64, chunk_size=333)
+    assert overflow == np.count_nonzero(channels >= 64)
+    np.testing.assert_array_equal(histogram, np.bincount(channels[channels < 64], minlength=64))
+
+    histograms, starts, durations, _ = histogram_events(path, 64, t_min=1000, slice_width=3000, chunk_size=333)
+    t_stop = timestamps[-1] + 1
+    np.testing.assert_array_equal(starts, [1000, 4000, 7000])
+    np.testing.assert_array_equal(durations, [3000, 3000, t_stop - 7000])
+    for k, start in enumerate(starts):
+        inside = (timestamps >= start) & (timestamps < start + 3000) & (channels < 64)
+        np.testing.assert_array_equal(histograms[k], np.bincount(channels[inside], minlength=64))
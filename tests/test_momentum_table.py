@@ -0,0 +1,53 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+from MomentumTable import momentum_transform, stack_columns, write_table, momentum_columns
+
+# Smooth beta-like spectra on a fine energy axis (keV), two runs of different intensity
+channel = np.arange(2000)
+energy_kev = channel * 0.4
+shape = np.sqrt(energy_kev) * np.maximum(763.5 - energy_kev, 0)**2 / 1e4
+counts = np.stack([shape, 3 * shape])
+errors = np.sqrt(counts)
+
+# The G(Z, W) table is read from the repository root
+@pytest.fixture(autouse=True)
+def in_root(monkeypatch):
+    monkeypatch.chdir(root)
+
+def test_columns_follow_the_kinematics():
+    columns = momentum_transform(channel, energy_kev, counts, errors)
+    W = energy_kev / 511 + 1
+    np.testing.assert_allclose(columns['W'][1], W)
+    np.testing.assert_allclose(columns['P'][1], np.sqrt(W**2 - 1))
+    np.testing.assert_allclose(columns['Momentum(MeV/c)'][1], np.sqrt(energy_kev**2 + 2 * 511 * energy_kev) / 1000)
+    np.testing.assert_allclose(columns['Value'], np.sqrt(counts / columns['G(Z,W)']) / W)
+
+    # Each row is the transform of that spectrum alone
+    single = momentum_transform(channel, energy_kev, counts[1], errors[1])
+    np.testing.assert_allclose(columns['Value'][1], single['Value'][0])
+
+    # Kurie error dK = K dN / (2 N) where there are counts
+    filled = counts > 0
+    np.testing.assert_allclose(columns['ValueError'][filled],
+                               columns['Value'][filled] * errors[filled] / (2 * counts[filled]))
+
+def test_momentum_spectrum_keeps_the_counts():
+    columns = momentum_transform(channel, energy_kev, counts, errors)
+    # N(p) dP = N(E) dW: the Jacobian P / W moves the spectrum without changing its integral
+    in_momentum = np.trapezoid(columns['N(p)'], columns['P'], axis=1)
+    in_energy = np.trapezoid(counts, columns['W'], axis=1)
+    np.testing.assert_allclose(in_momentum, in_energy, rtol=1e-3)
+    np.testing.assert_allclose(columns['N(p)Error'], errors * columns['P'] / columns['W'])
+
+def test_written_table_round_trips(tmp_path):
+    columns = momentum_transform(channel, energy_kev, counts, errors)
+    table = stack_columns(columns, momentum_columns)[0]
+    path = write_table(str(tmp_path / 'table.txt'), table, momentum_columns)
+    with open(path) as f:
+        assert f.readline().split() == momentum_columns
+    np.testing.assert_array_equal(np.loadtxt(path, skiprows=1), table)
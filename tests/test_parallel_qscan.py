@@ -0,0 +1,27 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import SpectrumStore
+from ParallelQScan import output_paths, table_run, run_scan, fit_configs
+from QScan import energy_grid, scan_energy_windows
+
+def test_tables_with_the_same_name_get_their_own_outputs():
+    first, second = os.path.join('runs', 'a', 'TableValues.txt'), os.path.join('runs', 'b', 'TableValues.txt')
+    assert set(output_paths(first)).isdisjoint(output_paths(second))
+    assert table_run(first) != table_run(second)
+    assert table_run('./TableValues.txt') == SpectrumStore.default_run
+
+def test_blocks_merge_to_the_single_scan(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(SpectrumStore, 'store_root', str(tmp_path / 'Store'))
+    energy = np.linspace(0, 0.8, 300)
+    kurie = np.maximum(0.76 - energy, 0) * 3
+    table = np.column_stack([np.arange(300), (kurie * 2)**2, 1 + energy, energy, np.ones(300), kurie, energy])
+    np.savetxt('Table_r1.txt', table, header="ChannelNumber N(E) W P G(Z,W) Value Energy(MeV)")
+
+    merged = run_scan(['Table_r1.txt'], workers=1, blocks_per_scan=3)
+    config = fit_configs['Kurie']
+    direct = scan_energy_windows(energy, kurie, energy_grid(config['min_range'], 0.01), energy_grid(config['max_range'], 0.01))
+    np.testing.assert_allclose(merged[('Table_r1.txt', 'Kurie', 0.01)]['Q'], np.ravel(direct['Q']), rtol=1e-12)
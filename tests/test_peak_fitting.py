@@ -0,0 +1,24 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PeakFitting import gaussian_linear, fit_peaks
+
+def test_fit_recovers_peaks_and_flags_a_bad_guess():
+    rng = np.random.default_rng(3)
+    channels = np.arange(300.0)
+    truth = np.array([20, -0.02, 500, 120, 6, 300, 200, 9])
+    counts = rng.poisson(gaussian_linear(channels, truth)).astype(float)
+    errors = np.sqrt(np.maximum(counts, 1))
+
+    # The last guess has a zero width: no step can lower its chi2
+    rois = [(0, 90, 150), (0, 165, 240), (0, 90, 150)]
+    p0 = [[10, 0, 400, 118, 5], [10, 0, 250, 195, 7], [10, 0, 400, 118, 0]]
+    with np.errstate(all='ignore'):
+        fit = fit_peaks(channels, counts, errors, rois, p0)
+
+    np.testing.assert_array_equal(fit['converged'], [True, True, False])
+    np.testing.assert_allclose(fit['params'][0, 2:], truth[2:5], rtol=0.05)
+    np.testing.assert_allclose(fit['params'][1, 2:], truth[5:], rtol=0.05)
+    assert abs(fit['params'][0, 3] - 120) < 3 * fit['errors'][0, 3]
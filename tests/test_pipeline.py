@@ -0,0 +1,65 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Pipeline
+
+# A stage whose script imports a helper module, in a scratch repository root
+@pytest.fixture
+def scratch_stage(tmp_path, monkeypatch):
+    (tmp_path / 'Helper.py').write_text("value = 1\n")
+    (tmp_path / 'Stage.py').write_text("from Helper import value\nopen('out.txt', 'w').write(str(value))\n")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Pipeline, 'state_file', str(tmp_path / 'state.json'))
+    monkeypatch.setattr(Pipeline, 'stages', {'Stage': {'script': 'Stage.py', 'inputs': [], 'outputs': ['out.txt']}})
+    return tmp_path
+
+def test_edited_helper_module_reruns_stage(scratch_stage):
+    assert Pipeline.run_pipeline()['run'] == ['Stage']
+    assert Pipeline.run_pipeline()['skipped'] == ['Stage']
+
+    (scratch_stage / 'Helper.py').write_text("value = 2\n")
+    assert Pipeline.run_pipeline()['run'] == ['Stage']
+    assert (scratch_stage / 'out.txt').read_text() == '2'
+
+def test_local_imports_are_transitive(scratch_stage):
+    (scratch_stage / 'Helper.py').write_text("import numpy\nfrom Deeper import x\nvalue = x\n")
+    (scratch_stage / 'Deeper.py').write_text("x = 3\n")
+    assert Pipeline.local_imports('Stage.py') == ['Deeper.py', 'Helper.py']
+
+def test_blocked_stages_stop_with_an_error(scratch_stage, monkeypatch):
+    monkeypatch.setattr(Pipeline, 'stages', {
+        'A': {'script': 'Stage.py', 'inputs': ['b.txt'], 'outputs': ['a.txt']},
+        'B': {'script': 'Stage.py', 'inputs': ['a.txt'], 'outputs': ['b.txt']},
+    })
+    with pytest.raises(RuntimeError):
+        Pipeline.run_pipeline()
+
+def test_up_to_date_chain_is_skipped(scratch_stage, monkeypatch):
+    # Stages sorted before their upstream stage are settled on a later pass
+    (scratch_stage / 'Copy.py').write_text("open('copy.txt', 'w').write(open('out.txt').read())\n")
+    monkeypatch.setattr(Pipeline, 'stages', {
+        'A': {'script': 'Copy.py', 'inputs': ['out.txt'], 'outputs': ['copy.txt']},
+        'Z': {'script': 'Stage.py', 'inputs': [], 'outputs': ['out.txt']},
+    })
+    assert sorted(Pipeline.run_pipeline()['run']) == ['A', 'Z']
+    assert sorted(Pipeline.run_pipeline()['skipped']) == ['A', 'Z']
+
+def test_pattern_inputs_and_unwritten_outputs(scratch_stage, monkeypatch):
+    # Writes runs/out.npy only when runs/ has inputs, and never writes skipped.txt
+    (scratch_stage / 'runs').mkdir()
+    (scratch_stage / 'Runs.py').write_text("import glob, sys\nif glob.glob('runs/in*.npy'):\n"
+                                           "    open('runs/out.npy', 'w').write(sys.argv[1])\n")
+    monkeypatch.setattr(Pipeline, 'stages', {'Runs': {'script': 'Runs.py', 'args': ['x'], 'inputs': ['runs/*.npy'],
+                                                      'outputs': ['runs/out.npy', 'skipped.txt']}})
+    assert Pipeline.run_pipeline()['run'] == ['Runs']
+    assert Pipeline.run_pipeline()['skipped'] == ['Runs']
+
+    (scratch_stage / 'runs' / 'in1.npy').write_text("1")
+    assert Pipeline.run_pipeline()['run'] == ['Runs']
+    assert (scratch_stage / 'runs' / 'out.npy').read_text() == 'x'
+    # Its own output matches the pattern but does not make it outdated
+    assert Pipeline.run_pipeline()['skipped'] == ['Runs']
+    assert Pipeline.stage_dependencies({'A': {'inputs': ['runs/*.npy'], 'outputs': []},
+                                        'B': {'inputs': [], 'outputs': ['runs/b.npy']}})['A'] == ['B']
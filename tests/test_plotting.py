@@ -0,0 +1,27 @@
+import os
+import sys
+import subprocess
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+import Plotting
+
+# A fresh interpreter, so matplotlib imported by other tests does not count
+def imports_matplotlib(code, **environment):
+    env = dict(os.environ, **environment)
+    env.pop('MPLBACKEND', None)
+    process = subprocess.run([sys.executable, '-c', code + "\nimport sys\nprint('matplotlib' in sys.modules)"],
+                             cwd=root, env=env, capture_output=True, text=True, check=True)
+    return process.stdout.split()[-1] == 'True'
+
+def test_compute_only_never_imports_matplotlib():
+    code = "import SpectrumEngine, RenderFarm, Plotting\nassert RenderFarm.render_figures({'a.png': []}) == ([], [])"
+    assert not imports_matplotlib(code, BETA_COMPUTE_ONLY='1')
+    assert imports_matplotlib("import Plotting\nPlotting.pyplot()", BETA_COMPUTE_ONLY='0')
+
+def test_modes_set_from_code(monkeypatch):
+    monkeypatch.setattr(Plotting, '_modes', {'compute_only': True, 'show': True})
+    assert Plotting.compute_only() and not Plotting.show_enabled()
+    with pytest.raises(RuntimeError):
+        Plotting.pyplot()
@@ -0,0 +1,18 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from QScan import build_prefix_sums, window_Q, window_fit
+
+def test_stacked_window_Q_matches_single_spectra():
+    rng = np.random.default_rng(0)
+    x = np.linspace(0.1, 0.8, 200)
+    y = 2 - 2.6 * x + 0.01 * rng.standard_normal((3, 200))
+    start, stop = np.arange(50)[:, None], np.arange(60, 200)[None, :]
+
+    stacked = window_Q(build_prefix_sums(x, y), start, stop)
+    single = np.stack([window_Q(build_prefix_sums(x, row), start, stop) for row in y])
+    assert stacked.shape == (3, 50, 140)
+    np.testing.assert_allclose(stacked, single)
+    np.testing.assert_allclose(stacked, window_fit(build_prefix_sums(x, y), start, stop)['Q'], rtol=1e-12)
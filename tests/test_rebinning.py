@@ -0,0 +1,38 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Rebinning import rebin, channel_edges, edges_from_centers
+
+rng = np.random.default_rng(11)
+counts = rng.poisson(200, (6, 300)).astype(float)
+variances = counts.copy()
+
+def test_rebinning_conserves_counts():
+    # Every spectrum with its own gain and offset, onto an irregular grid covering all of them
+    source = channel_edges(300)[None, :] * rng.uniform(0.9, 1.1, (6, 1)) + rng.uniform(-5, 5, (6, 1))
+    target = np.concatenate(([-50], np.sort(rng.uniform(-40, 370, 120)), [400]))
+    new_counts, new_variances = rebin(counts, variances, source, target)
+    assert new_counts.shape == (6, target.size - 1)
+    np.testing.assert_allclose(new_counts.sum(axis=1), counts.sum(axis=1))
+    assert np.all(new_counts >= -1e-9)
+    # Split bins share their variance with weights f^2, so the total can only shrink
+    assert np.all(new_variances.sum(axis=1) <= variances.sum(axis=1) + 1e-9)
+
+def test_identity_merge_and_split():
+    edges = channel_edges(300)
+    same_counts, same_variances = rebin(counts, variances, edges, edges)
+    np.testing.assert_allclose(same_counts, counts, atol=1e-9)
+    np.testing.assert_allclose(same_variances, variances, atol=1e-9)
+
+    # Merging pairs of bins adds counts and variances
+    merged_counts, merged_variances = rebin(counts, variances, edges, edges[::2])
+    np.testing.assert_allclose(merged_counts, counts.reshape(6, 150, 2).sum(axis=2))
+    np.testing.assert_allclose(merged_variances, variances.reshape(6, 150, 2).sum(axis=2))
+
+    # Splitting each bin in halves gives half the counts and a quarter of the variance
+    halves = edges_from_centers(np.arange(600) / 2 - 0.25)
+    split_counts, split_variances = rebin(counts, variances, edges, halves)
+    np.testing.assert_allclose(split_counts, np.repeat(counts / 2, 2, axis=1))
+    np.testing.assert_allclose(split_variances, np.repeat(variances / 4, 2, axis=1))
@@ -0,0 +1,36 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import RenderFarm
+from RenderFarm import spectrum_spec, job_key, render_figures
+
+def test_key_follows_the_data_and_the_drawing_code(monkeypatch):
+    x = np.arange(1000.0)
+    spec = spectrum_spec(x, np.sin(x))
+    assert job_key([spec]) == job_key([spectrum_spec(x, np.sin(x))])
+    assert job_key([spec]) != job_key([spectrum_spec(x, np.cos(x))])
+    assert job_key([spec]) != job_key([spectrum_spec(x, np.sin(x), log_scale=True)])
+    assert any(path.endswith('Decimation.py') for path in RenderFarm.drawing_sources)
+    assert job_key([spec]) != job_key([spec], source_hash='other drawing code')
+
+def test_unchanged_figures_are_skipped_and_shown_figures_drawn_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(RenderFarm, 'cache_dir', str(tmp_path / 'cache'))
+    monkeypatch.setattr(RenderFarm, 'compute_only', lambda: False)
+    x = np.arange(5000.0)
+    jobs = {str(tmp_path / 'a.png'): [spectrum_spec(x, x**2)], str(tmp_path / 'b.pdf'): [spectrum_spec(x, x), spectrum_spec(x, -x)]}
+
+    rendered, skipped = render_figures(jobs, workers=1)
+    assert sorted(rendered) == sorted(jobs) and skipped == []
+    assert render_figures(jobs, workers=1) == ([], list(jobs))
+
+    # With show enabled every figure is drawn once, saved and left open for show()
+    draws = []
+    original = RenderFarm.draw_spectrum
+    monkeypatch.setattr(RenderFarm, 'show_enabled', lambda: True)
+    monkeypatch.setattr(RenderFarm, 'show', lambda: draws.append('show'))
+    monkeypatch.setattr(RenderFarm, 'draw_spectrum', lambda plt, spec: draws.append('draw') or original(plt, spec))
+    rendered, skipped = render_figures(jobs, workers=1)
+    assert draws == ['draw'] * 3 + ['show'] and len(rendered) == 2
+    RenderFarm.pyplot().close('all')
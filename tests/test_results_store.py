@@ -0,0 +1,39 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ResultsStore
+from ResultsStore import save_record, get_parameter, get_values, get_covariance, query_parameter
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(ResultsStore, 'store_root', str(tmp_path))
+    return tmp_path
+
+def test_record_round_trip(store):
+    covariance = np.array([[4.0, 1.0], [1.0, 9.0]])
+    save_record("Cesio137", 'PeakFit', {'xc': np.float64(203.6), 's': 7.5, 'bad': np.nan},
+                errors={'xc': 2.0, 's': 3.0}, covariance=covariance, covariance_parameters=['xc', 's'],
+                units={'xc': 'channel'})
+    assert get_parameter("Cesio137", 'PeakFit', 'xc') == (203.6, 2.0)
+    assert np.isnan(get_values("Cesio137", 'PeakFit')['bad'])
+    names, matrix = get_covariance("Cesio137", 'PeakFit')
+    assert names == ['xc', 's']
+    np.testing.assert_array_equal(matrix, covariance)
+    with pytest.raises(KeyError):
+        get_parameter("Cesio137", 'PeakFit', 'area')
+    with pytest.raises(FileNotFoundError):
+        get_parameter("Talio204", 'PeakFit', 'xc')
+    with pytest.raises(ValueError):
+        save_record("Cesio137", 'Other', {'a': 1, 'b': 2, 'c': 3}, covariance=covariance)
+
+def test_query_across_runs(store):
+    for run, value in [('r2', 2.0), ('r1', 1.0)]:
+        save_record("Talio204", 'QValue', {'Kurie.Q': value}, errors={'Kurie.Q': 0.1}, run=run)
+    save_record("Talio204", 'QValue', {'N(E).Q': 0.7}, run='r3')
+    runs, values, errors = query_parameter("Talio204", 'QValue', 'Kurie.Q')
+    assert runs == ['r1', 'r2', 'r3']
+    np.testing.assert_array_equal(values[:2], [1, 2])
+    assert np.isnan(values[2]) and np.isnan(errors[2])
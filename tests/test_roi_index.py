@@ -0,0 +1,30 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ROIIndex import build_roi_index, query_rois
+
+def test_rois_match_direct_masked_sums():
+    rng = np.random.default_rng(2)
+    # Each spectrum with its own energy axis
+    energy = np.sort(rng.uniform(0, 1600, (3, 500)), axis=1)
+    counts = rng.poisson(50, (3, 500)).astype(float)
+    errors = np.sqrt(counts) + 1
+    roi_min, roi_max = np.array([19, 80, 293, 1500]), np.array([39, 118, 349, 1700])
+
+    rois = query_rois(build_roi_index(energy, counts, errors), roi_min, roi_max)
+    for n in range(3):
+        for k in range(roi_min.size):
+            mask = (energy[n] >= roi_min[k]) & (energy[n] <= roi_max[k])
+            assert rois['counts'][n, k] == np.sum(counts[n][mask])
+            np.testing.assert_allclose(rois['error'][n, k], np.sqrt(np.sum(errors[n][mask]**2)))
+            np.testing.assert_allclose(rois['intensity'][n, k], np.sum(counts[n][mask]) / np.sum(counts[n]))
+
+def test_shared_axis_and_intensity_error():
+    energy = np.arange(10.0)
+    counts = np.array([[1, 2, 3, 4, 5, 6, 7, 8, 9, 10.0]])
+    rois = query_rois(build_roi_index(energy, counts), [2], [4])
+    assert rois['counts'][0, 0] == 12 and rois['total_counts'][0] == 55
+    # Binomial-like error of a fraction of Poisson counts: sqrt(A (T - A) / T^3)
+    np.testing.assert_allclose(rois['intensity_error'][0, 0], np.sqrt(12 * 43 / 55**3))
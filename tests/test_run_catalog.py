@@ -0,0 +1,31 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ResultsStore
+from ResultsStore import save_record, record_path
+from RunCatalog import register_run, query, drift, list_catalog_runs, run_settings
+
+def test_queries_follow_time_matches_and_deletions(tmp_path, monkeypatch):
+    monkeypatch.setattr(ResultsStore, 'store_root', str(tmp_path / 'Store'))
+    catalog = str(tmp_path / 'catalog.sqlite')
+    # Runs registered out of time order; run d fitted another line
+    for run, timestamp, shift in [('b', 2000.0, 0.5), ('a', 1000.0, 0.0), ('c', 3000.0, 1.0)]:
+        register_run("Cesio137", run, timestamp, {'live_time': 600, 'operator': 'x'})
+        save_record("Cesio137", 'PeakFit', {'xc': 203.0 + shift, 'Energy': 630}, errors={'xc': 0.1}, run=run)
+    register_run("Cesio137", 'd', 4000.0)
+    save_record("Cesio137", 'PeakFit', {'xc': 11.0, 'Energy': 32}, run='d')
+
+    results = query("Cesio137", 'PeakFit', 'xc', match={'Energy': 630}, file_path=catalog)
+    np.testing.assert_array_equal(results['run'], ['a', 'b', 'c'])
+    np.testing.assert_allclose(results['value'], [203, 203.5, 204])
+    assert list(query("Cesio137", 'PeakFit', 'xc', since=1500, until=2500, file_path=catalog)['run']) == ['b']
+    np.testing.assert_allclose(drift("Cesio137", 'PeakFit', 'xc', match={'Energy': 630}, file_path=catalog)['drift'],
+                               [0, 0.5, 1])
+    assert run_settings("Cesio137", 'a') == {'live_time': 600, 'operator': 'x'}
+    assert [run for run, _, _ in list_catalog_runs("Cesio137", file_path=catalog)] == ['a', 'b', 'c', 'd']
+
+    # A record deleted from the store leaves the catalog on the next query
+    os.remove(record_path("Cesio137", 'PeakFit', 'b'))
+    assert list(query("Cesio137", 'PeakFit', 'xc', file_path=catalog)['run']) == ['a', 'c', 'd']
@@ -0,0 +1,40 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SmoothBackground import snip_background, estimate_background, snip_iterations
+
+# Exponential continuum under two lines narrower than the clipping window
+channel = np.arange(1024)
+continuum = 2000 * np.exp(-channel / 300) + 200
+lines = 5000 * np.exp(-0.5 * ((channel - 300) / 4)**2) + 3000 * np.exp(-0.5 * ((channel - 600) / 5)**2)
+inner = slice(50, -50)
+
+def test_snip_recovers_the_continuum_under_the_lines():
+    background = snip_background(continuum + lines)
+    assert background.shape == channel.shape
+    np.testing.assert_allclose(background[inner], continuum[inner], rtol=2e-3)
+
+def test_snip_bias_on_poisson_spectra_is_small():
+    counts = np.random.default_rng(0).poisson(np.tile(continuum + lines, (50, 1))).astype(float)
+    background = snip_background(counts)
+    # The whole stack at once is the same as one spectrum at a time
+    np.testing.assert_allclose(background[7], snip_background(counts[7]))
+    # Clipping the fluctuations biases the estimate low, by about 5% with the default smoothing
+    ratio = background.mean(axis=0)[inner] / continuum[inner]
+    assert np.all(np.abs(ratio - 1) < 0.06)
+    assert -0.05 < np.median(ratio - 1) < 0
+
+def test_combined_background_adds_the_snip_of_the_rest():
+    measured = np.full(channel.size, 100.0)
+    counts = np.stack([continuum + lines + 2 * measured, continuum + lines + measured])
+    estimate, variance = estimate_background(counts, 'combined', measured, live_times=[2, 1], background_live_time=1)
+    np.testing.assert_allclose(estimate[:, inner], (continuum + np.stack([2 * measured, measured]))[:, inner], rtol=2e-3)
+    np.testing.assert_allclose(variance[1], measured + (estimate[1] - measured) / (2 * snip_iterations + 1))
+
+    with pytest.raises(ValueError):
+        estimate_background(counts, 'measured')
+    with pytest.raises(ValueError):
+        estimate_background(counts, 'fitted', measured)
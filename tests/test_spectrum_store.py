@@ -0,0 +1,20 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import SpectrumStore
+from SpectrumStore import save_spectrum, save_stack, list_runs, has_spectrum, load_spectrum, load_runs
+
+def test_stacked_runs_are_listed_and_loaded(tmp_path, monkeypatch):
+    monkeypatch.setattr(SpectrumStore, 'store_root', str(tmp_path))
+    single = np.arange(6.).reshape(3, 2)
+    stack = np.arange(12.).reshape(2, 3, 2) + 100
+    save_spectrum("Talio204", "channel", single, run='r0')
+    save_stack("Talio204", "channel", ['r1', 'r2'], stack)
+
+    assert list_runs("Talio204") == ['r0', 'r1', 'r2']
+    assert has_spectrum("Talio204", "channel", 'r2') and not has_spectrum("Talio204", "energy", 'r2')
+    np.testing.assert_array_equal(load_spectrum("Talio204", "channel", 'r2'), stack[1])
+    runs, data = load_runs("Talio204", "channel")
+    np.testing.assert_array_equal(data, np.concatenate((single[None], stack)))